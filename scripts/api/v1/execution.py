@@ -1,18 +1,118 @@
+import json
+
 from fastapi import APIRouter, HTTPException, status, Body
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from typing import Dict, Any, List
 
 from scripts.models.schemas import WorkflowExecuteRequest, ExecutionResult, Node, ExecuteNodeRequest
-from scripts.core.workflow_engine import execute_workflow_internal, get_executor, get_node_results, clear_node_results
-from scripts.services.giga_chat import GigaChatAPI
+from scripts.core.workflow_engine import execute_workflow_internal, get_node_results, clear_node_results, cancel_workflow_run, resume_workflow_run, remember_run_results
+from scripts.core.executor_registry import get_executor_spec, available_node_types
+from scripts.core.resource_pools import resource_pool_metrics
+from scripts.core.node_cache import clear_node_cache
+from scripts.core.execution_events import subscribe, RUN_FINISHED
+from scripts.services.run_queue import get_workflow_run
 
 router = APIRouter()
-gigachat_api = GigaChatAPI()
 dispatcher_sessions = {}
 
+# Интервал keep-alive комментариев в потоке событий, чтобы прокси не закрывали тихое соединение
+EVENTS_HEARTBEAT_SECONDS = 15
+# Статусы запуска в очереди воркера, после которых событий больше не будет
+FINISHED_RUN_STATUSES = ('completed', 'failed')
+
 @router.post("/execute-workflow")
 async def execute_workflow(request: WorkflowExecuteRequest) -> ExecutionResult:
-    return await execute_workflow_internal(request)
+    result = await execute_workflow_internal(request)
+    # Следующий запуск из редактора может передать previousRunId и changedNodeIds
+    remember_run_results(result.runId, result.result, complete=request.resultMode != 'outputs')
+    return result
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    """Возвращает статус и результат запуска из очереди."""
+    run = await get_workflow_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    return run
+
+@router.post("/executions/{run_id}/cancel")
+async def cancel_execution(run_id: str):
+    """Отменяет выполняющийся запуск workflow вместе с его суб-воркфлоу."""
+    if not cancel_workflow_run(run_id):
+        raise HTTPException(status_code=404, detail=f"Run {run_id} is not running")
+    return {"success": True, "message": f"Run {run_id} cancellation requested."}
+
+@router.post("/executions/{run_id}/resume")
+async def resume_execution(run_id: str) -> ExecutionResult:
+    """Продолжает запуск (выполненный с checkpoint=true) с последней завершенной ноды."""
+    try:
+        return await resume_workflow_run(run_id)
+    except Exception as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+async def _get_queued_run(run_id: str):
+    """Запись запуска в очереди воркера; None для запусков из редактора или без БД."""
+    try:
+        return await get_workflow_run(run_id)
+    except Exception:
+        return None
+
+def _queued_run_finished_event(run: Dict[str, Any]) -> Dict[str, Any]:
+    finished_at = run.get('finished_at') or datetime.now()
+    return {"type": RUN_FINISHED, "runId": str(run['id']), "timestamp": finished_at.isoformat(), "success": run['status'] == 'completed', "error": run.get('error')}
+
+@router.get("/executions/{run_id}/events")
+async def stream_execution_events(run_id: str):
+    """
+    Поток событий запуска (SSE): частичный текст нод с stream=true (node_delta), логи нод (node_log)
+    и завершение (run_finished). Можно подключиться до запуска, передав тот же runId в execute-workflow;
+    если запуск так и не начался, поток завершается событием run_not_found.
+    События запусков из очереди (вебхуки, таймеры) приходят от engine_worker через LISTEN/NOTIFY;
+    такой запуск ожидается, пока стоит в очереди, а его итог берется и из очереди.
+    """
+    queued_run = await _get_queued_run(run_id)
+
+    def format_event(event: Dict[str, Any]) -> str:
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+    async def event_source():
+        run = queued_run
+        if run and run['status'] in FINISHED_RUN_STATUSES:
+            yield format_event(_queued_run_finished_event(run))
+            return
+        async for event in subscribe(run_id, heartbeat=EVENTS_HEARTBEAT_SECONDS, wait_for_start=run is not None):
+            if event is None:
+                if run is not None:
+                    # Итог проверяется и по очереди: уведомление могло потеряться (разрыв соединения слушателя)
+                    run = await _get_queued_run(run_id) or run
+                    if run['status'] in FINISHED_RUN_STATUSES:
+                        yield format_event(_queued_run_finished_event(run))
+                        return
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/node-types")
+async def get_node_types():
+    """Типы нод, которые может выполнить движок (встроенные и подключенные плагинами)."""
+    return {"nodeTypes": available_node_types()}
+
+@router.get("/metrics/resource-pools")
+async def get_resource_pool_metrics():
+    """Загрузка пулов ресурсов нод: занятые слоты, глубина очереди и время ожидания."""
+    return {"pools": resource_pool_metrics()}
+
+@router.delete("/node-cache")
+async def delete_node_cache():
+    """Сбрасывает кэш результатов нод (cacheResults), например после изменения внешних данных."""
+    try:
+        cleared = await clear_node_cache()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to clear node cache: {e}")
+    return {"success": True, "cleared": cleared}
 
 @router.post("/node-status")
 async def get_node_status(node_ids: List[str]):
@@ -35,17 +135,11 @@ async def execute_node(request: ExecuteNodeRequest) -> ExecutionResult:
             data=node_data.get('data', {})
         )
 
-        executor = get_executor(node_type)
+        executor = get_executor_spec(node_type)
         if not executor:
-            raise HTTPException(status_code=400, detail=f"Unknown node type: {node_type}")
-
-        # Pass dependencies to executors that need them
-        if node.type == 'gigachat':
-            result = await executor(node, {}, input_data or {}, gigachat_api, {})
-        elif node.type == 'dispatcher':
-            result = await executor(node, {}, input_data or {}, gigachat_api, {})
-        else:
-            result = await executor(node, {}, input_data or {}, {})
+            raise HTTPException(status_code=400, detail=f"Unknown node type: {node_type}. Available: {', '.join(available_node_types())}")
+
+        result = await executor.invoke(node=node, label_to_id_map={}, input_data=input_data or {}, all_results={})
         
         return ExecutionResult(
             success=True,
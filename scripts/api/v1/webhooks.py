@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Request, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Request, HTTPException, status
 from typing import Dict, Any, List
 import uuid
 from datetime import datetime
 
 from scripts.services.storage import get_all_workflows, get_workflow_by_id
-from scripts.core.workflow_engine import execute_workflow_internal
-from scripts.models.schemas import WorkflowExecuteRequest, WebhookCreateRequest, WebhookInfo
+from scripts.services.run_queue import enqueue_workflow_run
+from scripts.models.schemas import WebhookCreateRequest, WebhookInfo
 
 router = APIRouter()
 
@@ -35,7 +35,7 @@ async def create_webhook(request: WebhookCreateRequest, http_request: Request):
 import json
 
 @router.post("/webhooks/{webhook_id}", status_code=status.HTTP_202_ACCEPTED)
-async def trigger_webhook(webhook_id: str, request: Request, background_tasks: BackgroundTasks):
+async def trigger_webhook(webhook_id: str, request: Request):
     """
     Принимает входящие вебхуки, находит соответствующий воркфлоу и запускает его.
     """
@@ -91,16 +91,7 @@ async def trigger_webhook(webhook_id: str, request: Request, background_tasks: B
         "query_params": query_params
     }
 
-    # Десериализуем данные перед передачей в движок
-    nodes = json.loads(workflow_to_execute.get('nodes', '[]'))
-    connections = json.loads(workflow_to_execute.get('connections', '[]'))
+    # API только ставит запуск в очередь, выполняют его воркеры (scripts/engine_worker.py)
+    run_id = await enqueue_workflow_run(target_workflow_id, initial_input_data, start_node_id=target_node_id)
 
-    execution_request = WorkflowExecuteRequest(
-        nodes=nodes,
-        connections=connections,
-        startNodeId=target_node_id
-    )
-
-    background_tasks.add_task(execute_workflow_internal, execution_request, initial_input_data)
-
-    return {"status": "success", "message": f"Workflow {target_workflow_id} triggered."}
+    return {"status": "success", "message": f"Workflow {target_workflow_id} triggered.", "run_id": run_id}
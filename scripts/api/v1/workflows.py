@@ -10,6 +10,7 @@ from scripts.services.storage import (
     add_workflow,
     delete_workflow_by_id,
 )
+from scripts.core.execution_plan import ExecutionPlan, invalidate_workflow_plan
 
 router = APIRouter()
 
@@ -53,7 +54,9 @@ async def create_workflow(request: WorkflowSaveRequest):
         "status": "draft"
     }
     await add_workflow(workflow_id, workflow_data)
-    return {"success": True, "workflow_id": workflow_id, "name": request.name}
+    # Ошибки в шаблонах видны при сохранении, а не только во время выполнения
+    warnings = ExecutionPlan(request.nodes, request.connections).template_warnings()
+    return {"success": True, "workflow_id": workflow_id, "name": request.name, "warnings": warnings}
 
 
 @router.post("/workflows/{workflow_id}/publish", status_code=status.HTTP_200_OK)
@@ -114,7 +117,8 @@ async def update_workflow(workflow_id: str, request: WorkflowUpdateRequest):
     }
 
     await add_workflow(workflow_id, workflow_data)
-    return {"success": True, "message": f"Workflow '{workflow_id}' updated successfully."}
+    warnings = ExecutionPlan(request.nodes, request.connections).template_warnings()
+    return {"success": True, "message": f"Workflow '{workflow_id}' updated successfully.", "warnings": warnings}
 
 @router.delete("/workflows/{workflow_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_workflow(workflow_id: str):
@@ -122,4 +126,5 @@ async def delete_workflow(workflow_id: str):
     if not await get_workflow_by_id(workflow_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Workflow not found")
     
-    await delete_workflow_by_id(workflow_id)
\ No newline at end of file
+    await delete_workflow_by_id(workflow_id)
+    invalidate_workflow_plan(workflow_id)
\ No newline at end of file
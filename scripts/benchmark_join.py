@@ -0,0 +1,71 @@
+import copy
+import time
+
+from scripts.core.node_executors.join import _find_common_data
+
+# Запуск из корня репозитория: python -m scripts.benchmark_join
+
+# Количество поисков общих данных на каждый сценарий
+ITERATIONS = 20
+# Строк в каждом входе Join
+ROWS = 50000
+# Допустимое замедление относительно прежнего поиска (погрешность измерения)
+MAX_SLOWDOWN = 1.5
+
+ROWS_DATA = [{"id": i, "text": f"Строка {i}", "tags": ["a", "b"]} for i in range(ROWS)]
+SHARED_INPUT = {"rows": ROWS_DATA, "status": "ok", "output": {"text": "первая ветка"}}
+
+
+def _differ_early() -> dict:
+    rows = copy.deepcopy(ROWS_DATA)
+    rows[0] = {"id": -1, "text": "другая строка", "tags": []}
+    return {"rows": rows, "status": "ok", "output": {"text": "вторая ветка"}}
+
+
+SCENARIOS = {
+    "общие по ссылке": [SHARED_INPUT, {**SHARED_INPUT, "output": {"text": "вторая ветка"}}],
+    "равные копии": [SHARED_INPUT, {**copy.deepcopy(SHARED_INPUT), "output": {"text": "вторая ветка"}}],
+    "различие в начале": [SHARED_INPUT, _differ_early()],
+}
+
+
+def legacy_find_common_data(inputs):
+    """Поиск общих данных до [user-020] (для сравнения)."""
+    first_input, other_inputs = inputs[0], inputs[1:]
+    common_data = {}
+    for key, value in first_input.items():
+        if all(key in other and other[key] == value for other in other_inputs):
+            common_data[key] = value
+    return common_data
+
+
+def measure(find, inputs) -> float:
+    """Возвращает среднее время одного поиска в миллисекундах."""
+    start_time = time.perf_counter()
+    for _ in range(ITERATIONS):
+        find(inputs)
+    return (time.perf_counter() - start_time) / ITERATIONS * 1000
+
+
+def run_benchmark():
+    """Сравнивает поиск общих данных Join с прежней реализацией и падает при регрессии."""
+    print(f"🚀 Бенчмарк Join: {ROWS} строк во входе, {ITERATIONS} поисков на сценарий")
+    print("-" * 70)
+    print(f"{'Сценарий':<20} {'до, мс':>12} {'после, мс':>12} {'ускорение':>12}")
+    for name, inputs in SCENARIOS.items():
+        expected = legacy_find_common_data(inputs)
+        actual = _find_common_data(inputs)
+        if list(expected) != list(actual):
+            raise Exception(f"Общие данные расходятся для сценария '{name}'")
+
+        before = measure(legacy_find_common_data, inputs)
+        after = measure(_find_common_data, inputs)
+        print(f"{name:<20} {before:>12.3f} {after:>12.3f} {before / after if after else float('inf'):>11.1f}x")
+        # Сценарии за доли миллисекунды не проверяются: там шум больше измерения
+        if after > before * MAX_SLOWDOWN and after - before > 0.5:
+            raise Exception(f"Поиск общих данных медленнее прежнего в сценарии '{name}': {after:.3f} мс против {before:.3f} мс")
+    print("-" * 70)
+
+
+if __name__ == "__main__":
+    run_benchmark()
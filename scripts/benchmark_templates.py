@@ -0,0 +1,185 @@
+import json
+import logging
+import re
+import time
+
+from scripts.utils.template_engine import replace_templates, render_structured, render_structured_batch, UnresolvedPlaceholderError
+
+# Запуск из корня репозитория: python -m scripts.benchmark_templates
+
+# Количество рендеров на каждый сценарий
+ITERATIONS = 2000
+
+LABEL_TO_ID_MAP = {"GigaChat": "node-1", "Webhook": "node-2"}
+ALL_RESULTS = {
+    "node-1": {"output": {"text": "Ответ модели " * 20, "tokens": 123}},
+    "node-2": {"json": {"result": [{"text": "первый"}, {"text": "второй"}], "status": "ok"}},
+}
+INPUT_DATA = {"item": {"id": 42, "name": "Товар"}, "output": {"text": "входной текст"}}
+
+SCENARIOS = {
+    "без шаблонов": "Ты - полезный ассистент. Отвечай кратко и по делу.",
+    "один шаблон": "Вопрос пользователя: {{input.output.text}}",
+    "промпт GigaChat": "Контекст: {{GigaChat.output.text}}\nСтатус: {{Webhook.json.status}}\nПервый: {{Webhook.json.result[0].text}}",
+    "тело запроса": '{"id": {{input.item.id}}, "name": "{{input.item.name}}", "items": {{Webhook.json.result}}}',
+}
+
+
+def legacy_replace_templates(template_str, input_data, label_to_id_map, all_results):
+    """Реализация replace_templates до компиляции шаблонов (для сравнения)."""
+    logger = logging.getLogger("legacy_template_engine")
+
+    def get_nested_value(obj, path):
+        if not path:
+            return obj
+        keys = [key for key in re.split(r'[.\[\]]', path) if key]
+        current = obj
+        for key in keys:
+            if isinstance(current, dict) and key in current:
+                current = current[key]
+            elif isinstance(current, list) and key.isdigit():
+                index = int(key)
+                if 0 <= index < len(current):
+                    current = current[index]
+                else:
+                    return None
+            else:
+                return None
+        return current
+
+    pattern = r"\{\{\s*(.+?)\s*\}\}"
+
+    def replacer(match):
+        path = match.group(1).strip()
+        parts = path.split('.', 1)
+        node_identifier = parts[0]
+        remaining_path = parts[1] if len(parts) > 1 else ''
+        if node_identifier == 'input':
+            data_source = input_data
+        else:
+            node_id = label_to_id_map.get(node_identifier, node_identifier)
+            if node_id in all_results:
+                data_source = all_results[node_id]
+            else:
+                logger.warning(f"⚠️ Шаблон: нода с лейблом или ID '{node_identifier}' (resolved to '{node_id}') не найдена в результатах.")
+                return f"{{{{ERROR: Node '{node_identifier}' not found}}}}"
+        value = get_nested_value(data_source, remaining_path)
+        if value is None:
+            logger.warning(f"⚠️ Шаблон: путь '{path}' не найден. Замена на пустую строку.")
+            return ""
+        if isinstance(value, (dict, list)):
+            final_str = json.dumps(value, ensure_ascii=False)
+        else:
+            final_str = str(value)
+        logger.info(f"🔄 Замена шаблона: {{{{{match.group(1)}}}}} -> {final_str[:200]}...")
+        return final_str
+
+    return re.sub(pattern, replacer, template_str)
+
+
+# JSON-шаблоны: раньше рендер в строку и json.loads, теперь render_structured
+STRUCTURED_SCENARIOS = {
+    "тело запроса": '{"id": {{input.item.id}}, "name": "{{input.item.name}}", "items": {{Webhook.json.result}}}',
+    "большой payload": '{"documents": {{Bulk.json}}, "source": "{{Webhook.json.status}}"}',
+    "тело-массив": '[{"id": {{input.item.id}}}, {{Webhook.json.result}}, "{{input.item.name}}"]',
+}
+ALL_RESULTS["node-3"] = {"json": [{"id": i, "text": f"Документ {i} " * 10, "tags": ["a", "b"]} for i in range(500)]}
+LABEL_TO_ID_MAP["Bulk"] = "node-3"
+
+
+# Пакетный рендер: один шаблон на 10000 элементов цикла
+BATCH_TEMPLATE = '{"id": {{input.item.id}}, "url": "/items/{{input.item.id}}", "status": "{{Webhook.json.status}}", "context": {{GigaChat.output}}}'
+BATCH_CONTEXTS = [{"item": {"id": i, "name": f"Товар {i}"}, "loop_index": i} for i in range(10000)]
+
+
+# Неразрешенные подстановки без кавычек: ошибка, как у строкового рендера (невалидный JSON), а не null
+UNRESOLVED_TEMPLATES = {
+    "нода не найдена": '{"x": {{Missing.json}}}',
+    "путь не найден": '{"x": {{Webhook.json.missing}}}',
+}
+
+
+def check_unresolved_placeholders():
+    """Проверяет, что неразрешенная подстановка не превращается в null."""
+    for name, template in UNRESOLVED_TEMPLATES.items():
+        try:
+            rendered = render_structured(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS)
+        except UnresolvedPlaceholderError:
+            pass
+        else:
+            raise Exception(f"Неразрешенная подстановка отрендерена в {rendered!r} для сценария '{name}'")
+        try:
+            render_structured_batch(template, [INPUT_DATA], LABEL_TO_ID_MAP, ALL_RESULTS)
+        except UnresolvedPlaceholderError:
+            pass
+        else:
+            raise Exception(f"Неразрешенная подстановка отрендерена пакетно для сценария '{name}'")
+        try:
+            json.loads(replace_templates(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS))
+        except json.JSONDecodeError:
+            pass
+        else:
+            raise Exception(f"Строковый рендер дал валидный JSON для сценария '{name}'")
+
+
+def legacy_render_json(template_str, input_data, label_to_id_map, all_results):
+    return json.loads(legacy_replace_templates(template_str, input_data, label_to_id_map, all_results))
+
+
+def measure(render, template: str) -> float:
+    """Возвращает среднее время одного рендера в микросекундах."""
+    start_time = time.perf_counter()
+    for _ in range(ITERATIONS):
+        render(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS)
+    return (time.perf_counter() - start_time) / ITERATIONS * 1_000_000
+
+
+def run_benchmark():
+    """Сравнивает стоимость рендера шаблона до и после компиляции."""
+    # Логи замен отключены в обоих вариантах, чтобы сравнивать только сам рендер
+    logging.basicConfig(level=logging.WARNING)
+    check_unresolved_placeholders()
+
+    print(f"🚀 Бенчмарк шаблонов: {ITERATIONS} рендеров на сценарий")
+    print("-" * 70)
+    print(f"{'Сценарий':<20} {'до, мкс':>12} {'после, мкс':>12} {'ускорение':>12}")
+    for name, template in SCENARIOS.items():
+        expected = legacy_replace_templates(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS)
+        actual = replace_templates(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS)
+        if expected != actual:
+            raise Exception(f"Результаты рендера расходятся для сценария '{name}'")
+
+        before = measure(legacy_replace_templates, template)
+        after = measure(replace_templates, template)
+        print(f"{name:<20} {before:>12.2f} {after:>12.2f} {before / after:>11.1f}x")
+    print("-" * 70)
+
+    print("JSON-шаблоны: строка + json.loads -> render_structured")
+    for name, template in STRUCTURED_SCENARIOS.items():
+        expected = legacy_render_json(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS)
+        actual = render_structured(template, INPUT_DATA, LABEL_TO_ID_MAP, ALL_RESULTS)
+        if expected != actual:
+            raise Exception(f"Результаты рендера расходятся для сценария '{name}'")
+
+        before = measure(legacy_render_json, template)
+        after = measure(render_structured, template)
+        print(f"{name:<20} {before:>12.2f} {after:>12.2f} {before / after:>11.1f}x")
+    print("-" * 70)
+
+    print(f"Пакетный рендер: {len(BATCH_CONTEXTS)} элементов, мс на весь пакет")
+    rendered_by_method = {}
+    for name, render_all in (
+        ("строка + json.loads", lambda: [legacy_render_json(BATCH_TEMPLATE, c, LABEL_TO_ID_MAP, ALL_RESULTS) for c in BATCH_CONTEXTS]),
+        ("render_structured", lambda: [render_structured(BATCH_TEMPLATE, c, LABEL_TO_ID_MAP, ALL_RESULTS) for c in BATCH_CONTEXTS]),
+        ("render_structured_batch", lambda: render_structured_batch(BATCH_TEMPLATE, BATCH_CONTEXTS, LABEL_TO_ID_MAP, ALL_RESULTS)),
+    ):
+        start_time = time.perf_counter()
+        rendered_by_method[name] = render_all()
+        print(f"{name:<26} {(time.perf_counter() - start_time) * 1000:>10.1f}")
+    if len({json.dumps(rendered, sort_keys=True) for rendered in rendered_by_method.values()}) != 1:
+        raise Exception("Результаты пакетного рендера расходятся")
+    print("-" * 70)
+
+
+if __name__ == "__main__":
+    run_benchmark()
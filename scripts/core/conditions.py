@@ -0,0 +1,169 @@
+import logging
+import re
+from typing import Dict, Any, Optional, Tuple, Union
+
+from scripts.models.schemas import Node
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_CONDITIONS = {'greater', 'greater_equal', 'less', 'less_equal'}
+
+
+class ValueAccessor:
+    """
+    Заранее разобранный fieldPath: 'Node Label.output.text' или 'output.text'.
+    Лейбл ноды переводится в ID один раз при компиляции workflow.
+    """
+    __slots__ = ('field_path', 'node_id', 'node_keys', 'input_keys')
+
+    def __init__(self, field_path: str, label_to_id_map: Dict[str, str]):
+        self.field_path = field_path
+        parts = field_path.split('.')
+        self.node_id = label_to_id_map.get(parts[0])
+        self.node_keys = tuple(parts[1:])
+        self.input_keys = tuple(parts)
+
+    def get(self, input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Any:
+        # Сначала ищем ноду в глобальных результатах, иначе путь читается из входных данных
+        if self.node_id and self.node_id in all_results:
+            return _get_by_keys(all_results[self.node_id], self.node_keys)
+        return _get_by_keys(input_data, self.input_keys)
+
+
+def _get_by_keys(current: Any, keys: Tuple[str, ...]) -> Any:
+    for key in keys:
+        if isinstance(current, dict) and key in current:
+            current = current[key]
+        elif isinstance(current, list) and key.isdigit():
+            index = int(key)
+            if 0 <= index < len(current):
+                current = current[index]
+            else:
+                return None
+        else:
+            return None
+    return current
+
+
+class CompiledCondition:
+    """Условие If/Else: путь, приведенное значение для сравнения и скомпилированный regex."""
+
+    def __init__(self, config: Dict[str, Any], label_to_id_map: Dict[str, str]):
+        self.condition_type = config.get('conditionType', 'equals')
+        self.field_path = config.get('fieldPath', 'output.text')
+        self.compare_value = config.get('compareValue', '')
+        self.case_sensitive = config.get('caseSensitive', False)
+        self.accessor = ValueAccessor(self.field_path, label_to_id_map)
+
+        self.compare_str = str(self.compare_value)
+        if not self.case_sensitive:
+            self.compare_str = self.compare_str.lower()
+
+        self.compare_number = 0.0
+        self.compare_number_valid = False
+        if self.condition_type in NUMERIC_CONDITIONS:
+            try:
+                self.compare_number = float(self.compare_value)
+                self.compare_number_valid = True
+            except (ValueError, TypeError):
+                pass
+
+        self.regex = None
+        if self.condition_type == 'regex':
+            try:
+                self.regex = re.compile(self.compare_value)
+            except re.error:
+                logger.warning(f"⚠️ Некорректное регулярное выражение в условии: {self.compare_value}")
+
+    @property
+    def description(self) -> str:
+        return f"{self.field_path} {self.condition_type} {self.compare_value}"
+
+    def evaluate(self, input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Возвращает (результат проверки, фактическое значение)."""
+        condition_type = self.condition_type
+        actual_value = self.accessor.get(input_data, all_results)
+
+        if actual_value is None and condition_type not in ['exists', 'is_empty']:
+            logger.warning(f"⚠️ Поле {self.field_path} не найдено в данных")
+            actual_value = ""
+
+        if condition_type in NUMERIC_CONDITIONS:
+            try:
+                actual_number = float(actual_value)
+                compare_number = self.compare_number
+                if not self.compare_number_valid:
+                    raise ValueError
+            except (ValueError, TypeError):
+                actual_number = compare_number = 0
+            if condition_type == 'greater':
+                return actual_number > compare_number, actual_value
+            if condition_type == 'greater_equal':
+                return actual_number >= compare_number, actual_value
+            if condition_type == 'less':
+                return actual_number < compare_number, actual_value
+            return actual_number <= compare_number, actual_value
+
+        actual_str = str(actual_value) if actual_value is not None else ""
+        if not self.case_sensitive:
+            actual_str = actual_str.lower()
+
+        if condition_type == 'equals':
+            result = actual_str == self.compare_str
+        elif condition_type == 'not_equals':
+            result = actual_str != self.compare_str
+        elif condition_type == 'contains':
+            result = self.compare_str in actual_str
+        elif condition_type == 'not_contains':
+            result = self.compare_str not in actual_str
+        elif condition_type == 'regex':
+            result = bool(self.regex.search(str(actual_value))) if self.regex else False
+        elif condition_type == 'exists':
+            result = actual_value is not None
+        elif condition_type == 'is_empty':
+            result = actual_value is None or str(actual_value).strip() == ""
+        elif condition_type == 'is_not_empty':
+            result = actual_value is not None and str(actual_value).strip() != ""
+        else:
+            result = False
+        return result, actual_value
+
+
+class CompiledSwitch:
+    """
+    Маршрутизация Switch: значение по fieldPath ищется в хэш-таблице кейсов.
+    cases - список значений (метка выхода = значение) или словарь значение -> метка выхода.
+    """
+
+    def __init__(self, config: Dict[str, Any], label_to_id_map: Dict[str, str]):
+        self.field_path = config.get('fieldPath', 'output.text')
+        self.case_sensitive = config.get('caseSensitive', False)
+        self.default_branch = config.get('defaultBranch') or 'default'
+        self.accessor = ValueAccessor(self.field_path, label_to_id_map)
+
+        cases = config.get('cases') or {}
+        if isinstance(cases, list):
+            cases = {str(case): str(case) for case in cases}
+        self.routes: Dict[str, str] = {self._normalize(value): str(branch) for value, branch in cases.items()}
+
+    def _normalize(self, value: Any) -> str:
+        value_str = str(value).strip() if value is not None else ""
+        return value_str if self.case_sensitive else value_str.lower()
+
+    def route(self, input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Tuple[str, Any, bool]:
+        """Возвращает (метка выхода, фактическое значение, найден ли кейс)."""
+        actual_value = self.accessor.get(input_data, all_results)
+        branch = self.routes.get(self._normalize(actual_value))
+        if branch is None:
+            return self.default_branch, actual_value, False
+        return branch, actual_value, True
+
+
+def compile_condition(node: Node, label_to_id_map: Dict[str, str]) -> Optional[Union[CompiledCondition, CompiledSwitch]]:
+    """Компилирует условие ветвящейся ноды (if_else, switch); для остальных нод - None."""
+    config = node.data.get('config', {})
+    if node.type == 'if_else':
+        return CompiledCondition(config, label_to_id_map)
+    if node.type == 'switch':
+        return CompiledSwitch(config, label_to_id_map)
+    return None
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+from collections import deque, OrderedDict
+from contextvars import ContextVar, Token
+from datetime import datetime
+from typing import Dict, Any, AsyncIterator, Callable, Deque, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Поток событий запуска (частичный текст нод, логи нод, завершение) для подписчиков по SSE.
+# События копятся только у выполняющихся верхних запусков; суб-воркфлоу пишут в поток родителя.
+# Подписчик, подключившийся позже начала запуска, сначала получает последние EXECUTION_EVENTS_HISTORY событий.
+# События запусков из других процессов (engine_worker) приходят через services.event_relay (deliver_remote_event).
+EXECUTION_EVENTS_HISTORY = int(os.getenv("EXECUTION_EVENTS_HISTORY", "500"))
+EXECUTION_EVENTS_QUEUE_SIZE = int(os.getenv("EXECUTION_EVENTS_QUEUE_SIZE", "1000"))
+# Сколько завершенных запусков помнить, чтобы поздний подписчик сразу получил run_finished
+EXECUTION_EVENTS_FINISHED_LIMIT = int(os.getenv("EXECUTION_EVENTS_FINISHED_LIMIT", "1000"))
+# Сколько секунд подписчик ждет старта неизвестного запуска, прежде чем поток завершится run_not_found
+EXECUTION_EVENTS_START_TIMEOUT = float(os.getenv("EXECUTION_EVENTS_START_TIMEOUT", "30"))
+
+# run_id верхнего запуска; задачи нод и суб-воркфлоу наследуют его через контекст
+current_run_id: ContextVar[Optional[str]] = ContextVar('execution_events_run_id', default=None)
+
+RUN_FINISHED = 'run_finished'
+RUN_NOT_FOUND = 'run_not_found'
+
+
+class _RunChannel:
+    __slots__ = ('history', 'subscribers', 'active', 'dropped')
+
+    def __init__(self):
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=EXECUTION_EVENTS_HISTORY)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.active = False
+        self.dropped = 0
+
+
+_channels: Dict[str, _RunChannel] = {}
+# Итоговые события недавно завершенных запусков: run_id -> run_finished
+_finished: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Отправка событий в другие процессы; задается services.event_relay
+_relay: Optional[Callable[[Dict[str, Any]], None]] = None
+
+
+def set_event_relay(relay: Optional[Callable[[Dict[str, Any]], None]]):
+    """Задает функцию, получающую каждое опубликованное событие для пересылки в другие процессы."""
+    global _relay
+    _relay = relay
+
+
+def open_run(run_id: str) -> Optional[Token]:
+    """
+    Открывает поток событий запуска, если это верхний запуск (в контексте еще нет run_id).
+    Возвращает токен для close_run; для суб-воркфлоу - None.
+    """
+    if current_run_id.get() is not None:
+        return None
+    # Повторный запуск с тем же run_id (возобновление из чекпоинта) начинает поток заново
+    _finished.pop(run_id, None)
+    channel = _channels.setdefault(run_id, _RunChannel())
+    channel.active = True
+    return current_run_id.set(run_id)
+
+
+def close_run(token: Optional[Token], **data):
+    """Публикует завершение запуска и закрывает его поток."""
+    if token is None:
+        return
+    run_id = current_run_id.get()
+    publish_event(RUN_FINISHED, **data)
+    current_run_id.reset(token)
+    _finish_channel(run_id, _channels.pop(run_id, None))
+
+
+def _finish_channel(run_id: str, channel: Optional[_RunChannel]):
+    if channel and channel.history and channel.history[-1]["type"] == RUN_FINISHED:
+        _finished[run_id] = channel.history[-1]
+        while len(_finished) > EXECUTION_EVENTS_FINISHED_LIMIT:
+            _finished.popitem(last=False)
+    if channel and channel.dropped:
+        logger.warning(f"⚠️ Поток событий запуска {run_id}: медленным подписчикам не доставлено событий: {channel.dropped}")
+
+
+def publish_event(event_type: str, **data):
+    """Публикует событие в поток текущего запуска; вне запуска ничего не делает."""
+    run_id = current_run_id.get()
+    channel = _channels.get(run_id) if run_id else None
+    if channel is None or not channel.active:
+        return
+    event = {"type": event_type, "runId": run_id, "timestamp": datetime.now().isoformat(), **data}
+    _deliver(channel, event)
+    if _relay is not None:
+        _relay(event)
+
+
+def deliver_remote_event(event: Dict[str, Any]):
+    """Доставляет локальным подписчикам событие запуска, выполняющегося в другом процессе."""
+    run_id = event.get("runId")
+    if not run_id:
+        return
+    if run_id in _finished:
+        if event["type"] == RUN_FINISHED:
+            return
+        # Запуск возобновлен (например, другим воркером после истечения аренды) - поток начинается заново
+        del _finished[run_id]
+    channel = _channels.setdefault(run_id, _RunChannel())
+    channel.active = True
+    _deliver(channel, event)
+    if event["type"] == RUN_FINISHED:
+        if _channels.get(run_id) is channel:
+            del _channels[run_id]
+        _finish_channel(run_id, channel)
+
+
+def _deliver(channel: _RunChannel, event: Dict[str, Any]):
+    channel.history.append(event)
+    for queue in channel.subscribers:
+        if queue.full():
+            # Медленный подписчик теряет самое старое событие, а не новое: run_finished доходит всегда
+            queue.get_nowait()
+            channel.dropped += 1
+        queue.put_nowait(event)
+
+
+async def subscribe(run_id: str, heartbeat: Optional[float] = None, wait_for_start: bool = False) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    События запуска до run_finished. Подписаться можно и до старта запуска (с заранее заданным runId).
+    При heartbeat без событий дольше heartbeat секунд отдается None (для keep-alive соединения).
+    Завершенный запуск сразу отдает run_finished; запуск, не начавшийся за EXECUTION_EVENTS_START_TIMEOUT, - run_not_found.
+    С wait_for_start (запуск ждет в очереди воркера) старт ожидается без ограничения.
+    """
+    if run_id in _finished:
+        yield _finished[run_id]
+        return
+    channel = _channels.setdefault(run_id, _RunChannel())
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EXECUTION_EVENTS_QUEUE_SIZE)
+    # Без await между копированием истории и подпиской событие не может потеряться или задвоиться
+    backlog = list(channel.history)
+    channel.subscribers.add(queue)
+    try:
+        for event in backlog:
+            yield event
+            if event["type"] == RUN_FINISHED:
+                return
+        loop = asyncio.get_running_loop()
+        subscribed_at = loop.time()
+        while True:
+            timeout = heartbeat
+            if not channel.active and not wait_for_start:
+                start_wait = max(0.0, subscribed_at + EXECUTION_EVENTS_START_TIMEOUT - loop.time())
+                timeout = min(timeout, start_wait) if timeout else start_wait
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout) if timeout is not None else await queue.get()
+            except asyncio.TimeoutError:
+                if not channel.active and not wait_for_start and run_id not in _finished and loop.time() - subscribed_at >= EXECUTION_EVENTS_START_TIMEOUT:
+                    yield {"type": RUN_NOT_FOUND, "runId": run_id, "timestamp": datetime.now().isoformat()}
+                    return
+                yield None
+                continue
+            yield event
+            if event["type"] == RUN_FINISHED:
+                return
+    finally:
+        channel.subscribers.discard(queue)
+        if not channel.active and not channel.subscribers and _channels.get(run_id) is channel:
+            del _channels[run_id]
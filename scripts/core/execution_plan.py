@@ -0,0 +1,254 @@
+import json
+import logging
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple, Set, Iterable
+
+from scripts.models.schemas import Node, Connection, WorkflowExecuteRequest
+from scripts.utils.template_engine import find_template_references
+from scripts.core.conditions import compile_condition
+
+logger = logging.getLogger(__name__)
+
+# Типы нод, исходящие связи которых помечены метками веток ('true', 'false', 'true:goto', ...)
+BRANCHING_NODE_TYPES = {'if_else', 'switch'}
+
+DEFAULT_MAX_GOTO_ITERATIONS = 10
+
+
+def _collect_template_references(value: Any, references: List[str]):
+    """Собирает ссылки шаблонов из всех строковых значений конфига."""
+    if isinstance(value, str):
+        references.extend(find_template_references(value))
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_template_references(item, references)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_template_references(item, references)
+
+
+class PlanEdge(NamedTuple):
+    """Исходящая связь с заранее разобранными метаданными ветки и GOTO."""
+    source: str
+    target: str
+    branch: str
+    is_goto: bool
+    goto_key: str
+
+
+class ExecutionPlan:
+    """
+    Скомпилированное представление workflow.
+    Строится один раз на версию workflow и переиспользуется всеми запусками:
+    индексы входящих/исходящих связей, разобранные метки веток, стартовые ноды
+    и карта label -> id.
+    """
+
+    def __init__(self, nodes: List[Any], connections: List[Any]):
+        self.node_list: List[Node] = [n if isinstance(n, Node) else Node(**n) for n in nodes]
+        self.connections: List[Connection] = [c if isinstance(c, Connection) else Connection(**c) for c in connections]
+
+        self.nodes: Dict[str, Node] = {node.id: node for node in self.node_list}
+        self.label_to_id_map: Dict[str, str] = {node.data.get('label', node.id): node.id for node in self.node_list}
+
+        self.outgoing: Dict[str, List[PlanEdge]] = {node_id: [] for node_id in self.nodes}
+        self.incoming: Dict[str, List[str]] = {node_id: [] for node_id in self.nodes}
+
+        for conn in self.connections:
+            source_node = self.nodes.get(conn.source)
+            conn_label = (conn.data or {}).get('label', 'true')
+            if source_node and source_node.type in BRANCHING_NODE_TYPES:
+                is_goto = ':goto' in conn_label
+                branch = conn_label.split(':')[0]
+            else:
+                is_goto = False
+                branch = conn_label
+            edge = PlanEdge(conn.source, conn.target, branch, is_goto, f"{conn.source}->{conn.target}")
+            self.outgoing.setdefault(conn.source, []).append(edge)
+            self.incoming.setdefault(conn.target, []).append(conn.source)
+
+        self.max_goto_iterations: Dict[str, int] = {
+            node.id: node.data.get('config', {}).get('maxGotoIterations', DEFAULT_MAX_GOTO_ITERATIONS)
+            for node in self.node_list if node.type in BRANCHING_NODE_TYPES
+        }
+
+        # Условия If/Else и таблицы маршрутов Switch компилируются один раз на версию workflow
+        self.conditions: Dict[str, Any] = {
+            node.id: compile_condition(node, self.label_to_id_map)
+            for node in self.node_list if node.type in BRANCHING_NODE_TYPES
+        }
+
+        # Зависимости через шаблоны {{Label.path}}: node_id -> ноды, результаты которых читает ее конфиг
+        self.template_deps: Dict[str, Set[str]] = {}
+        self.unresolved_references: Dict[str, List[str]] = {}
+        for node in self.node_list:
+            references: List[str] = []
+            _collect_template_references(node.data.get('config', {}), references)
+            deps = {self.label_to_id_map.get(ref, ref) for ref in references}
+            self.template_deps[node.id] = {dep for dep in deps if dep in self.nodes and dep != node.id}
+            unresolved = [ref for ref in dict.fromkeys(references) if self.label_to_id_map.get(ref, ref) not in self.nodes]
+            if unresolved:
+                self.unresolved_references[node.id] = unresolved
+
+        # fieldPath условий тоже может читать результат ноды по лейблу
+        for node_id, condition in self.conditions.items():
+            source_id = condition.accessor.node_id
+            if source_id in self.nodes and source_id != node_id:
+                self.template_deps[node_id].add(source_id)
+
+        # Ноды, результаты которых нода читает из all_results (шаблоны, fieldPath условий, inputArrayPath цикла);
+        # входят в ключ кэша результатов ноды
+        self.result_sources: Dict[str, Set[str]] = {node_id: set(deps) for node_id, deps in self.template_deps.items()}
+        for node in self.node_list:
+            if node.type == 'loop':
+                array_path = str(node.data.get('config', {}).get('inputArrayPath', 'items'))
+                source_id = self.label_to_id_map.get(array_path.split('.')[0])
+                if source_id in self.nodes and source_id != node.id:
+                    self.result_sources[node.id].add(source_id)
+
+        # Все потребители результата ноды: цели исходящих связей и ноды, ссылающиеся на нее в шаблонах
+        self.dependents: Dict[str, Set[str]] = {node_id: {edge.target for edge in edges} for node_id, edges in self.outgoing.items()}
+        for node_id, deps in self.template_deps.items():
+            for dep in deps:
+                self.dependents.setdefault(dep, set()).add(node_id)
+
+        # Обратный индекс: node_id -> ноды, без результатов которых она не может выполниться
+        self.dependencies: Dict[str, Set[str]] = {
+            node_id: set(self.incoming.get(node_id, ())) | self.template_deps.get(node_id, set())
+            for node_id in self.nodes
+        }
+
+        # Ноды на циклах GOTO могут выполняться повторно, поэтому их результаты (и результаты,
+        # которые они читают) нельзя освобождать досрочно
+        cyclic_nodes = {node_id for node_id in self.nodes if self._reaches(node_id, node_id)}
+        self.releasable_nodes: Set[str] = {
+            node_id for node_id in self.nodes
+            if node_id not in cyclic_nodes and not (self.dependents.get(node_id, set()) & cyclic_nodes)
+        }
+
+        # Стартовые ноды - ноды без входящих связей, в порядке объявления
+        self.start_nodes: List[str] = [node.id for node in self.node_list if not self.incoming.get(node.id)]
+
+    def _reaches(self, source_id: str, target_id: str) -> bool:
+        """Есть ли путь по связям из source_id в target_id (длиной хотя бы в одну связь)."""
+        visited: Set[str] = set()
+        stack = [edge.target for edge in self.outgoing.get(source_id, ())]
+        while stack:
+            node_id = stack.pop()
+            if node_id == target_id:
+                return True
+            if node_id in visited:
+                continue
+            visited.add(node_id)
+            stack.extend(edge.target for edge in self.outgoing.get(node_id, ()))
+        return False
+
+    def resolve_start_node(self, start_node_id: Optional[str] = None) -> Optional[str]:
+        """Возвращает явно указанную стартовую ноду или первую ноду без входящих связей."""
+        if start_node_id:
+            return start_node_id
+        return self.start_nodes[0] if self.start_nodes else None
+
+    def downstream_of(self, node_ids: Iterable[str]) -> Set[str]:
+        """Ноды, на которые влияет изменение указанных нод (включая их самих)."""
+        affected: Set[str] = set()
+        stack = [node_id for node_id in node_ids if node_id in self.nodes]
+        while stack:
+            node_id = stack.pop()
+            if node_id in affected:
+                continue
+            affected.add(node_id)
+            stack.extend(self.dependents.get(node_id, ()))
+        return affected
+
+    def upstream_of(self, node_ids: Iterable[str]) -> Set[str]:
+        """Ноды, результаты которых нужны для вычисления указанных нод (включая их самих)."""
+        required: Set[str] = set()
+        stack = [node_id for node_id in node_ids if node_id in self.nodes]
+        while stack:
+            node_id = stack.pop()
+            if node_id in required:
+                continue
+            required.add(node_id)
+            stack.extend(self.dependencies.get(node_id, ()))
+        return required
+
+    def template_warnings(self) -> List[str]:
+        """
+        Статическая проверка шаблонов: ссылки на несуществующие ноды и на ноды,
+        которые не являются предками по связям (их результата может не быть в момент выполнения).
+        """
+        warnings = []
+        for node in self.node_list:
+            label = node.data.get('label', node.id)
+            for ref in self.unresolved_references.get(node.id, ()):
+                warnings.append(f"Node '{label}' references unknown node '{ref}' in a template")
+            deps = self.template_deps.get(node.id)
+            if not deps:
+                continue
+            ancestors = self._edge_ancestors(node.id)
+            for dep in sorted(deps - ancestors):
+                dep_label = self.nodes[dep].data.get('label', dep)
+                warnings.append(f"Node '{label}' reads '{dep_label}' in a template, but '{dep_label}' is not upstream of it")
+        return warnings
+
+    def _edge_ancestors(self, node_id: str) -> Set[str]:
+        ancestors: Set[str] = set()
+        stack = list(self.incoming.get(node_id, ()))
+        while stack:
+            source_id = stack.pop()
+            if source_id in ancestors:
+                continue
+            ancestors.add(source_id)
+            stack.extend(self.incoming.get(source_id, ()))
+        return ancestors
+
+    def resolve_node_ids(self, identifiers: Iterable[str]) -> List[str]:
+        """Переводит лейблы или ID нод в ID; неизвестные ноды - ошибка."""
+        node_ids = []
+        for identifier in identifiers:
+            node_id = self.label_to_id_map.get(identifier, identifier)
+            if node_id not in self.nodes:
+                raise Exception(f"Node '{identifier}' not found in workflow")
+            node_ids.append(node_id)
+        return node_ids
+
+    def to_request(self, start_node_id: Optional[str] = None) -> WorkflowExecuteRequest:
+        """Собирает WorkflowExecuteRequest из уже провалидированных нод и связей."""
+        return WorkflowExecuteRequest(nodes=self.node_list, connections=self.connections, startNodeId=start_node_id)
+
+
+# Кэш планов сохраненных workflow: workflow_id -> (updated_at, plan)
+_plan_cache: Dict[str, Tuple[Any, ExecutionPlan]] = {}
+
+
+def _load_json_field(value: Any) -> List[Any]:
+    if isinstance(value, str):
+        return json.loads(value or '[]')
+    return value or []
+
+
+def get_workflow_plan(workflow_data: Dict[str, Any]) -> ExecutionPlan:
+    """
+    Возвращает план для записи workflow из БД.
+    План кэшируется по id workflow и пересобирается при изменении updated_at.
+    """
+    workflow_id = workflow_data.get('id')
+    version = workflow_data.get('updated_at')
+
+    cached = _plan_cache.get(workflow_id) if workflow_id else None
+    if cached and cached[0] == version:
+        return cached[1]
+
+    plan = ExecutionPlan(
+        _load_json_field(workflow_data.get('nodes')),
+        _load_json_field(workflow_data.get('connections'))
+    )
+    if workflow_id:
+        _plan_cache[workflow_id] = (version, plan)
+        logger.info(f"🧩 Скомпилирован план выполнения для workflow '{workflow_id}' (версия {version})")
+    return plan
+
+
+def invalidate_workflow_plan(workflow_id: str):
+    """Удаляет план workflow из кэша."""
+    _plan_cache.pop(workflow_id, None)
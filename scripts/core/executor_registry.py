@@ -0,0 +1,150 @@
+import importlib
+import inspect
+import logging
+from importlib.metadata import entry_points
+from typing import Dict, Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Встроенные исполнители импортируются при первом использовании типа ноды, а не при импорте движка
+BUILTIN_EXECUTORS: Dict[str, str] = {
+    'gigachat': 'scripts.core.node_executors.gigachat:execute_gigachat',
+    'webhook': 'scripts.core.node_executors.webhook:execute_webhook',
+    'request_iterator': 'scripts.core.node_executors.request_iterator:execute_request_iterator',
+    'if_else': 'scripts.core.node_executors.if_else:execute_if_else',
+    'switch': 'scripts.core.node_executors.switch:execute_switch',
+    'dispatcher': 'scripts.core.node_executors.dispatcher:execute_dispatcher',
+    'loop': 'scripts.core.node_executors.loop:execute_loop',
+    'join': 'scripts.core.node_executors.join:execute_join',
+    'timer': 'scripts.core.node_executors.timer:execute_timer',
+    'webhook_trigger': 'scripts.core.node_executors.webhook_trigger:execute_webhook_trigger',
+    'email': 'scripts.core.node_executors.email:execute_email',
+    'database': 'scripts.core.node_executors.database:execute_database',
+    'mcp_connector': 'scripts.core.node_executors.mcp_connector:execute_mcp_connector',
+    'filesystem': 'scripts.core.node_executors.filesystem:execute_filesystem',
+}
+
+# Группа entry points для исполнителей из отдельных пакетов: имя = тип ноды, значение = "module:function"
+ENTRY_POINT_GROUP = "aiuiflow.node_executors"
+
+# Аргументы, которые движок передает при каждом вызове (исполнитель объявляет только нужные ему)
+CALL_ARGUMENTS = ('node', 'label_to_id_map', 'input_data', 'all_results', 'condition', 'plan')
+
+
+def _create_gigachat_api():
+    from scripts.services.giga_chat import GigaChatAPI
+    return GigaChatAPI()
+
+
+# Сервисы исполнителей: имя параметра -> фабрика. Общие создаются один раз при первом запросе,
+# сервисы с состоянием вызова (ключ авторизации, история диалога) - заново на каждый вызов
+_dependency_factories: Dict[str, Callable[[], Any]] = {
+    'gigachat_api': _create_gigachat_api,
+}
+_per_call_dependencies = {'gigachat_api'}
+_dependencies: Dict[str, Any] = {}
+
+_registered: Dict[str, Callable] = {}
+_specs: Dict[str, "ExecutorSpec"] = {}
+_entry_points_loaded = False
+
+
+class ExecutorSpec:
+    """
+    Исполнитель с разобранной один раз сигнатурой. Аргументы передаются по имени:
+    исполнитель получает только те из CALL_ARGUMENTS и зависимостей, которые объявил.
+    """
+    __slots__ = ('node_type', 'function', 'call_arguments', 'dependencies')
+
+    def __init__(self, node_type: str, function: Callable):
+        self.node_type = node_type
+        self.function = function
+        parameters = inspect.signature(function).parameters
+        self.call_arguments: Tuple[str, ...] = tuple(name for name in parameters if name in CALL_ARGUMENTS)
+        self.dependencies: Tuple[str, ...] = tuple(name for name in parameters if name in _dependency_factories)
+        unknown = [
+            name for name, parameter in parameters.items()
+            if name not in CALL_ARGUMENTS and name not in _dependency_factories
+            and parameter.default is inspect.Parameter.empty
+            and parameter.kind not in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+        ]
+        if unknown:
+            raise Exception(f"Executor for node type '{node_type}' has unknown required parameters: {', '.join(unknown)}")
+
+    async def invoke(self, **call_arguments) -> Dict[str, Any]:
+        kwargs = {name: call_arguments.get(name) for name in self.call_arguments}
+        for name in self.dependencies:
+            kwargs[name] = _dependency_factories[name]() if name in _per_call_dependencies else get_dependency(name)
+        return await self.function(**kwargs)
+
+
+def register_executor(node_type: str):
+    """Декоратор регистрации исполнителя: @register_executor('my_node')."""
+    def decorator(function: Callable) -> Callable:
+        _registered[node_type] = function
+        _specs.pop(node_type, None)
+        return function
+    return decorator
+
+
+def register_dependency(name: str, factory: Callable[[], Any], per_call: bool = False):
+    """
+    Регистрирует сервис, который исполнители получают по имени параметра.
+    per_call=True - новый экземпляр на каждый вызов (для объектов с изменяемым состоянием запроса).
+    """
+    _dependency_factories[name] = factory
+    _dependencies.pop(name, None)
+    if per_call:
+        _per_call_dependencies.add(name)
+    else:
+        _per_call_dependencies.discard(name)
+    _specs.clear()
+
+
+def get_dependency(name: str) -> Any:
+    if name not in _dependencies:
+        _dependencies[name] = _dependency_factories[name]()
+    return _dependencies[name]
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    _entry_points_loaded = True
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name in _registered or entry_point.name in BUILTIN_EXECUTORS:
+            continue
+        try:
+            _registered[entry_point.name] = entry_point.load()
+            logger.info(f"🔌 Подключен исполнитель ноды '{entry_point.name}' из {entry_point.value}")
+        except Exception as e:
+            logger.error(f"❌ Не удалось загрузить исполнитель ноды '{entry_point.name}': {e}")
+
+
+def _resolve(node_type: str) -> Optional[Callable]:
+    if node_type in _registered:
+        return _registered[node_type]
+    path = BUILTIN_EXECUTORS.get(node_type)
+    if path:
+        module_name, function_name = path.split(':')
+        return getattr(importlib.import_module(module_name), function_name)
+    if not _entry_points_loaded:
+        _load_entry_points()
+        return _registered.get(node_type)
+    return None
+
+
+def get_executor_spec(node_type: str) -> Optional[ExecutorSpec]:
+    spec = _specs.get(node_type)
+    if spec is None:
+        function = _resolve(node_type)
+        if function is None:
+            return None
+        spec = _specs[node_type] = ExecutorSpec(node_type, function)
+    return spec
+
+
+def available_node_types() -> list:
+    """Типы нод, для которых есть исполнитель: встроенные, зарегистрированные и из entry points."""
+    if not _entry_points_loaded:
+        _load_entry_points()
+    return sorted(set(BUILTIN_EXECUTORS) | set(_registered))
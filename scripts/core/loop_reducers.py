@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Any, List, Tuple, AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк JSONL-файла читать за один заход в поток
+JSONL_READ_CHUNK = 1000
+
+
+def get_result_field(result: Optional[Dict[str, Any]], field_path: str, label_to_id_map: Dict[str, str]) -> Any:
+    """Достает поле из результатов суб-воркфлоу: 'Node Label.output.text' или 'node-id.json.value'."""
+    if not result or not field_path:
+        return result
+    parts = field_path.split('.')
+    current: Any = result.get(label_to_id_map.get(parts[0], parts[0]))
+    for key in parts[1:]:
+        if isinstance(current, dict):
+            current = current.get(key)
+        elif isinstance(current, list) and key.isdigit() and int(key) < len(current):
+            current = current[int(key)]
+        else:
+            return None
+    return current
+
+
+class LoopReducer:
+    """Базовый редьюсер: считает успешные и неуспешные элементы, сами результаты не хранит."""
+
+    def __init__(self, config: Dict[str, Any], label_to_id_map: Dict[str, str]):
+        self.field_path = config.get('reducerField', '')
+        self.label_to_id_map = label_to_id_map
+        self.success_count = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.max_errors = int(config.get('maxReportedErrors', 100))
+
+    def add(self, item_result: Dict[str, Any]):
+        if item_result.get('success'):
+            self.success_count += 1
+            self.reduce(item_result['index'], get_result_field(item_result.get('result'), self.field_path, self.label_to_id_map))
+        else:
+            self.error_count += 1
+            if len(self.errors) < self.max_errors:
+                self.errors.append({"index": item_result['index'], "error": item_result.get('error')})
+
+    def reduce(self, index: int, value: Any):
+        pass
+
+    def finish(self) -> Dict[str, Any]:
+        return {"value": self.success_count}
+
+    def close(self):
+        pass
+
+
+class CollectFieldReducer(LoopReducer):
+    """Собирает одно поле из результата каждого элемента (в порядке элементов)."""
+
+    def __init__(self, config: Dict[str, Any], label_to_id_map: Dict[str, str]):
+        super().__init__(config, label_to_id_map)
+        self.values: List[Tuple[int, Any]] = []
+
+    def reduce(self, index: int, value: Any):
+        self.values.append((index, value))
+
+    def finish(self) -> Dict[str, Any]:
+        self.values.sort(key=lambda pair: pair[0])
+        return {"value": [value for _, value in self.values]}
+
+
+class ConcatTextReducer(CollectFieldReducer):
+    """Склеивает текстовое поле результатов через разделитель (в порядке элементов)."""
+
+    def __init__(self, config: Dict[str, Any], label_to_id_map: Dict[str, str]):
+        super().__init__(config, label_to_id_map)
+        self.separator = config.get('separator', '\n')
+
+    def reduce(self, index: int, value: Any):
+        if value is None:
+            return
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        self.values.append((index, text))
+
+    def finish(self) -> Dict[str, Any]:
+        self.values.sort(key=lambda pair: pair[0])
+        return {"value": self.separator.join(text for _, text in self.values)}
+
+
+class JsonlSpillReducer(LoopReducer):
+    """Пишет результат каждого элемента строкой JSONL в файл; в памяти ничего не копится."""
+
+    def __init__(self, config: Dict[str, Any], label_to_id_map: Dict[str, str]):
+        super().__init__(config, label_to_id_map)
+        self.path = config.get('spillPath')
+        if not self.path:
+            fd, self.path = tempfile.mkstemp(prefix='loop_results_', suffix='.jsonl')
+            os.close(fd)
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.lines = 0
+
+    def add(self, item_result: Dict[str, Any]):
+        super().add(item_result)
+        record = {
+            "index": item_result['index'],
+            "success": item_result.get('success'),
+            "result": get_result_field(item_result.get('result'), self.field_path, self.label_to_id_map),
+            "error": item_result.get('error'),
+        }
+        self.file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self.lines += 1
+
+    def finish(self) -> Dict[str, Any]:
+        self.close()
+        return {"value": self.path, "lines": self.lines}
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+LOOP_REDUCERS = {
+    'count': LoopReducer,
+    'collect_field': CollectFieldReducer,
+    'concat_text': ConcatTextReducer,
+    'jsonl': JsonlSpillReducer,
+}
+
+
+def create_reducer(config: Dict[str, Any], label_to_id_map: Dict[str, str]) -> LoopReducer:
+    reducer_type = config.get('reducer', 'count')
+    reducer_class = LOOP_REDUCERS.get(reducer_type)
+    if not reducer_class:
+        raise Exception(f"Loop node: unknown reducer '{reducer_type}'. Available: {', '.join(LOOP_REDUCERS)}")
+    return reducer_class(config, label_to_id_map)
+
+
+async def iterate_list(items: List[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
+async def iterate_batches(items: AsyncIterator[Any], batch_size: int) -> AsyncIterator[List[Any]]:
+    """Группирует элементы асинхронного итератора в списки по batch_size."""
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def iterate_jsonl_file(path: str) -> AsyncIterator[Any]:
+    """Читает JSONL-файл порциями в потоке, не загружая его в память целиком."""
+    def read_chunk(file) -> List[str]:
+        lines = []
+        for line in file:
+            lines.append(line)
+            if len(lines) >= JSONL_READ_CHUNK:
+                break
+        return lines
+
+    file = await asyncio.to_thread(open, path, 'r', encoding='utf-8')
+    try:
+        while True:
+            lines = await asyncio.to_thread(read_chunk, file)
+            if not lines:
+                break
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        file.close()
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+from scripts.models.schemas import Node
+from scripts.services import storage
+from scripts.utils.template_engine import replace_templates
+
+logger = logging.getLogger(__name__)
+
+# Кэш включается на ноде: config.cacheResults = true.
+# Дополнительно: cacheTtlSeconds (время жизни записи) и cachePersistent (хранить и в Postgres).
+DEFAULT_CACHE_TTL_SECONDS = int(os.getenv("NODE_CACHE_TTL_SECONDS", "3600"))
+NODE_CACHE_MAX_ENTRIES = int(os.getenv("NODE_CACHE_MAX_ENTRIES", "1000"))
+# Записи крупнее лимита не держим в памяти процесса (но сохраняем в Postgres, если он включен)
+NODE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("NODE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+# Настройки кэша не влияют на результат ноды и не входят в ключ
+CACHE_CONFIG_KEYS = {'cacheResults', 'cacheTtlSeconds', 'cachePersistent'}
+# Контекст текущего запуска: не входит в ключ, не сохраняется в кэше и при попадании берется из текущего входа
+RUN_SCOPED_KEYS = {'dispatcher_context'}
+# Диагностика предыдущих нод (время, метрики), меняющаяся от запуска к запуску при тех же данных
+DIAGNOSTIC_SECTIONS = {'meta', 'metadata', 'summary'}
+VOLATILE_DIAGNOSTIC_KEYS = {'timestamp', 'execution_time_ms', 'merge_time', 'time_to_first_token_ms', 'concurrency', 'ledger'}
+
+NODE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflow_service.node_result_cache (
+    cache_key TEXT PRIMARY KEY,
+    node_type TEXT NOT NULL,
+    result JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS node_result_cache_expires_idx
+    ON workflow_service.node_result_cache (expires_at);
+"""
+
+# LRU в памяти процесса: cache_key -> (expires_at, результат в виде JSON-строки).
+# Результат хранится строкой, чтобы каждый запуск получал собственную копию.
+_memory_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def is_cacheable(node: Node) -> bool:
+    return bool(node.data.get('config', {}).get('cacheResults'))
+
+
+def _render_config(value: Any, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Any:
+    """Рекурсивно подставляет шаблоны во все строковые значения конфига."""
+    if isinstance(value, str):
+        return replace_templates(value, input_data, label_to_id_map, all_results) if '{{' in value else value
+    if isinstance(value, dict):
+        return {k: _render_config(v, input_data, label_to_id_map, all_results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_render_config(v, input_data, label_to_id_map, all_results) for v in value]
+    return value
+
+
+def _stable_input(value: Any, diagnostic: bool = False) -> Any:
+    """Вход без контекста запуска и изменчивой диагностики: одинаковые данные дают одинаковый ключ."""
+    if isinstance(value, dict):
+        return {
+            k: _stable_input(v, k in DIAGNOSTIC_SECTIONS)
+            for k, v in value.items()
+            if k not in RUN_SCOPED_KEYS and not (diagnostic and k in VOLATILE_DIAGNOSTIC_KEYS)
+        }
+    if isinstance(value, list):
+        return [_stable_input(v) for v in value]
+    return value
+
+
+def make_cache_key(node: Node, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any], source_ids: Iterable[str] = ()) -> str:
+    """
+    Ключ кэша: хэш типа ноды, конфига с подставленными шаблонами, входных данных (без контекста запуска)
+    и результатов нод source_ids, которые нода читает из all_results помимо шаблонов (ExecutionPlan.result_sources).
+    """
+    config = {k: v for k, v in node.data.get('config', {}).items() if k not in CACHE_CONFIG_KEYS}
+    payload = {
+        "type": node.type,
+        "config": _render_config(config, input_data, label_to_id_map, all_results),
+        "input": _stable_input(input_data),
+        "sources": {source_id: _stable_input(all_results.get(source_id)) for source_id in sorted(source_ids)},
+    }
+    return hashlib.sha256(_dumps(payload).encode('utf-8')).hexdigest()
+
+
+def _cache_settings(node: Node) -> Tuple[int, bool]:
+    config = node.data.get('config', {})
+    ttl = int(config.get('cacheTtlSeconds') or DEFAULT_CACHE_TTL_SECONDS)
+    return ttl, bool(config.get('cachePersistent'))
+
+
+async def init_node_cache_schema():
+    """Создает таблицу персистентного кэша результатов нод, если ее еще нет."""
+    if not storage.db_pool:
+        return
+    async with storage.db_pool.acquire() as conn:
+        await conn.execute(NODE_CACHE_SCHEMA)
+        await conn.execute("DELETE FROM workflow_service.node_result_cache WHERE expires_at <= NOW()")
+    logger.info("✅ Таблица кэша результатов нод готова.")
+
+
+def _remember(cache_key: str, expires_at: float, serialized: str):
+    if len(serialized) > NODE_CACHE_MAX_ENTRY_BYTES:
+        return
+    _memory_cache[cache_key] = (expires_at, serialized)
+    _memory_cache.move_to_end(cache_key)
+    while len(_memory_cache) > NODE_CACHE_MAX_ENTRIES:
+        _memory_cache.popitem(last=False)
+
+
+async def get_cached_result(cache_key: str, node: Node) -> Optional[Dict[str, Any]]:
+    """Ищет результат сначала в памяти, затем (если включено) в Postgres."""
+    entry = _memory_cache.get(cache_key)
+    if entry:
+        expires_at, serialized = entry
+        if expires_at > time.time():
+            _memory_cache.move_to_end(cache_key)
+            return json.loads(serialized)
+        del _memory_cache[cache_key]
+
+    _, persistent = _cache_settings(node)
+    if not persistent or not storage.db_pool:
+        return None
+    try:
+        async with storage.db_pool.acquire() as conn:
+            record = await conn.fetchrow(
+                """
+                SELECT result, EXTRACT(EPOCH FROM expires_at) AS expires_at
+                FROM workflow_service.node_result_cache
+                WHERE cache_key = $1 AND expires_at > NOW()
+                """,
+                cache_key
+            )
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось прочитать кэш ноды {node.id} из БД: {e}")
+        return None
+    if not record:
+        return None
+    _remember(cache_key, float(record['expires_at']), record['result'])
+    return json.loads(record['result'])
+
+
+async def store_result(cache_key: str, node: Node, result: Dict[str, Any]):
+    """Сохраняет успешный результат ноды в кэш (без контекста запуска)."""
+    if result.get('success') is False:
+        return
+    ttl, persistent = _cache_settings(node)
+    expires_at = time.time() + ttl
+    serialized = _dumps({k: v for k, v in result.items() if k not in RUN_SCOPED_KEYS})
+    _remember(cache_key, expires_at, serialized)
+
+    if not persistent or not storage.db_pool:
+        return
+    try:
+        async with storage.db_pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO workflow_service.node_result_cache (cache_key, node_type, result, expires_at)
+                VALUES ($1, $2, $3, TO_TIMESTAMP($4))
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    result = EXCLUDED.result,
+                    expires_at = EXCLUDED.expires_at;
+                """,
+                cache_key, node.type, serialized, expires_at
+            )
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось сохранить кэш ноды {node.id} в БД: {e}")
+
+
+async def clear_node_cache() -> Dict[str, int]:
+    """
+    Очищает кэш результатов нод: память этого процесса и таблицу Postgres.
+    Кэш в памяти других процессов (воркеров) живет до истечения TTL записей.
+    """
+    memory_entries = len(_memory_cache)
+    _memory_cache.clear()
+    persistent_entries = 0
+    if storage.db_pool:
+        async with storage.db_pool.acquire() as conn:
+            status = await conn.execute("DELETE FROM workflow_service.node_result_cache")
+        persistent_entries = int(status.split()[-1])
+    logger.info(f"🧹 Кэш результатов нод очищен: в памяти {memory_entries}, в БД {persistent_entries}")
+    return {"memory": memory_entries, "persistent": persistent_entries}
@@ -6,10 +6,11 @@ import uuid
 from datetime import datetime
 import re
 
-from scripts.models.schemas import Node, WorkflowExecuteRequest, DispatcherCallbackRequest
+from scripts.models.schemas import Node, DispatcherCallbackRequest
 from scripts.services.giga_chat import GigaChatAPI
 from scripts.utils.template_engine import replace_templates
 from scripts.services.storage import get_workflow_by_id
+from scripts.core.execution_plan import get_workflow_plan
 
 logger = logging.getLogger(__name__)
 
@@ -27,19 +28,13 @@ async def launch_workflow_by_id(workflow_id: str, input_data: Dict[str, Any]):
     
     logger.info(f"🚀 Запуск workflow {workflow_id}")
     
-    workflow_data = dict(workflow_data_raw)
-    nodes = json.loads(workflow_data.get('nodes', '[]'))
-    connections = json.loads(workflow_data.get('connections', '[]'))
-
-    workflow_request = WorkflowExecuteRequest(
-        nodes=nodes,
-        connections=connections
-    )
+    workflow_plan = get_workflow_plan(dict(workflow_data_raw))
+    workflow_request = workflow_plan.to_request()
     
     # В асинхронном мире мы не можем просто ждать. 
     # Правильная реализация будет запускать это как фоновую задачу.
     # Но для сохранения логики пока оставим await.
-    result = await execute_workflow_internal(workflow_request, initial_input_data=input_data)
+    result = await execute_workflow_internal(workflow_request, initial_input_data=input_data, plan=workflow_plan)
     
     # В реальной системе этот результат должен был бы отправиться 
     # на эндпоинт /dispatcher/callback, а не просто вернуться.
@@ -325,13 +320,10 @@ async def execute_router_dispatcher(node: Node, label_to_id_map: Dict[str, str],
     if not workflow_data_raw:
         raise Exception(f"Dispatcher: Target workflow '{workflow_id}' not found.")
 
-    workflow_data = dict(workflow_data_raw)
-    nodes = json.loads(workflow_data.get('nodes', '[]'))
-    connections = json.loads(workflow_data.get('connections', '[]'))
-
-    workflow_request = WorkflowExecuteRequest(nodes=nodes, connections=connections)
+    workflow_plan = get_workflow_plan(dict(workflow_data_raw))
+    workflow_request = workflow_plan.to_request()
     
-    sub_workflow_result = await execute_workflow_internal(workflow_request, initial_input_data={**input_data, "dispatcher_info": {"category": category}})
+    sub_workflow_result = await execute_workflow_internal(workflow_request, initial_input_data={**input_data, "dispatcher_info": {"category": category}}, plan=workflow_plan)
     
     return sub_workflow_result.dict()
 
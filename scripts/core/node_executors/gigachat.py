@@ -2,15 +2,37 @@
 import logging
 import json
 import os
+import time
 from datetime import datetime
 from typing import Dict, Any
 
 from scripts.models.schemas import Node
 from scripts.services.giga_chat import GigaChatAPI
+from scripts.core.execution_events import publish_event
 from scripts.utils.template_engine import replace_templates
 
 logger = logging.getLogger(__name__)
 
+async def _stream_chat_completion(node: Node, gigachat_api: GigaChatAPI, system_message: str, user_message: str) -> Dict[str, Any]:
+    """Потоковый ответ: фрагменты публикуются в поток событий запуска по мере генерации."""
+    started_at = time.monotonic()
+    time_to_first_token_ms = None
+    parts = []
+    try:
+        async for delta in gigachat_api.stream_chat_completion(system_message, user_message):
+            if time_to_first_token_ms is None:
+                time_to_first_token_ms = int((time.monotonic() - started_at) * 1000)
+            parts.append(delta)
+            publish_event("node_delta", nodeId=node.id, delta=delta)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    return {
+        "success": True,
+        "response": "".join(parts),
+        "conversation_length": len(gigachat_api.conversation_history),
+        "time_to_first_token_ms": time_to_first_token_ms
+    }
+
 async def execute_gigachat(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], gigachat_api: GigaChatAPI, all_results: Dict[str, Any]) -> Dict[str, Any]:
     """Выполнение GigaChat ноды"""
     start_time = datetime.now()
@@ -23,6 +45,8 @@ async def execute_gigachat(node: Node, label_to_id_map: Dict[str, str], input_da
         auth_token = os.getenv('GIGACHAT_AUTH_TOKEN')
 
     clear_history = config.get('clearHistory', False)
+    # stream: частичный ответ доступен подписчикам потока событий запуска до завершения ноды
+    stream = config.get('stream', False)
 
     system_message = config.get('systemMessage', 'Ты полезный ассистент')
     user_message = config.get('userMessage', '')
@@ -46,13 +70,18 @@ async def execute_gigachat(node: Node, label_to_id_map: Dict[str, str], input_da
     logger.info(f"🤖 Выполнение GigaChat ноды: {node.id}")
     logger.info(f"📝 Вопрос: {user_message}")
 
+    # gigachat_api создается реестром на каждый вызов, поэтому история диалога не переходит
+    # между нодами и параллельными запусками; clearHistory оставлен для совместимости конфигов
     if clear_history:
         gigachat_api.clear_history()
 
     if not await gigachat_api.get_token(auth_token):
         raise Exception("Не удалось получить токен доступа")
 
-    result = await gigachat_api.get_chat_completion(system_message, user_message)
+    if stream:
+        result = await _stream_chat_completion(node, gigachat_api, system_message, user_message)
+    else:
+        result = await gigachat_api.get_chat_completion(system_message, user_message)
     
     if not result.get('success'):
         raise Exception(result.get('error', 'Unknown error'))
@@ -85,7 +114,9 @@ async def execute_gigachat(node: Node, label_to_id_map: Dict[str, str], input_da
             "conversation_length": result.get("conversation_length", 0),
             "length": len(raw_response_text),
             "words": len(raw_response_text.split()),
-            "id_node": node.id
+            "id_node": node.id,
+            "streamed": stream,
+            "time_to_first_token_ms": result.get("time_to_first_token_ms")
         },
         "inputs": {
             "system_message_template": original_system_message,
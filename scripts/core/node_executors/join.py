@@ -1,9 +1,10 @@
 import logging
 import json
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 from scripts.models.schemas import Node
+from scripts.utils.lazy_text import LazyTextDict
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,29 @@ def _extract_text_from_data(data: Any) -> str:
 
     return json.dumps(data, ensure_ascii=False, indent=2)
 
+_MISSING = object()
+
+
+def _find_common_data(inputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Общие ключи всех входов с равными значениями. Сначала проверяется идентичность объекта
+    (ветки обычно передают одни и те же данные по ссылке), иначе - обычное сравнение ==,
+    которое останавливается на первом различии.
+    """
+    first_input, other_inputs = inputs[0], inputs[1:]
+    common_data = {}
+    for key, value in first_input.items():
+        for other in other_inputs:
+            other_value = other.get(key, _MISSING)
+            if other_value is value:
+                continue
+            if other_value is _MISSING or other_value != value:
+                break
+        else:
+            common_data[key] = value
+    return common_data
+
+
 async def execute_join(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Dict[str, Any]:
     """
     Выполнение интеллектуальной Join/Merge ноды, которая находит общие данные,
@@ -47,21 +71,18 @@ async def execute_join(node: Node, label_to_id_map: Dict[str, str], input_data:
     if len(inputs) == 1:
         return list(inputs.values())[0]
 
-    all_input_dicts = list(inputs.values())
-    first_input = all_input_dicts[0]
-    other_inputs = all_input_dicts[1:]
-    
-    common_data = {}
-    for key, value in first_input.items():
-        if all(key in other and other[key] == value for other in other_inputs):
-            common_data[key] = value
+    common_data = _find_common_data(list(inputs.values()))
     
     logger.info(f"🔍 Найдены общие данные: {list(common_data.keys())}")
 
+    # Уникальные данные ссылаются на значения источников без копирования;
+    # если общих ключей нет, используется сам результат источника
     unique_data_per_source = {}
     for source_id, source_dict in inputs.items():
-        unique_data = {k: v for k, v in source_dict.items() if k not in common_data}
-        unique_data_per_source[source_id] = unique_data
+        if common_data:
+            unique_data_per_source[source_id] = {k: v for k, v in source_dict.items() if k not in common_data}
+        else:
+            unique_data_per_source[source_id] = source_dict
 
     join_result = {}
     output_data = {}
@@ -80,11 +101,11 @@ async def execute_join(node: Node, label_to_id_map: Dict[str, str], input_data:
         logger.info(f"✅ Объединено {len(texts)} текстов")
 
     elif merge_strategy == 'merge_json':
-        output_data = {
-            'json': unique_data_per_source,
-            'text': json.dumps(unique_data_per_source, ensure_ascii=False, indent=2),
-            'source_count': len(inputs)
-        }
+        # Отформатированный text строится только если его кто-то прочитает
+        output_data = LazyTextDict(
+            {'json': unique_data_per_source, 'source_count': len(inputs)},
+            lambda: json.dumps(unique_data_per_source, ensure_ascii=False, indent=2)
+        )
         logger.info(f"✅ Объединены данные в JSON от {len(inputs)} источников")
 
     else:
@@ -1,10 +1,18 @@
 import logging
 import json
+import asyncio
 from datetime import datetime
 from typing import Dict, Any
 
-from scripts.models.schemas import Node, WorkflowExecuteRequest
+from scripts.models.schemas import Node
+from scripts.services import storage
 from scripts.services.storage import get_workflow_by_id
+from scripts.services.loop_ledger import LoopLedger
+from scripts.core.execution_events import current_run_id
+from scripts.core.execution_plan import get_workflow_plan
+from scripts.utils.template_engine import replace_templates, render_structured, render_structured_batch
+from scripts.core.loop_reducers import create_reducer, get_result_field, iterate_list, iterate_jsonl_file, iterate_batches
+from scripts.utils.adaptive_limiter import limiter_from_config
 
 logger = logging.getLogger(__name__)
 
@@ -19,162 +27,407 @@ async def execute_loop(node: Node, label_to_id_map: Dict[str, str], input_data:
     timeout = config.get('timeout', 300)
     skip_errors = config.get('skipErrors', True)
     batch_size = config.get('batchSize', 0)
+    item_input_template = config.get('itemInputTemplate')  # JSON-шаблон входа суб-воркфлоу, {{input.item...}}
+    batch_invocation = config.get('batchInvocation', False)  # суб-воркфлоу получает {"items": [...]} на весь батч
     
-    logger.info(f"🔍 Loop node input data: {json.dumps(input_data, ensure_ascii=False)}")
-    logger.info(f"🔍 Looking for array at path: {array_path}")
-    logger.info(f"🔍 Label to ID map: {label_to_id_map}")
-    
-    path_parts = array_path.split('.')
-    first_part = path_parts[0]
-    if first_part in label_to_id_map:
-        node_id = label_to_id_map[first_part]
-        logger.info(f"🔄 Replacing label '{first_part}' with node ID '{node_id}'")
-        path_parts[0] = node_id
-        array_path = '.'.join(path_parts)
-        logger.info(f"🔄 New path: {array_path}")
-    
-    def get_by_path(data, path):
-        for part in path.split('.'):
-            if isinstance(data, dict):
-                data = data.get(part)
-            else:
-                return None
-        return data
-    
-    # Сначала ищем идентификатор ноды в глобальных результатах
-    node_id = label_to_id_map.get(array_path.split('.')[0])
-    if node_id and node_id in all_results:
-        data_source = all_results
-        path_to_value = f"{node_id}.{'.'.join(array_path.split('.')[1:])}"
-    else:
-        data_source = input_data
-        path_to_value = array_path
+    streaming = config.get('streaming', False)
+    items_file = config.get('itemsFile')  # JSONL-файл с элементами (только в потоковом режиме)
 
-    array = get_by_path(data_source, path_to_value)
-    if array is None and isinstance(input_data, dict) and 'json' in input_data and isinstance(input_data['json'], list):
-        logger.info(f"⚠️ Data not found at '{array_path}', but found a list in the 'json' field of the input. Using that instead.")
-        array = input_data['json']
-    
-    if array is not None:
-        logger.info(f"✅ Found data at path '{array_path}': {json.dumps(array, ensure_ascii=False)}")
+    if streaming and items_file:
+        array = None
     else:
-        logger.error(f"❌ No data found at path '{array_path}'")
-        raise Exception(f"Loop node: no data found at path '{array_path}'")
-    
-    if not isinstance(array, list):
-        raise Exception(f"Loop node: input at path '{array_path}' is not a list")
+        array = _resolve_input_array(array_path, label_to_id_map, input_data, all_results, log_data=not streaming)
     
     if not sub_workflow_id:
         raise Exception("Loop node: subWorkflowId is required")
+    if batch_invocation and batch_size <= 0:
+        raise Exception("Loop node: batchInvocation requires batchSize > 0")
     
     sub_workflow_data_raw = await get_workflow_by_id(sub_workflow_id)
     if not sub_workflow_data_raw:
         raise Exception(f"Loop node: subWorkflow with ID '{sub_workflow_id}' not found")
 
-    # Десериализуем поля nodes и connections из JSONB
-    sub_workflow_data = dict(sub_workflow_data_raw)
-    if sub_workflow_data.get('nodes'):
-        sub_workflow_data['nodes'] = json.loads(sub_workflow_data['nodes'])
-    if sub_workflow_data.get('connections'):
-        sub_workflow_data['connections'] = json.loads(sub_workflow_data['connections'])
+    # Входы всех элементов рендерятся одним проходом: общие подстановки вычисляются один раз
+    item_inputs = None
+    if item_input_template and not streaming:
+        contexts = [{"item": item, "loop_index": idx} for idx, item in enumerate(array)]
+        try:
+            item_inputs = render_structured_batch(item_input_template, contexts, label_to_id_map, all_results)
+        except ValueError as e:
+            raise Exception(f"Loop node: itemInputTemplate could not be rendered as JSON: {e}")
+        if any(not isinstance(item_input, dict) for item_input in item_inputs):
+            raise Exception("Loop node: itemInputTemplate must render to a JSON object")
+
+    # План суб-воркфлоу компилируется один раз и переиспользуется для всех элементов
+    sub_workflow_plan = get_workflow_plan(dict(sub_workflow_data_raw))
+    sub_workflow_request = sub_workflow_plan.to_request()
     
     from scripts.core.workflow_engine import execute_workflow_internal
-    async def run_subworkflow(item, idx):
-        sub_input = {"item": item, "loop_index": idx}
+
+    def build_item_input(item, idx):
+        if item_inputs is not None:
+            return item_inputs[idx]
+        if item_input_template:
+            return render_structured(item_input_template, {"item": item, "loop_index": idx}, label_to_id_map, all_results)
+        return {"item": item, "loop_index": idx}
+
+    async def invoke_subworkflow(sub_input, idx, unit):
         try:
-            result = await execute_workflow_internal(
-                WorkflowExecuteRequest(
-                    nodes=sub_workflow_data["nodes"],
-                    connections=sub_workflow_data["connections"]
+            result = await asyncio.wait_for(
+                execute_workflow_internal(
+                    sub_workflow_request,
+                    initial_input_data=sub_input,
+                    plan=sub_workflow_plan
                 ),
-                initial_input_data=sub_input
+                timeout
             )
             return {
                 "success": result.success,
                 "result": result.result,
-                "item": item,
                 "index": idx,
                 "error": result.error if not result.success else None
             }
+        except asyncio.TimeoutError:
+            logger.error(f"⏰ Subworkflow for {unit} {idx} timed out after {timeout} s")
+            if not skip_errors:
+                raise Exception(f"Loop node: subworkflow for {unit} {idx} timed out after {timeout} s")
+            return {
+                "success": False,
+                "result": None,
+                "index": idx,
+                "error": f"Timed out after {timeout} s"
+            }
         except Exception as e:
-            logger.error(f"❌ Error in subworkflow for item {idx}: {str(e)}")
+            logger.error(f"❌ Error in subworkflow for {unit} {idx}: {str(e)}")
             if not skip_errors:
                 raise
             return {
                 "success": False,
                 "result": None,
-                "item": item,
                 "index": idx,
                 "error": str(e)
             }
+
+    async def run_subworkflow(item, idx):
+        item_result = await invoke_subworkflow(build_item_input(item, idx), idx, "item")
+        item_result["item"] = item
+        return item_result
+
+    async def run_batch(batch, batch_idx):
+        # Один запуск суб-воркфлоу на весь батч: накладные расходы движка делятся на batchSize элементов
+        start_idx = batch_idx * batch_size
+        sub_input = {
+            "items": [
+                item if not item_input_template else build_item_input(item, start_idx + offset)
+                for offset, item in enumerate(batch)
+            ],
+            "batch_index": batch_idx,
+            "start_index": start_idx,
+        }
+        batch_result = await invoke_subworkflow(sub_input, batch_idx, "batch")
+        batch_result["start_index"] = start_idx
+        batch_result["count"] = len(batch)
+        return batch_result
+
+    # Параллельный режим: лимит фиксирован (maxConcurrent) или подстраивается под задержку и ошибки
+    # суб-воркфлоу (adaptiveConcurrency, в пределах minConcurrent..maxConcurrent)
+    limiter = limiter_from_config(config, default_max=max_concurrent) if execution_mode == "parallel" else None
+    ledger = await _open_ledger(node, config, sub_workflow_id, label_to_id_map, input_data, all_results)
+    ledger_field = config.get('ledgerResultField', config.get('reducerField', '') if streaming else '')
+    execute_unit = run_batch if batch_invocation else run_subworkflow
+
+    async def run_unit(unit, idx):
+        # Элементы из журнала не запускаются и не проходят через лимитер (не искажают его задержки)
+        item_key = ledger.item_key(unit, idx) if ledger else None
+        if ledger:
+            found, stored = ledger.lookup(item_key)
+            if found:
+                unit_result = {"success": True, "result": stored, "index": idx, "error": None, "from_ledger": True}
+                if batch_invocation:
+                    unit_result.update({"start_index": idx * batch_size, "count": len(unit)})
+                else:
+                    unit_result["item"] = unit
+                return unit_result
+
+        if limiter:
+            unit_result = await limiter.run(execute_unit(unit, idx), is_success=lambda r: r.get('success'))
+        else:
+            unit_result = await execute_unit(unit, idx)
+
+        if ledger and unit_result.get('success'):
+            await ledger.record(item_key, idx, _compact_result(unit_result.get('result'), ledger_field, sub_workflow_plan.label_to_id_map))
+        return unit_result
+
+    loop_failed = False
+    try:
+        if streaming:
+            items = iterate_jsonl_file(items_file) if items_file else iterate_list(array)
+            if batch_invocation:
+                items = iterate_batches(items, batch_size)
+            reducer = create_reducer(config, sub_workflow_plan.label_to_id_map)
+            try:
+                processed = await _run_streaming(items, run_unit, reducer, limiter.max_limit if limiter else 1)
+            finally:
+                reducer.close()
+            aggregate = reducer.finish()
+
+            # В пакетном режиме редьюсер получает результаты батчей, а не отдельных элементов
+            execution_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+            unit_name = "batches" if batch_invocation else "items"
+            return {
+                "aggregate": aggregate,
+                "errors": reducer.errors,
+                "summary": {
+                    "total": processed,
+                    "executed": processed,
+                    "unit": unit_name,
+                    "success_count": reducer.success_count,
+                    "error_count": reducer.error_count,
+                    "execution_mode": execution_mode,
+                    "reducer": config.get('reducer', 'count'),
+                    "concurrency": limiter.snapshot() if limiter else None,
+                    "ledger": ledger.snapshot() if ledger else None,
+                    "execution_time_ms": execution_time_ms
+                },
+                "output": {
+                    "text": f"Processed {processed} {unit_name} with {reducer.success_count} successes and {reducer.error_count} errors",
+                    "json": aggregate
+                }
+            }
+
+        if batch_invocation:
+            return await _run_batch_invocation(array, batch_size, execution_mode, run_unit, skip_errors, limiter, ledger, start_time)
+
+        results = []
     
-    results = []
-    
-    if batch_size > 0 and len(array) > batch_size:
-        batches = [array[i:i+batch_size] for i in range(0, len(array), batch_size)]
-        logger.info(f"🔢 Processing array in {len(batches)} batches of size {batch_size}")
+        if batch_size > 0 and len(array) > batch_size:
+            batches = [array[i:i+batch_size] for i in range(0, len(array), batch_size)]
+            logger.info(f"🔢 Processing array in {len(batches)} batches of size {batch_size}")
         
-        all_results = []
-        for batch_idx, batch in enumerate(batches):
-            logger.info(f"📦 Processing batch {batch_idx+1}/{len(batches)}")
-            batch_results = []
+            all_results = []
+            for batch_idx, batch in enumerate(batches):
+                logger.info(f"📦 Processing batch {batch_idx+1}/{len(batches)}")
+                batch_results = []
             
-            if execution_mode == "parallel":
-                import asyncio
-                semaphore = asyncio.Semaphore(max_concurrent)
-                
-                async def limited_run(item, global_idx):
-                    async with semaphore:
-                        return await run_subworkflow(item, global_idx)
-                
-                start_idx = batch_idx * batch_size
-                tasks = [limited_run(item, start_idx + idx) for idx, item in enumerate(batch)]
-                batch_results = await asyncio.gather(*tasks, return_exceptions=skip_errors)
-            else:
-                start_idx = batch_idx * batch_size
-                for idx, item in enumerate(batch):
-                    global_idx = start_idx + idx
-                    batch_results.append(await run_subworkflow(item, global_idx))
+                if execution_mode == "parallel":
+                    start_idx = batch_idx * batch_size
+                    tasks = [run_unit(item, start_idx + idx) for idx, item in enumerate(batch)]
+                    batch_results = await asyncio.gather(*tasks, return_exceptions=skip_errors)
+                else:
+                    start_idx = batch_idx * batch_size
+                    for idx, item in enumerate(batch):
+                        global_idx = start_idx + idx
+                        batch_results.append(await run_unit(item, global_idx))
             
-            all_results.extend(batch_results)
+                all_results.extend(batch_results)
         
-        results = all_results
-    else:
-        if execution_mode == "parallel":
-            import asyncio
-            semaphore = asyncio.Semaphore(max_concurrent)
-            
-            async def limited_run(item, idx):
-                async with semaphore:
-                    return await run_subworkflow(item, idx)
-            
-            tasks = [limited_run(item, idx) for idx, item in enumerate(array)]
-            results = await asyncio.gather(*tasks, return_exceptions=skip_errors)
-            
-            if not skip_errors:
-                for result in results:
-                    if isinstance(result, Exception):
-                        raise result
+            results = all_results
         else:
-            for idx, item in enumerate(array):
-                results.append(await run_subworkflow(item, idx))
+            if execution_mode == "parallel":
+                tasks = [run_unit(item, idx) for idx, item in enumerate(array)]
+                results = await asyncio.gather(*tasks, return_exceptions=skip_errors)
+            
+                if not skip_errors:
+                    for result in results:
+                        if isinstance(result, Exception):
+                            raise result
+            else:
+                for idx, item in enumerate(array):
+                    results.append(await run_unit(item, idx))
     
-    execution_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
-    success_count = sum(1 for r in results if r.get('success', True))
-    error_count = len(results) - success_count
+        execution_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+        success_count = sum(1 for r in results if r.get('success', True))
+        error_count = len(results) - success_count
     
+        return {
+            "results": results,
+            "summary": {
+                "total": len(array),
+                "executed": len(results),
+                "success_count": success_count,
+                "error_count": error_count,
+                "execution_mode": execution_mode,
+                "concurrency": limiter.snapshot() if limiter else None,
+                "ledger": ledger.snapshot() if ledger else None,
+                "execution_time_ms": execution_time_ms
+            },
+            "output": {
+                "text": f"Processed {len(array)} items with {success_count} successes and {error_count} errors",
+                "json": results
+            }
+        }
+    except BaseException:
+        loop_failed = True
+        raise
+    finally:
+        if ledger:
+            if loop_failed:
+                # Буфер журнала дописывается при падении цикла - возобновленный запуск продолжит с этого места
+                await ledger.flush()
+            else:
+                await ledger.clear()
+
+
+async def _run_batch_invocation(array: list, batch_size: int, execution_mode: str, run_unit, skip_errors: bool, limiter, ledger, start_time: datetime) -> Dict[str, Any]:
+    """Пакетный режим: один запуск суб-воркфлоу на батч, вход суб-воркфлоу - {"items": [...]}."""
+    batches = [array[i:i+batch_size] for i in range(0, len(array), batch_size)]
+    logger.info(f"📦 Loop node: {len(array)} items in {len(batches)} batch invocations of size {batch_size}")
+
+    if execution_mode == "parallel":
+        results = await asyncio.gather(
+            *(run_unit(batch, batch_idx) for batch_idx, batch in enumerate(batches)),
+            return_exceptions=skip_errors
+        )
+        results = [
+            r if not isinstance(r, Exception) else {"success": False, "result": None, "index": batch_idx, "error": str(r),
+                                                    "start_index": batch_idx * batch_size, "count": len(batches[batch_idx])}
+            for batch_idx, r in enumerate(results)
+        ]
+    else:
+        results = [await run_unit(batch, batch_idx) for batch_idx, batch in enumerate(batches)]
+
+    execution_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+    success_count = sum(r['count'] for r in results if r.get('success'))
+    error_count = len(array) - success_count
+    failed_batches = sum(1 for r in results if not r.get('success'))
+
     return {
         "results": results,
         "summary": {
             "total": len(array),
-            "executed": len(results),
+            "executed": len(array),
+            "batches": len(batches),
+            "failed_batches": failed_batches,
+            "batch_size": batch_size,
             "success_count": success_count,
             "error_count": error_count,
             "execution_mode": execution_mode,
+            "concurrency": limiter.snapshot() if limiter else None,
+            "ledger": ledger.snapshot() if ledger else None,
             "execution_time_ms": execution_time_ms
         },
         "output": {
-            "text": f"Processed {len(array)} items with {success_count} successes and {error_count} errors",
+            "text": f"Processed {len(array)} items in {len(batches)} batches with {success_count} successes and {error_count} errors",
             "json": results
         }
     }
+
+
+async def _run_streaming(items, run_unit, reducer, window: int) -> int:
+    """
+    Потоковый режим: элементы берутся из асинхронного итератора, одновременно выполняется
+    не больше window суб-воркфлоу, результат каждого сразу передается редьюсеру и отбрасывается.
+    """
+    in_flight = set()
+    processed = 0
+
+    async def collect():
+        nonlocal processed
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            in_flight.discard(task)
+            item_result = task.result()
+            item_result.pop('item', None)
+            reducer.add(item_result)
+            processed += 1
+
+    try:
+        idx = 0
+        async for item in items:
+            if len(in_flight) >= window:
+                await collect()
+            in_flight.add(asyncio.create_task(run_unit(item, idx)))
+            idx += 1
+        while in_flight:
+            await collect()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+    return processed
+
+
+async def _open_ledger(node: Node, config: Dict[str, Any], sub_workflow_id: str, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any]):
+    """
+    Журнал выполненных элементов (config.resumable). Ключ журнала - ledgerKey (поддерживает шаблоны),
+    по умолчанию ID верхнего запуска, ноды и суб-воркфлоу: журнал видит только возобновление того же запуска.
+    Элементы различаются по хэшу содержимого или по индексу (ledgerKeyBy).
+    """
+    if not config.get('resumable'):
+        return None
+    if not storage.db_pool:
+        logger.warning("⚠️ Loop node: resumable требует Postgres, журнал элементов отключен")
+        return None
+    ledger_key = config.get('ledgerKey') or f"{current_run_id.get() or 'local'}:{node.id}:{sub_workflow_id}"
+    if '{{' in ledger_key:
+        ledger_key = replace_templates(ledger_key, input_data, label_to_id_map, all_results)
+    ledger = LoopLedger(ledger_key, key_by=config.get('ledgerKeyBy', 'hash'))
+    await ledger.load()
+    return ledger
+
+
+def _compact_result(result: Any, field_path: str, label_to_id_map: Dict[str, str]) -> Any:
+    """
+    Оставляет в результате суб-воркфлоу только поле field_path, сохраняя путь к нему,
+    чтобы редьюсеры читали результат из журнала так же, как полный.
+    """
+    if not field_path or not isinstance(result, dict):
+        return result
+    value = get_result_field(result, field_path, label_to_id_map)
+    parts = field_path.split('.')
+    compact: Any = value
+    for key in reversed(parts[1:]):
+        compact = {key: compact}
+    return {label_to_id_map.get(parts[0], parts[0]): compact}
+
+
+def _resolve_input_array(array_path: str, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any], log_data: bool = True) -> list:
+    """Находит массив элементов цикла по inputArrayPath (в результатах нод или во входных данных)."""
+    if log_data:
+        logger.info(f"🔍 Loop node input data: {json.dumps(input_data, ensure_ascii=False)}")
+    logger.info(f"🔍 Looking for array at path: {array_path}")
+    logger.info(f"🔍 Label to ID map: {label_to_id_map}")
+    
+    path_parts = array_path.split('.')
+    first_part = path_parts[0]
+    if first_part in label_to_id_map:
+        node_id = label_to_id_map[first_part]
+        logger.info(f"🔄 Replacing label '{first_part}' with node ID '{node_id}'")
+        path_parts[0] = node_id
+        array_path = '.'.join(path_parts)
+        logger.info(f"🔄 New path: {array_path}")
+    
+    def get_by_path(data, path):
+        for part in path.split('.'):
+            if isinstance(data, dict):
+                data = data.get(part)
+            else:
+                return None
+        return data
+    
+    # Сначала ищем идентификатор ноды в глобальных результатах
+    node_id = label_to_id_map.get(array_path.split('.')[0])
+    if node_id and node_id in all_results:
+        data_source = all_results
+        path_to_value = f"{node_id}.{'.'.join(array_path.split('.')[1:])}"
+    else:
+        data_source = input_data
+        path_to_value = array_path
+
+    array = get_by_path(data_source, path_to_value)
+    if array is None and isinstance(input_data, dict) and 'json' in input_data and isinstance(input_data['json'], list):
+        logger.info(f"⚠️ Data not found at '{array_path}', but found a list in the 'json' field of the input. Using that instead.")
+        array = input_data['json']
+    
+    if array is not None:
+        if log_data:
+            logger.info(f"✅ Found data at path '{array_path}': {json.dumps(array, ensure_ascii=False)}")
+    else:
+        logger.error(f"❌ No data found at path '{array_path}'")
+        raise Exception(f"Loop node: no data found at path '{array_path}'")
+    
+    if not isinstance(array, list):
+        raise Exception(f"Loop node: input at path '{array_path}' is not a list")
+
+    return array
@@ -5,7 +5,7 @@ import ast
 from typing import Dict, Any
 
 from scripts.models.schemas import Node
-from scripts.utils.template_engine import replace_templates
+from scripts.utils.template_engine import replace_templates, render_structured
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +28,11 @@ async def execute_mcp_connector(node: Node, label_to_id_map: Dict[str, str], inp
     session_id = replace_templates(session_id_template, input_data, label_to_id_map, all_results)
     method = replace_templates(method_template, input_data, label_to_id_map, all_results)
     
-    params_obj = replace_templates(params_template, input_data, label_to_id_map, all_results)
+    try:
+        # JSON-шаблон рендерится сразу в объект, без сериализации и повторного парсинга
+        params_obj = render_structured(params_template, input_data, label_to_id_map, all_results)
+    except ValueError:
+        params_obj = replace_templates(params_template, input_data, label_to_id_map, all_results)
 
     if not server_url or not method:
         raise Exception("MCP Connector: 'Server URL' and 'JSON-RPC Method' are required.")
@@ -36,7 +40,8 @@ async def execute_mcp_connector(node: Node, label_to_id_map: Dict[str, str], inp
     # --- НОВЫЙ, НАДЕЖНЫЙ ПАРСИНГ ---
     final_params = {}
     if isinstance(params_obj, dict):
-        final_params = params_obj
+        # Копия: объект мог прийти целиком из результата другой ноды, а ниже в него добавляется sessionId
+        final_params = dict(params_obj)
     elif isinstance(params_obj, str):
         try:
             # Сначала пытаемся стандартным способом
@@ -6,11 +6,15 @@ from datetime import datetime
 from typing import Dict, Any
 
 from scripts.models.schemas import Node
-from scripts.utils.template_engine import replace_templates
+from scripts.utils.template_engine import replace_templates, render_structured, render_structured_batch
 from scripts.utils.http_client import make_single_http_request
+from scripts.utils.adaptive_limiter import limiter_from_config
 
 logger = logging.getLogger(__name__)
 
+# Верхняя граница параллельных запросов, если maxConcurrent не задан в конфиге
+DEFAULT_MAX_CONCURRENT = 32
+
 async def execute_request_iterator(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Dict[str, Any]:
     """
     Выполнение Request Iterator ноды в соответствии с "Принципом Единого Результата".
@@ -25,21 +29,38 @@ async def execute_request_iterator(node: Node, label_to_id_map: Dict[str, str],
         raise Exception("Request Iterator: 'jsonInput' template is not configured in the node settings.")
 
     logger.info(f"📄 Input template for Request Iterator: {json_input_template}")
-    requests_to_make_json_str = replace_templates(json_input_template, input_data, label_to_id_map, all_results)
-
-    if not requests_to_make_json_str or requests_to_make_json_str == json_input_template:
-        logger.warning(f"Template '{json_input_template}' could not be resolved or resulted in an empty string. Assuming empty list of requests.")
-        requests_to_make_json_str = "[]"
-
     try:
-        requests_list = json.loads(requests_to_make_json_str)
-        if not isinstance(requests_list, list):
-            if isinstance(requests_list, dict):
-                requests_list = [requests_list]
-            else:
-                raise ValueError("Parsed JSON is not a list or a single request object.")
-    except (json.JSONDecodeError, ValueError) as e:
-        raise Exception(f"Request Iterator: Invalid JSON input after template replacement. Error: {str(e)}")
+        # JSON-шаблон (например, {{Node.json}}) рендерится сразу в список, без json.dumps/json.loads
+        requests_list = render_structured(json_input_template, input_data, label_to_id_map, all_results)
+        if requests_list is None or requests_list == "":
+            logger.warning(f"Template '{json_input_template}' could not be resolved or resulted in an empty value. Assuming empty list of requests.")
+            requests_list = []
+    except ValueError:
+        requests_to_make_json_str = replace_templates(json_input_template, input_data, label_to_id_map, all_results)
+
+        if not requests_to_make_json_str or requests_to_make_json_str == json_input_template:
+            logger.warning(f"Template '{json_input_template}' could not be resolved or resulted in an empty string. Assuming empty list of requests.")
+            requests_to_make_json_str = "[]"
+
+        try:
+            requests_list = json.loads(requests_to_make_json_str)
+        except json.JSONDecodeError as e:
+            raise Exception(f"Request Iterator: Invalid JSON input after template replacement. Error: {str(e)}")
+
+    if not isinstance(requests_list, list):
+        if isinstance(requests_list, dict):
+            requests_list = [requests_list]
+        else:
+            raise Exception("Request Iterator: Invalid JSON input after template replacement. Error: Parsed JSON is not a list or a single request object.")
+
+    # requestTemplate: jsonInput дает список элементов, а запрос для каждого строится шаблоном {{input.item...}}
+    request_template = config.get('requestTemplate')
+    if request_template and requests_list:
+        contexts = [{"item": item, "index": idx} for idx, item in enumerate(requests_list)]
+        try:
+            requests_list = render_structured_batch(request_template, contexts, label_to_id_map, all_results)
+        except ValueError as e:
+            raise Exception(f"Request Iterator: requestTemplate could not be rendered as JSON: {e}")
 
     if not requests_list:
         logger.info("Request Iterator: No requests to process from input.")
@@ -113,8 +134,14 @@ async def execute_request_iterator(node: Node, label_to_id_map: Dict[str, str],
             )
             tasks.append(task)
 
+        limiter = None
         if execution_mode == 'parallel' and tasks:
-            all_responses = await asyncio.gather(*tasks, return_exceptions=True)
+            # Параллелизм подстраивается под задержку и ошибки сервиса (minConcurrent..maxConcurrent)
+            limiter = limiter_from_config(config, default_max=DEFAULT_MAX_CONCURRENT, adaptive_default=True)
+            all_responses.extend(await asyncio.gather(
+                *(limiter.run(task, is_success=lambda r: r.get('success')) for task in tasks),
+                return_exceptions=True
+            ))
         elif tasks:
             for task_coro in tasks:
                 all_responses.append(await task_coro)
@@ -136,6 +163,7 @@ async def execute_request_iterator(node: Node, label_to_id_map: Dict[str, str],
             "executed_requests_count": len(final_responses_list),
             "successful_requests_count": successful_count,
             "failed_requests_count": failed_count,
+            "concurrency": limiter.snapshot() if limiter else None,
         },
         "inputs": {
             "baseUrl": base_url,
@@ -0,0 +1,30 @@
+import logging
+from typing import Dict, Any, Optional
+
+from scripts.models.schemas import Node
+from scripts.core.conditions import CompiledSwitch
+
+logger = logging.getLogger(__name__)
+
+async def execute_switch(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any], condition: Optional[CompiledSwitch] = None) -> Dict[str, Any]:
+    """
+    Выполнение Switch ноды: выбирает один из N выходов по значению поля.
+    Исходящие связи помечаются метками выходов (как 'true'/'false' у If/Else), ':goto' поддерживается.
+    """
+    if condition is None:
+        condition = CompiledSwitch(node.data.get('config', {}), label_to_id_map)
+
+    branch, actual_value, matched = condition.route(input_data, all_results)
+    logger.info(f"🔀 Switch {node.id}: {condition.field_path} = {actual_value!r} -> ветка '{branch}'{'' if matched else ' (по умолчанию)'}")
+
+    return {
+        **input_data,
+        'success': True,
+        'branch': branch,
+        'switch_result': {
+            'matched': matched,
+            'checked_value': str(actual_value),
+            'field_path': condition.field_path,
+            'node_id': node.id
+        }
+    }
@@ -6,7 +6,7 @@ from datetime import datetime
 from typing import Dict, Any
 
 from scripts.models.schemas import Node
-from scripts.utils.template_engine import replace_templates
+from scripts.utils.template_engine import replace_templates, render_structured
 
 logger = logging.getLogger(__name__)
 
@@ -38,9 +38,20 @@ async def execute_webhook(node: Node, label_to_id_map: Dict[str, str], input_dat
         
         payload = None
         if method in ['POST', 'PUT', 'PATCH']:
-            resolved_body_obj = replace_templates(body_template, input_data, label_to_id_map, all_results)
+            is_structured = True
+            try:
+                # JSON-шаблон рендерится сразу в объект, без сериализации и повторного парсинга
+                resolved_body_obj = render_structured(body_template, input_data, label_to_id_map, all_results)
+            except ValueError:
+                is_structured = False
+            if is_structured and isinstance(resolved_body_obj, str):
+                # Строка (например, repr словаря из {{Node.text}}) разбирается как раньше: json, затем ast
+                is_structured = False
+            if not is_structured:
+                resolved_body_obj = replace_templates(body_template, input_data, label_to_id_map, all_results)
             
-            if isinstance(resolved_body_obj, dict):
+            if is_structured:
+                # Объект, массив или скаляр шаблона уже готов к отправке
                 payload = resolved_body_obj
             elif isinstance(resolved_body_obj, str) and resolved_body_obj.strip():
                 try:
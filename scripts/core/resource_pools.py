@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Deque, Optional
+from urllib.parse import urlparse
+
+from scripts.models.schemas import Node
+from scripts.utils.template_engine import replace_templates
+
+logger = logging.getLogger(__name__)
+
+# Пулы ресурсов ограничивают одновременные вызовы одного типа ноды или одного сервиса во всех запусках процесса.
+# Формат: NODE_RESOURCE_POOLS="gigachat=8,mcp_connector@localhost:8002=16"
+# Ключ "тип@хост" действует на ноды этого типа, обращающиеся к хосту; ключ "тип" - на остальные ноды типа.
+NODE_RESOURCE_POOLS = os.getenv("NODE_RESOURCE_POOLS", "")
+
+# Поля конфига, из которых берется целевой хост ноды
+NODE_URL_FIELDS = {
+    'webhook': 'url',
+    'mcp_connector': 'mcp_server_url',
+    'request_iterator': 'baseUrl',
+}
+
+
+class ResourcePool:
+    """Пул слотов со строгой очередью FIFO: освободившийся слот передается первому ожидающему."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.in_use = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.acquired = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+        else:
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            self.max_queued = max(self.max_queued, len(self._waiters))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Слот уже передан этой задаче - отдаем его следующему
+                    self.release()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+
+        waited = loop.time() - started_at
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "acquired": self.acquired,
+            "avg_wait_ms": int(self.total_wait / self.acquired * 1000) if self.acquired else 0,
+            "max_wait_ms": int(self.max_wait * 1000),
+        }
+
+
+def parse_pool_config(value: str) -> Dict[str, ResourcePool]:
+    """Разбирает строку вида "gigachat=8,mcp_connector@localhost:8002=16"."""
+    pools: Dict[str, ResourcePool] = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, limit = entry.rpartition('=')
+        try:
+            pools[name.strip()] = ResourcePool(name.strip(), int(limit))
+        except ValueError:
+            logger.warning(f"⚠️ Некорректная запись пула ресурсов: '{entry}' (ожидается имя=лимит)")
+    return pools
+
+
+resource_pools: Dict[str, ResourcePool] = parse_pool_config(NODE_RESOURCE_POOLS)
+# Типы нод, для которых есть пулы по хосту (только для них вычисляется URL)
+_host_pool_types = {name.split('@', 1)[0] for name in resource_pools if '@' in name}
+if resource_pools:
+    logger.info(f"🚦 Пулы ресурсов нод: {', '.join(f'{p.name}={p.limit}' for p in resource_pools.values())}")
+
+
+def _node_host(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Optional[str]:
+    url = node.data.get('config', {}).get(NODE_URL_FIELDS.get(node.type, 'url'), '')
+    if not url:
+        return None
+    if '{{' in url:
+        url = replace_templates(url, input_data, label_to_id_map, all_results)
+    return urlparse(url).netloc or None
+
+
+def get_node_pool(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any]) -> Optional[ResourcePool]:
+    """Пул для ноды: сначала "тип@хост", затем "тип"; None, если пул не настроен."""
+    if not resource_pools:
+        return None
+    if node.type in _host_pool_types:
+        host = _node_host(node, label_to_id_map, input_data, all_results)
+        if host and f"{node.type}@{host}" in resource_pools:
+            return resource_pools[f"{node.type}@{host}"]
+    return resource_pools.get(node.type)
+
+
+def resource_pool_metrics() -> Dict[str, Any]:
+    return {name: pool.snapshot() for name, pool in resource_pools.items()}
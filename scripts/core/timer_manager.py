@@ -1,11 +1,11 @@
 import asyncio
 import logging
-import json
 from datetime import datetime, timedelta
 from typing import Dict, Any
 
-from scripts.models.schemas import WorkflowExecuteRequest
 from scripts.services.storage import get_workflow_by_id
+from scripts.services.run_queue import enqueue_workflow_run
+from scripts.core.execution_plan import get_workflow_plan
 
 logger = logging.getLogger(__name__)
 
@@ -63,33 +63,15 @@ async def timer_task(timer_id: str, node_id: str, interval: int, workflow_info:
 
             try:
                 workflow_id = workflow_info.get("workflow_id")
-                workflow_exists = await get_workflow_by_id(workflow_id)
-                if not workflow_id or not workflow_exists:
+                workflow_data_raw = await get_workflow_by_id(workflow_id) if workflow_id else None
+                if not workflow_data_raw:
                     logger.error(f"❌ Workflow с ID '{workflow_id}' не найден. Таймер {timer_id} не может запустить выполнение.")
                     continue
 
-                logger.info(f"🚀 Таймер {timer_id} запускает workflow '{workflow_id}'")
-
-                workflow_data_raw = await get_workflow_by_id(workflow_id)
-                workflow_data = dict(workflow_data_raw)
-                nodes = json.loads(workflow_data.get('nodes', '[]'))
-                connections = json.loads(workflow_data.get('connections', '[]'))
-
-                from scripts.core.workflow_engine import execute_workflow_internal
-                workflow_request = WorkflowExecuteRequest(
-                    nodes=nodes,
-                    connections=connections,
-                    startNodeId=node_id
-                )
-
-                start_time = datetime.now()
-                result = await execute_workflow_internal(workflow_request)
-                execution_time = (datetime.now() - start_time).total_seconds()
-
-                if result.success:
-                    logger.info(f"✅ Workflow '{workflow_id}' выполнен за {execution_time:.2f} секунд")
-                else:
-                    logger.error(f"❌ Ошибка выполнения workflow '{workflow_id}' таймером {timer_id}: {result.error}")
+                # Таймер только ставит запуск в очередь, выполняют его воркеры (scripts/engine_worker.py)
+                run_id = await enqueue_workflow_run(workflow_id, start_node_id=node_id)
+                active_timers[timer_id]["last_run_id"] = run_id
+                logger.info(f"🚀 Таймер {timer_id} поставил в очередь запуск {run_id} workflow '{workflow_id}'")
 
             except Exception as e:
                 logger.error(f"❌ Критическая ошибка при выполнении workflow таймером {timer_id}: {str(e)}")
@@ -127,14 +109,8 @@ async def execute_timer_now_by_id(timer_id: str):
     if not workflow_data_raw:
         raise Exception(f"Workflow {workflow_id} not found")
 
-    workflow_data = dict(workflow_data_raw)
-    nodes = json.loads(workflow_data.get('nodes', '[]'))
-    connections = json.loads(workflow_data.get('connections', '[]'))
+    plan = get_workflow_plan(dict(workflow_data_raw))
 
     from scripts.core.workflow_engine import execute_workflow_internal
-    workflow_request = WorkflowExecuteRequest(
-        nodes=nodes,
-        connections=connections,
-        startNodeId=node_id
-    )
-    return await execute_workflow_internal(workflow_request)
\ No newline at end of file
+    workflow_request = plan.to_request(start_node_id=node_id)
+    return await execute_workflow_internal(workflow_request, plan=plan)
\ No newline at end of file
@@ -1,23 +1,20 @@
 import logging
 import asyncio
+import os
+import uuid
+from collections import deque, OrderedDict
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional, Deque
 
 from scripts.models.schemas import WorkflowExecuteRequest, ExecutionResult, Node
-from scripts.services.giga_chat import GigaChatAPI
-from scripts.core.node_executors.gigachat import execute_gigachat
-from scripts.core.node_executors.webhook import execute_webhook
-from scripts.core.node_executors.request_iterator import execute_request_iterator
-from scripts.core.node_executors.if_else import execute_if_else
-from scripts.core.node_executors.dispatcher import execute_dispatcher
-from scripts.core.node_executors.loop import execute_loop
-from scripts.core.node_executors.join import execute_join
-from scripts.core.node_executors.timer import execute_timer
-from scripts.core.node_executors.webhook_trigger import execute_webhook_trigger
-from scripts.core.node_executors.email import execute_email
-from scripts.core.node_executors.database import execute_database
-from scripts.core.node_executors.mcp_connector import execute_mcp_connector # <--- ДОБАВИТЬ ЭТОТ ИМПОРТ
-from scripts.core.node_executors.filesystem import execute_filesystem # <--- ДОБАВИТЬ ЭТОТ ИМПОРТ
+from scripts.services.checkpoints import create_checkpoint, save_checkpoint, finish_checkpoint, load_checkpoint
+from scripts.services.run_queue import get_workflow_run
+from scripts.core import node_cache
+from scripts.core.execution_plan import ExecutionPlan, BRANCHING_NODE_TYPES, DEFAULT_MAX_GOTO_ITERATIONS
+from scripts.core.executor_registry import get_executor_spec, available_node_types
+from scripts.core.resource_pools import get_node_pool
+from scripts.core.execution_events import open_run, close_run, publish_event
 
 logger = logging.getLogger(__name__)
 
@@ -33,150 +30,640 @@ def clear_node_results(node_ids: List[str]):
         if node_id in node_results:
             del node_results[node_id]
 
-gigachat_api = GigaChatAPI()
+# Лимит нод, одновременно выполняемых в рамках одного запуска (если не задан в запросе)
+DEFAULT_RUN_CONCURRENCY = int(os.getenv("WORKFLOW_RUN_CONCURRENCY", "8"))
+# Глобальный лимит нод, одновременно выполняемых во всех запусках процесса
+MAX_CONCURRENT_NODES = int(os.getenv("WORKFLOW_MAX_CONCURRENT_NODES", "64"))
+_global_node_semaphore = asyncio.Semaphore(MAX_CONCURRENT_NODES)
 
-async def execute_workflow_internal(
-    request: WorkflowExecuteRequest,
-    initial_input_data: Dict[str, Any] = None
-) -> ExecutionResult:
-    nodes = {node.id: node for node in request.nodes}
-    connections = request.connections
-    start_node_id = request.startNodeId
+# Ноды, запускающие суб-воркфлоу, не занимают глобальный слот:
+# иначе родитель, ожидающий дочерние запуски, может заблокировать их навсегда
+SUBWORKFLOW_NODE_TYPES = {'loop', 'dispatcher'}
 
-    if not start_node_id:
-        # Find a start node (a node with no incoming connections)
-        target_nodes = {c.target for c in connections}
-        start_nodes = [n for n in request.nodes if n.id not in target_nodes]
-        if not start_nodes:
-            return ExecutionResult(success=False, error="No start node found")
-        start_node_id = start_nodes[0].id
-
-    execution_queue: List[Tuple[str, Dict[str, Any]]] = [(start_node_id, initial_input_data or {})]
-    executed_nodes = set()
-    all_results: Dict[str, Any] = {}
-    logs: List[Dict[str, Any]] = []
-
-    label_to_id_map = {node.data.get('label', node.id): node.id for node in request.nodes}
-    goto_counts: Dict[str, int] = {}
-
-    while execution_queue:
-        node_id, input_data = execution_queue.pop(0)
-
-        if node_id in executed_nodes:
-            continue
-
-        node = nodes.get(node_id)
-        if not node:
-            continue
-
-        # Special handling for Join node
-        if node.type == 'join':
-            join_inputs = {}
-            for conn in connections:
-                if conn.target == node.id and conn.source in all_results:
-                    join_inputs[conn.source] = all_results[conn.source]
-            input_data = {'inputs': join_inputs} # Overwrite input_data for join node
+# Абсолютный дедлайн (loop.time()) текущего запуска. Задачи нод наследуют контекст,
+# поэтому суб-воркфлоу из loop/dispatcher не могут пережить дедлайн родителя.
+_current_deadline: ContextVar[Optional[float]] = ContextVar('workflow_run_deadline', default=None)
 
-        logger.info(f"Executing node {node.id} ({node.type}) with input: {input_data}")
-        logs.append({
+# Выполняющиеся запуски: run_id -> состояние, используется для отмены
+active_runs: Dict[str, "_WorkflowRun"] = {}
+
+# Результаты последних запусков из редактора: run_id -> all_results (для инкрементального перезапуска)
+RECENT_RUNS_LIMIT = int(os.getenv("WORKFLOW_RECENT_RUNS_LIMIT", "50"))
+recent_run_results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def remember_run_results(run_id: str, results: Optional[Dict[str, Any]], complete: bool = True):
+    """
+    Запоминает результаты запуска, чтобы следующий запуск мог переиспользовать их (previousRunId).
+    Неполные результаты (resultMode='outputs' освобождает промежуточные) базой для инкрементального запуска не служат.
+    """
+    if not run_id or results is None:
+        return
+    if not complete:
+        recent_run_results.pop(run_id, None)
+        return
+    recent_run_results[run_id] = results
+    recent_run_results.move_to_end(run_id)
+    while len(recent_run_results) > RECENT_RUNS_LIMIT:
+        recent_run_results.popitem(last=False)
+
+async def _load_previous_results(run_id: str) -> Dict[str, Any]:
+    """Ищет результаты прошлого запуска: в памяти процесса, в чекпоинтах, в очереди запусков."""
+    if run_id in recent_run_results:
+        return recent_run_results[run_id]
+    checkpoint = await load_checkpoint(run_id)
+    if checkpoint:
+        return checkpoint['results']
+    run = await get_workflow_run(run_id)
+    if run and isinstance(run.get('result'), dict):
+        return run['result'].get('result') or {}
+    raise Exception(f"Results of previous run {run_id} not found")
+
+def cancel_workflow_run(run_id: str, reason: str = "Run cancelled") -> bool:
+    """Отменяет выполняющийся запуск. Отмена распространяется на ноды, HTTP-запросы и суб-воркфлоу."""
+    run = active_runs.get(run_id)
+    if not run:
+        return False
+    run.cancel(reason)
+    return True
+
+async def _invoke_executor(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any], plan: Optional[ExecutionPlan] = None) -> Dict[str, Any]:
+    spec = get_executor_spec(node.type)
+    if not spec:
+        raise Exception(f"No executor for node type {node.type}. Available: {', '.join(available_node_types())}")
+    # Исполнитель получает по имени только объявленные аргументы и сервисы (gigachat_api и т.п.);
+    # условие ветвящейся ноды скомпилировано в плане один раз на версию workflow
+    return await spec.invoke(
+        node=node,
+        label_to_id_map=label_to_id_map,
+        input_data=input_data,
+        all_results=all_results,
+        condition=plan.conditions.get(node.id) if plan else None,
+        plan=plan,
+    )
+
+async def _invoke_in_slot(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any], plan: Optional[ExecutionPlan] = None) -> Dict[str, Any]:
+    if node.type in SUBWORKFLOW_NODE_TYPES:
+        return await _invoke_executor(node, label_to_id_map, input_data, all_results, plan)
+    # Слот пула берется до глобального: нода в очереди пула не занимает глобальный слот
+    pool = get_node_pool(node, label_to_id_map, input_data, all_results)
+    if pool:
+        async with pool.slot():
+            async with _global_node_semaphore:
+                return await _invoke_executor(node, label_to_id_map, input_data, all_results, plan)
+    async with _global_node_semaphore:
+        return await _invoke_executor(node, label_to_id_map, input_data, all_results, plan)
+
+async def _run_node(node: Node, label_to_id_map: Dict[str, str], input_data: Dict[str, Any], all_results: Dict[str, Any], plan: Optional[ExecutionPlan] = None) -> Dict[str, Any]:
+    """
+    Выполняет одну ноду с учетом пула ресурсов ее типа/хоста (NODE_RESOURCE_POOLS),
+    глобального лимита параллелизма, таймаута ноды (timeoutMs) и дедлайна запуска.
+    Таймаут и дедлайн действуют на все время ноды, включая ожидание слота.
+    """
+    timeout_ms = node.data.get('config', {}).get('timeoutMs')
+    node_timeout = int(timeout_ms) / 1000 if timeout_ms else None
+    deadline = _current_deadline.get()
+    deadline_timeout = max(0.0, deadline - asyncio.get_running_loop().time()) if deadline is not None else None
+    timeouts = [t for t in (node_timeout, deadline_timeout) if t is not None]
+
+    if not timeouts:
+        result = await _invoke_in_slot(node, label_to_id_map, input_data, all_results, plan)
+    else:
+        try:
+            result = await asyncio.wait_for(_invoke_in_slot(node, label_to_id_map, input_data, all_results, plan), min(timeouts))
+        except asyncio.TimeoutError:
+            if node_timeout is not None and (deadline_timeout is None or node_timeout <= deadline_timeout):
+                raise Exception(f"Node {node.data.get('label', node.id)} timed out after {timeout_ms} ms")
+            raise Exception(f"Node {node.data.get('label', node.id)} exceeded the run deadline")
+
+    # --- NEW: Preserve dispatcher_context across nodes ---
+    if 'dispatcher_context' in input_data and 'dispatcher_context' not in result:
+        result['dispatcher_context'] = input_data['dispatcher_context']
+    # --- END NEW ---
+    return result
+
+async def _cancel_tasks(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def _join_settings(node: Node) -> Tuple[bool, Optional[int], Optional[float]]:
+    """Читает настройки барьера Join: (ждать все входы, кворум, таймаут в секундах)."""
+    config = node.data.get('config', {})
+    wait_for_all = config.get('waitForAll', True)
+    quorum = config.get('joinQuorum')
+    timeout_ms = config.get('joinTimeoutMs')
+    return (
+        wait_for_all if wait_for_all is not None else True,
+        int(quorum) if quorum else None,
+        int(timeout_ms) / 1000 if timeout_ms else None
+    )
+
+class _WorkflowRun:
+    """
+    Состояние одного запуска workflow и планировщик готовых нод: все ноды, чьи
+    предшественники уже отработали, запускаются параллельно как asyncio-задачи
+    (не больше request.maxConcurrency на запуск и MAX_CONCURRENT_NODES на процесс).
+    Join-ноды работают как барьер и ждут свои входящие ветки.
+    """
+
+    def __init__(self, request: WorkflowExecuteRequest, plan: ExecutionPlan, run_id: str):
+        self.request = request
+        self.run_id = run_id
+        self.plan = plan
+        self.nodes = plan.nodes
+        self.label_to_id_map = plan.label_to_id_map
+        self.run_concurrency = max(1, request.maxConcurrency or DEFAULT_RUN_CONCURRENCY)
+
+        # Элементы очереди: (node_id, input_data, source_id) - source_id нужен для компактных чекпоинтов
+        self.ready_queue: Deque[Tuple[str, Dict[str, Any], Optional[str]]] = deque()
+        self.running: Dict[asyncio.Task, str] = {}
+        self.running_entries: Dict[str, Tuple[str, Dict[str, Any], Optional[str]]] = {}
+        self.executed_nodes = set()
+        self.all_results: Dict[str, Any] = {}
+        self.logs: List[Dict[str, Any]] = []
+        self.goto_counts: Dict[str, int] = {}
+
+        # Барьеры Join: join_id -> источники, которые уже пришли, и момент срабатывания по таймауту
+        self.join_arrivals: Dict[str, List[str]] = {}
+        self.join_deadlines: Dict[str, float] = {}
+
+        self.deadline: Optional[float] = None
+        self.cancel_reason: Optional[str] = None
+
+        # Ноды, завершившиеся после последнего чекпоинта
+        self.unsaved_results: set = set()
+
+        # В ленивом режиме выполняются только предки выходных нод (по связям и шаблонам)
+        self.required_nodes: Optional[set] = None
+        if request.evaluationMode == 'lazy':
+            if not request.outputNodeIds:
+                raise Exception("Lazy evaluation requires outputNodeIds")
+            self.required_nodes = plan.upstream_of(plan.resolve_node_ids(request.outputNodeIds))
+            logger.info(f"💤 Ленивый запуск {run_id}: нужно нод {len(self.required_nodes)} из {len(self.nodes)}")
+
+        # В режиме resultMode='outputs' результат ноды удаляется из all_results, когда его прочитали все потребители
+        self.release_results = request.resultMode == 'outputs'
+        if request.outputNodeIds:
+            self.output_nodes = set(plan.resolve_node_ids(request.outputNodeIds))
+        else:
+            self.output_nodes = {node_id for node_id in self.nodes if not plan.dependents.get(node_id)}
+        self.remaining_consumers: Dict[str, set] = {}
+        self.pending_release: List[str] = []
+
+    def _log(self, node: Node, level: str, message: str, **extra):
+        self.logs.append({
             "nodeId": node.id,
+            "level": level,
+            "message": message,
+            "timestamp": datetime.now().isoformat(),
+            **extra
+        })
+        publish_event("node_log", nodeId=node.id, level=level, message=message)
+
+    def enqueue(self, target_id: str, source_id: Optional[str], input_data: Dict[str, Any]):
+        """Передает результат ноды-источника следующей ноде."""
+        if self.required_nodes is not None and target_id not in self.required_nodes:
+            return
+        target = self.nodes.get(target_id)
+        if not target or target.type != 'join' or source_id is None:
+            self.ready_queue.append((target_id, input_data, source_id))
+            return
+
+        arrivals = self.join_arrivals.setdefault(target_id, [])
+        if not arrivals:
+            _, _, timeout = _join_settings(target)
+            if timeout is not None:
+                self.join_deadlines[target_id] = asyncio.get_running_loop().time() + timeout
+        if source_id not in arrivals:
+            arrivals.append(source_id)
+
+        if self._join_is_ready(target):
+            self._release_join(target_id)
+        else:
+            expected = len(set(self.plan.incoming.get(target_id, ())))
+            logger.info(f"⏳ Join {target_id} ожидает входы: {len(arrivals)}/{expected}")
+
+    def _join_is_ready(self, node: Node) -> bool:
+        arrivals = self.join_arrivals.get(node.id, [])
+        wait_for_all, quorum, _ = _join_settings(node)
+        if quorum:
+            return len(arrivals) >= quorum
+        if not wait_for_all:
+            return True
+        return set(self.plan.incoming.get(node.id, ())).issubset(arrivals)
+
+    def _release_join(self, join_id: str, reason: Optional[str] = None):
+        arrivals = self.join_arrivals.pop(join_id, [])
+        self.join_deadlines.pop(join_id, None)
+        if reason:
+            logger.warning(f"⚠️ Join {join_id} запускается с {len(arrivals)} входами: {reason}")
+        # Порядок входов фиксирован порядком связей, а не порядком завершения веток
+        join_inputs = {
+            source_id: self.all_results[source_id]
+            for source_id in self.plan.incoming.get(join_id, ())
+            if source_id in arrivals and source_id in self.all_results
+        }
+        self.ready_queue.append((join_id, {'inputs': join_inputs}, None))
+
+    def _release_expired_joins(self):
+        now = asyncio.get_running_loop().time()
+        for join_id, deadline in list(self.join_deadlines.items()):
+            if deadline <= now:
+                self._release_join(join_id, "истек таймаут ожидания")
+
+    def cancel(self, reason: str):
+        self.cancel_reason = reason
+        for task in self.running:
+            task.cancel()
+
+    def _abort(self, reason: str) -> ExecutionResult:
+        logger.error(f"🛑 Запуск {self.run_id} прерван: {reason}")
+        for node_id in self.running.values():
+            self._log(self.nodes[node_id], "error", reason)
+        return ExecutionResult(success=False, error=reason, logs=self.logs, result=self.all_results, runId=self.run_id)
+
+    def _start_ready_nodes(self):
+        # Ноды, чьи шаблоны читают результат ноды, которая сама ждет запуска или выполняется,
+        # откладываются до ее завершения (зависимости по данным, а не только по связям)
+        pending = set(self.running.values()) | {entry[0] for entry in self.ready_queue if entry[0] not in self.executed_nodes} | set(self.join_arrivals)
+        deferred = []
+
+        # Запускаем все готовые ноды, пока есть свободные слоты
+        while self.ready_queue and len(self.running) < self.run_concurrency:
+            entry = self.ready_queue.popleft()
+            node_id = entry[0]
+
+            if node_id in self.executed_nodes or node_id in self.running.values():
+                continue
+            if node_id not in self.nodes:
+                continue
+
+            if self.plan.template_deps.get(node_id, set()) & pending:
+                deferred.append(entry)
+                continue
+
+            self._start_node(entry)
+
+        if deferred and not self.running:
+            # Циклическая зависимость шаблонов: иначе запуск никогда не продвинется
+            logger.warning(f"⚠️ Циклическая зависимость шаблонов, нода {deferred[0][0]} запускается без ожидания")
+            self._start_node(deferred.pop(0))
+        self.ready_queue.extendleft(reversed(deferred))
+
+    def _start_node(self, entry: Tuple[str, Dict[str, Any], Optional[str]]):
+        node_id, input_data, source_id = entry
+        node = self.nodes[node_id]
+
+        # Join без входящих веток (например, стартовая нода) получает пустой набор входов
+        if node.type == 'join' and 'inputs' not in input_data:
+            input_data = {'inputs': {}}
+
+        logger.info(f"Executing node {node.id} ({node.type}) with input: {input_data}")
+        self._log(node, "info", f"Executing node {node.data.get('label', node.id)}")
+
+        task = asyncio.create_task(self._execute_node(node, input_data))
+        self.running[task] = node.id
+        self.running_entries[node.id] = (node.id, input_data, source_id)
+
+    async def _execute_node(self, node: Node, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Выполняет ноду, используя кэш результатов, если он включен в ее конфиге (cacheResults)."""
+        if not node_cache.is_cacheable(node):
+            return await _run_node(node, self.label_to_id_map, input_data, self.all_results, self.plan)
+
+        cache_key = node_cache.make_cache_key(node, input_data, self.label_to_id_map, self.all_results, self.plan.result_sources.get(node.id, ()))
+        cached = await node_cache.get_cached_result(cache_key, node)
+        if cached is not None:
+            logger.info(f"💾 Результат ноды {node.id} взят из кэша ({cache_key[:12]})")
+            self._log(node, "info", f"Cache hit for node {node.data.get('label', node.id)}", cacheKey=cache_key)
+            # Контекст в кэше не хранится: результат получает контекст текущего запуска
+            if 'dispatcher_context' in input_data:
+                cached['dispatcher_context'] = input_data['dispatcher_context']
+            return cached
+
+        result = await _run_node(node, self.label_to_id_map, input_data, self.all_results, self.plan)
+        await node_cache.store_result(cache_key, node, result)
+        return result
+
+    def _complete_node(self, node: Node, result: Dict[str, Any]):
+        self.all_results[node.id] = result
+        self.executed_nodes.add(node.id)
+        self.unsaved_results.add(node.id)
+
+        if self.release_results:
+            self._log(node, "success", f"Node {node.data.get('label', node.id)} executed successfully")
+            self._track_consumers(node.id)
+        else:
+            self._log(node, "success", f"Node {node.data.get('label', node.id)} executed successfully", data=result)
+
+        # Find next nodes to execute
+        if node.type in BRANCHING_NODE_TYPES:
+            branch = result.get('branch', 'false')
+            for edge in self.plan.outgoing.get(node.id, ()):
+                if edge.branch != branch:
+                    continue
+                # Add to queue if it's a GOTO jump OR if it has not been executed yet
+                if edge.is_goto or edge.target not in self.executed_nodes:
+                    if edge.is_goto:
+                        self.goto_counts[edge.goto_key] = self.goto_counts.get(edge.goto_key, 0) + 1
+                        max_gotos = self.plan.max_goto_iterations.get(node.id, DEFAULT_MAX_GOTO_ITERATIONS)
+                        if self.goto_counts[edge.goto_key] > max_gotos:
+                            raise Exception(f"GOTO limit ({max_gotos}) exceeded for {edge.goto_key}")
+                        logger.info(f"↪️ GOTO: Jumping from {edge.source} to {edge.target} (iteration {self.goto_counts[edge.goto_key]})")
+
+                        # Allow the target node and the If/Else node itself to be re-executed
+                        self.executed_nodes.discard(edge.target)
+                        self.executed_nodes.discard(edge.source)
+
+                    self.enqueue(edge.target, node.id, result)
+        else:
+            for edge in self.plan.outgoing.get(node.id, ()):
+                if edge.target not in self.executed_nodes:
+                    self.enqueue(edge.target, node.id, result)
+
+    # --- Освобождение промежуточных результатов ---
+
+    def _track_consumers(self, node_id: str):
+        """Отмечает, что нода прочитала свои входы; входы без оставшихся потребителей можно освободить."""
+        for dep_id in self.plan.dependencies.get(node_id, ()):
+            remaining = self.remaining_consumers.setdefault(dep_id, set(self.plan.dependents.get(dep_id, ())))
+            remaining.discard(node_id)
+            if not remaining:
+                self._mark_releasable(dep_id)
+        if not self.plan.dependents.get(node_id):
+            self._mark_releasable(node_id)
+
+    def _mark_releasable(self, node_id: str):
+        if node_id in self.plan.releasable_nodes and node_id not in self.output_nodes:
+            self.pending_release.append(node_id)
+
+    def _release_results(self):
+        # Вызывается после сохранения чекпоинта, чтобы результат успел попасть в БД
+        for node_id in self.pending_release:
+            self.all_results.pop(node_id, None)
+        self.pending_release.clear()
+
+    def _final_results(self) -> Dict[str, Any]:
+        if not self.release_results:
+            return self.all_results
+        return {node_id: result for node_id, result in self.all_results.items() if node_id in self.output_nodes}
+
+    # --- Чекпоинты ---
+
+    def _serialize_entry(self, entry: Tuple[str, Dict[str, Any], Optional[str]]) -> Dict[str, Any]:
+        node_id, input_data, source_id = entry
+        # Вход, совпадающий с результатом ноды-источника, хранится ссылкой, а не копией
+        if source_id is not None and self.all_results.get(source_id) is input_data:
+            return {"node_id": node_id, "source_id": source_id}
+        node = self.nodes.get(node_id)
+        if node and node.type == 'join' and set(input_data) == {'inputs'}:
+            return {"node_id": node_id, "join_sources": list(input_data['inputs'])}
+        return {"node_id": node_id, "input": input_data}
+
+    def _deserialize_entry(self, item: Dict[str, Any]) -> Tuple[str, Dict[str, Any], Optional[str]]:
+        node_id = item["node_id"]
+        if "source_id" in item:
+            return (node_id, self.all_results.get(item["source_id"], {}), item["source_id"])
+        if "join_sources" in item:
+            inputs = {source_id: self.all_results[source_id] for source_id in item["join_sources"] if source_id in self.all_results}
+            return (node_id, {'inputs': inputs}, None)
+        return (node_id, item.get("input") or {}, None)
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        """Компактное состояние запуска без результатов нод."""
+        # Прерванные ноды при возобновлении запускаются заново
+        pending = list(self.running_entries.values()) + list(self.ready_queue)
+        return {
+            "executed_nodes": sorted(self.executed_nodes),
+            "goto_counts": self.goto_counts,
+            "queue": [self._serialize_entry(entry) for entry in pending],
+            "join_arrivals": self.join_arrivals,
+        }
+
+    def restore(self, state: Dict[str, Any], results: Dict[str, Any]):
+        """Восстанавливает состояние запуска из чекпоинта."""
+        self.all_results.update(results)
+        self.executed_nodes.update(state.get("executed_nodes", []))
+        self.goto_counts.update(state.get("goto_counts", {}))
+        self.ready_queue.extend(self._deserialize_entry(item) for item in state.get("queue", []))
+        self.join_arrivals.update(state.get("join_arrivals", {}))
+        self.logs.append({
+            "nodeId": None,
             "level": "info",
-            "message": f"Executing node {node.data.get('label', node.id)}",
+            "message": f"Run resumed from checkpoint: {len(self.executed_nodes)} nodes already executed",
             "timestamp": datetime.now().isoformat()
         })
 
+    async def _save_checkpoint(self, initial: bool = False):
         try:
-            executor = get_executor(node.type)
-            if not executor:
-                raise Exception(f"No executor for node type {node.type}")
-
-            # Pass dependencies to executors that need them
-            if node.type == 'gigachat':
-                result = await executor(node, label_to_id_map, input_data, gigachat_api, all_results)
-            elif node.type == 'dispatcher':
-                result = await executor(node, label_to_id_map, input_data, gigachat_api, all_results)
+            if initial:
+                await create_checkpoint(self.run_id, self.request.dict(), self.checkpoint_state())
             else:
-                result = await executor(node, label_to_id_map, input_data, all_results)
-
-            # --- NEW: Preserve dispatcher_context across nodes ---
-            if 'dispatcher_context' in input_data and 'dispatcher_context' not in result:
-                result['dispatcher_context'] = input_data['dispatcher_context']
-            # --- END NEW ---
-
-            all_results[node.id] = result
-            executed_nodes.add(node.id)
-
-            logs.append({
-                "nodeId": node.id,
-                "level": "success",
-                "message": f"Node {node.data.get('label', node.id)} executed successfully",
-                "timestamp": datetime.now().isoformat(),
-                "data": result
-            })
-
-            # Find next nodes to execute
-            next_nodes = []
-            if node.type == 'if_else':
-                branch = result.get('branch', 'false')
-                for conn in connections:
-                    if conn.source == node.id:
-                        conn_label = conn.data.get('label', 'true')
-                        is_goto = ':goto' in conn_label
-                        actual_label = conn_label.split(':')[0]
-
-                        if actual_label == branch:
-                            # Add to queue if it's a GOTO jump OR if it has not been executed yet
-                            if is_goto or conn.target not in executed_nodes:
-                                if is_goto:
-                                    goto_key = f"{conn.source}->{conn.target}"
-                                    goto_counts[goto_key] = goto_counts.get(goto_key, 0) + 1
-                                    max_gotos = node.data.get('config', {}).get('maxGotoIterations', 10)
-                                    if goto_counts[goto_key] > max_gotos:
-                                        raise Exception(f"GOTO limit ({max_gotos}) exceeded for {goto_key}")
-                                    logger.info(f"↪️ GOTO: Jumping from {conn.source} to {conn.target} (iteration {goto_counts[goto_key]})")
-                                    
-                                    # Allow the target node and the If/Else node itself to be re-executed
-                                    if conn.target in executed_nodes:
-                                        executed_nodes.remove(conn.target)
-                                    if conn.source in executed_nodes:
-                                        executed_nodes.remove(conn.source)
-                                
-                                next_nodes.append((conn.target, result))
+                new_results = {node_id: self.all_results.get(node_id) for node_id in self.unsaved_results}
+                await save_checkpoint(self.run_id, self.checkpoint_state(), new_results)
+            self.unsaved_results.clear()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить чекпоинт запуска {self.run_id}: {e}")
+
+    async def _finish_checkpoint(self, status: str):
+        try:
+            await finish_checkpoint(self.run_id, status)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось завершить чекпоинт запуска {self.run_id}: {e}")
+
+    # --- Инкрементальный перезапуск ---
+
+    def seed_incremental(self, previous_results: Dict[str, Any], changed_node_ids: List[str], initial_input_data: Dict[str, Any]):
+        """
+        Переиспользует результаты прошлого запуска для нод, не зависящих от измененных,
+        и ставит в очередь только "корни" затронутого подграфа.
+        """
+        affected = self.plan.downstream_of(changed_node_ids)
+        for node_id, result in previous_results.items():
+            if node_id in self.nodes and node_id not in affected:
+                self.all_results[node_id] = result
+                self.executed_nodes.add(node_id)
+
+        start_nodes = set(self.plan.start_nodes)
+        # Незатронутые ноды без прошлого результата (освобожден в resultMode='outputs' или нода не выполнялась
+        # в ленивом запуске), чьи данные нужны корням, выполняются заново - иначе корень некому запустить
+        recomputed: set = set()
+        pending = deque(n.id for n in self.plan.node_list if n.id in affected)
+        while pending:
+            node_id = pending.popleft()
+            predecessors = self.plan.incoming.get(node_id, ())
+            is_root = not any(source_id in affected for source_id in predecessors)
+            # Шаблоны читают результаты всегда; входы по связям нужны корням и Join
+            needed = set(self.plan.template_deps.get(node_id, ()))
+            if is_root or self.nodes[node_id].type == 'join':
+                needed.update(predecessors)
+            for dep_id in needed:
+                if dep_id not in affected and dep_id not in self.all_results and dep_id not in recomputed:
+                    recomputed.add(dep_id)
+                    pending.append(dep_id)
+            if not predecessors:
+                if node_id in start_nodes:
+                    self.enqueue(node_id, None, initial_input_data)
+                continue
+            # Корень - затронутая нода, все предшественники которой остались прежними.
+            # Join, ожидающий и затронутые ветки, получает прежние входы сразу, остальные - при их повторе.
+            if not is_root and self.nodes[node_id].type != 'join':
+                continue
+            for edge in (e for source_id in dict.fromkeys(predecessors) for e in self.plan.outgoing.get(source_id, ())):
+                if edge.target != node_id or edge.source not in self.all_results:
+                    continue
+                source_result = self.all_results[edge.source]
+                source_node = self.nodes[edge.source]
+                # В прошлом запуске If/Else мог выбрать другую ветку
+                if source_node.type in BRANCHING_NODE_TYPES and edge.branch != source_result.get('branch', 'false'):
+                    continue
+                self.enqueue(node_id, edge.source, source_result)
+
+        logger.info(f"♻️ Инкрементальный запуск {self.run_id}: переиспользовано нод {len(self.executed_nodes)}, затронуто {len(affected)}, без прошлого результата {len(recomputed)}")
+        self.logs.append({
+            "nodeId": None,
+            "level": "info",
+            "message": f"Incremental run: {len(self.executed_nodes)} node results reused, {len(affected)} nodes affected by changes, {len(recomputed)} nodes re-executed for missing results",
+            "timestamp": datetime.now().isoformat()
+        })
+
+    # --- Выполнение ---
+
+    async def run(self, start_node_id: str, initial_input_data: Dict[str, Any]) -> ExecutionResult:
+        self.ready_queue.append((start_node_id, initial_input_data, None))
+        return await self.start()
+
+    async def start(self) -> ExecutionResult:
+        if self.request.checkpoint:
+            await self._save_checkpoint(initial=True)
+        return await self.execute()
+
+    async def execute(self) -> ExecutionResult:
+        # Верхний запуск открывает поток событий; суб-воркфлоу публикуют в поток родителя
+        events_token = open_run(self.run_id)
+        result = None
+        try:
+            result = await self._execute()
+        finally:
+            close_run(events_token, success=bool(result and result.success), error=result.error if result else "Run interrupted")
+        if self.request.checkpoint:
+            if result.success:
+                status = 'completed'
             else:
-                for conn in connections:
-                    if conn.source == node.id:
-                        if conn.target not in executed_nodes:
-                            next_nodes.append((conn.target, result))
+                status = 'cancelled' if self.cancel_reason else 'failed'
+            await self._finish_checkpoint(status)
+        return result
+
+    async def _execute(self) -> ExecutionResult:
+        loop = asyncio.get_running_loop()
+        deadlines = [d for d in (
+            _current_deadline.get(),
+            loop.time() + self.request.deadlineMs / 1000 if self.request.deadlineMs else None
+        ) if d is not None]
+        self.deadline = min(deadlines) if deadlines else None
+        deadline_token = _current_deadline.set(self.deadline)
+        active_runs[self.run_id] = self
+
+        try:
+            while self.ready_queue or self.running or self.join_arrivals:
+                if self.cancel_reason:
+                    return self._abort(self.cancel_reason)
+                if self.deadline is not None and loop.time() >= self.deadline:
+                    return self._abort("Run deadline exceeded")
+
+                self._start_ready_nodes()
+
+                if not self.running:
+                    if self.ready_queue:
+                        continue
+                    # Больше некому прийти в ожидающие барьеры (например, ветка If/Else не выбрана)
+                    for join_id in list(self.join_arrivals):
+                        self._release_join(join_id, "остальные ветки не будут выполнены")
+                    continue
+
+                wake_times = list(self.join_deadlines.values())
+                if self.deadline is not None:
+                    wake_times.append(self.deadline)
+                timeout = max(0, min(wake_times) - loop.time()) if wake_times else None
+
+                done, _ = await asyncio.wait(self.running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    node = self.nodes[self.running.pop(task)]
+                    self.running_entries.pop(node.id, None)
+                    if task.cancelled():
+                        self._log(node, "error", self.cancel_reason or "Node cancelled")
+                        continue
+                    try:
+                        self._complete_node(node, task.result())
+                    except Exception as e:
+                        logger.error(f"Error executing node {node.id}: {e}")
+                        self._log(node, "error", str(e))
+                        return ExecutionResult(success=False, error=str(e), logs=self.logs, result=self.all_results, runId=self.run_id)
+
+                self._release_expired_joins()
+
+                if self.request.checkpoint and self.unsaved_results:
+                    await self._save_checkpoint()
+                if self.pending_release:
+                    self._release_results()
+        finally:
+            # Ошибка одной ветки, дедлайн или отмена всего запуска останавливают остальные
+            if self.running:
+                await _cancel_tasks(list(self.running.keys()))
+            active_runs.pop(self.run_id, None)
+            _current_deadline.reset(deadline_token)
 
-            for next_node_id, next_input_data in next_nodes:
-                execution_queue.append((next_node_id, next_input_data))
+        if self.cancel_reason:
+            return self._abort(self.cancel_reason)
+        return ExecutionResult(success=True, result=self._final_results(), logs=self.logs, runId=self.run_id)
 
+async def execute_workflow_internal(
+    request: WorkflowExecuteRequest,
+    initial_input_data: Dict[str, Any] = None,
+    plan: Optional[ExecutionPlan] = None
+) -> ExecutionResult:
+    # План сохраненных workflow приходит из кэша; для разовых запросов компилируем на месте
+    if plan is None:
+        plan = ExecutionPlan(request.nodes, request.connections)
+
+    run_id = request.runId or str(uuid.uuid4())
+    start_node_id = plan.resolve_start_node(request.startNodeId)
+    if not start_node_id:
+        return ExecutionResult(success=False, error="No start node found", runId=run_id)
+
+    try:
+        run = _WorkflowRun(request, plan, run_id)
+    except Exception as e:
+        return ExecutionResult(success=False, error=str(e), runId=run_id)
+    if request.changedNodeIds is not None and (request.previousResults is not None or request.previousRunId):
+        try:
+            previous_results = request.previousResults
+            if previous_results is None:
+                previous_results = await _load_previous_results(request.previousRunId)
         except Exception as e:
-            logger.error(f"Error executing node {node.id}: {e}")
-            logs.append({
-                "nodeId": node.id,
-                "level": "error",
-                "message": str(e),
-                "timestamp": datetime.now().isoformat()
-            })
-            return ExecutionResult(success=False, error=str(e), logs=logs, result=all_results)
-
-    return ExecutionResult(success=True, result=all_results, logs=logs)
-
-def get_executor(node_type: str):
-    executor_map = {
-        'gigachat': execute_gigachat,
-        'webhook': execute_webhook,
-        'request_iterator': execute_request_iterator,
-        'if_else': execute_if_else,
-        'dispatcher': execute_dispatcher,
-        'loop': execute_loop,
-        'join': execute_join,
-        'timer': execute_timer,
-        'webhook_trigger': execute_webhook_trigger,
-        'email': execute_email,
-        'database': execute_database,
-        'mcp_connector': execute_mcp_connector, # <--- ДОБАВИТЬ ЭТУ СТРОКУ
-        'filesystem': execute_filesystem, # <--- ДОБАВИТЬ ЭТУ СТРОКУ
-    }
-    return executor_map.get(node_type)
+            return ExecutionResult(success=False, error=str(e), runId=run_id)
+        run.seed_incremental(previous_results, request.changedNodeIds, initial_input_data or {})
+        return await run.start()
+
+    return await run.run(start_node_id, initial_input_data or {})
+
+async def resume_workflow_run(run_id: str) -> ExecutionResult:
+    """Продолжает запуск с последнего чекпоинта: уже выполненные ноды не перезапускаются."""
+    if run_id in active_runs:
+        raise Exception(f"Run {run_id} is still running")
+
+    checkpoint = await load_checkpoint(run_id)
+    if not checkpoint:
+        raise Exception(f"Checkpoint for run {run_id} not found")
+    if checkpoint['status'] == 'completed':
+        raise Exception(f"Run {run_id} has already completed")
+
+    request = WorkflowExecuteRequest(**checkpoint['definition'])
+    request.runId = run_id
+    request.checkpoint = True
+    plan = ExecutionPlan(request.nodes, request.connections)
+
+    run = _WorkflowRun(request, plan, run_id)
+    run.restore(checkpoint['state'], checkpoint['results'])
+    logger.info(f"♻️ Возобновление запуска {run_id}: выполнено нод {len(run.executed_nodes)}, в очереди {len(run.ready_queue)}")
+    return await run.execute()
@@ -0,0 +1,141 @@
+import asyncio
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+
+from scripts.services.storage import init_db_pool, close_db_pool, get_workflow_by_id
+from scripts.services.run_queue import (
+    DEFAULT_RUN_QUEUE,
+    init_run_queue_schema,
+    RUN_LEASE_SECONDS,
+    claim_next_run,
+    extend_run_lease,
+    finish_workflow_run,
+)
+from scripts.core.execution_plan import get_workflow_plan
+from scripts.services.checkpoints import init_checkpoints_schema, load_checkpoint
+from scripts.core.node_cache import init_node_cache_schema
+from scripts.services.loop_ledger import init_loop_ledger_schema
+from scripts.services.giga_chat import init_http_session, close_http_session
+from scripts.services.event_relay import start_event_relay, stop_event_relay
+from scripts.core.workflow_engine import execute_workflow_internal, resume_workflow_run, cancel_workflow_run
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+WORKER_SLEEP_INTERVAL = float(os.getenv("ENGINE_WORKER_SLEEP_INTERVAL", "1"))  # Секунд
+# Чекпоинты после каждой ноды позволяют продолжить запуск после перезапуска воркера
+WORKER_CHECKPOINTS = os.getenv("ENGINE_WORKER_CHECKPOINTS", "1") == "1"
+
+
+async def keep_run_lease(run_id: str, worker_id: str):
+    """Продлевает аренду запуска, пока он выполняется; потеряв аренду, отменяет локальное выполнение."""
+    while True:
+        await asyncio.sleep(RUN_LEASE_SECONDS / 3)
+        try:
+            if not await extend_run_lease(run_id, worker_id):
+                logger.error(f"[Run {run_id}] ❌ Аренда запуска потеряна, выполнение отменяется")
+                cancel_workflow_run(run_id, "Run lease lost")
+                return
+        except Exception as e:
+            logger.warning(f"[Run {run_id}] ⚠️ Не удалось продлить аренду запуска: {e}")
+
+
+async def process_run(run: dict, worker_id: str):
+    """Выполняет один запуск из очереди и сохраняет его результат."""
+    run_id = run['id']
+    workflow_id = run['workflow_id']
+    logger.info(f"[Run {run_id}] Запуск workflow '{workflow_id}'")
+
+    lease_task = asyncio.create_task(keep_run_lease(run_id, worker_id))
+    try:
+        # Запуск, прерванный перезапуском воркера, продолжается с последнего чекпоинта
+        checkpoint = await load_checkpoint(run_id) if WORKER_CHECKPOINTS else None
+        if checkpoint and checkpoint['status'] == 'running':
+            logger.info(f"[Run {run_id}] ♻️ Найден чекпоинт, продолжаю выполнение")
+            result = await resume_workflow_run(run_id)
+        else:
+            workflow_data_raw = await get_workflow_by_id(workflow_id)
+            if not workflow_data_raw:
+                raise Exception(f"Workflow {workflow_id} not found")
+
+            plan = get_workflow_plan(dict(workflow_data_raw))
+            request = plan.to_request(start_node_id=run.get('start_node_id'))
+            request.runId = run_id
+            request.checkpoint = WORKER_CHECKPOINTS
+
+            result = await execute_workflow_internal(request, run.get('input_data') or {}, plan)
+        await finish_workflow_run(run_id, 'completed' if result.success else 'failed', result.dict(), result.error, worker_id)
+        logger.info(f"[Run {run_id}] {'✅ Завершен' if result.success else '❌ Завершен с ошибкой'}")
+    except Exception as e:
+        logger.error(f"[Run {run_id}] ❌ Ошибка при выполнении: {e}", exc_info=True)
+        await finish_workflow_run(run_id, 'failed', error=str(e), worker_id=worker_id)
+    finally:
+        lease_task.cancel()
+
+
+async def worker_slot(queue_name: str, worker_id: str, slot: int):
+    """Один слот воркера: забирает запуски из очереди по одному и выполняет их."""
+    while True:
+        try:
+            run = await claim_next_run(queue_name, worker_id)
+            if run:
+                await process_run(run, worker_id)
+            else:
+                await asyncio.sleep(WORKER_SLEEP_INTERVAL)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Критическая ошибка в слоте {slot} воркера {worker_id}: {e}", exc_info=True)
+            await asyncio.sleep(WORKER_SLEEP_INTERVAL)
+
+
+async def main_loop(queue_name: str, concurrency: int, worker_id: str):
+    """Запускает concurrency параллельных запусков workflow в одном процессе."""
+    await init_db_pool()
+    await init_http_session()
+    try:
+        await init_run_queue_schema()
+        await init_checkpoints_schema()
+        await init_node_cache_schema()
+        await init_loop_ledger_schema()
+        # Воркер только отправляет события своих запусков; подписчики подключаются к API
+        await start_event_relay(listen=False)
+
+        logger.info(f"🛠️ Воркер {worker_id} запущен: очередь '{queue_name}', параллельных запусков: {concurrency}")
+        await asyncio.gather(*(worker_slot(queue_name, worker_id, slot) for slot in range(concurrency)))
+    finally:
+        await stop_event_relay()
+        await close_http_session()
+        await close_db_pool()
+
+
+def run_worker_process(queue_name: str, concurrency: int, worker_id: str):
+    try:
+        asyncio.run(main_loop(queue_name, concurrency, worker_id))
+    except KeyboardInterrupt:
+        logger.info(f"Воркер {worker_id} остановлен вручную.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запускает воркер, выполняющий workflow из очереди запусков.")
+    parser.add_argument("--queue", type=str, default=DEFAULT_RUN_QUEUE, help="Имя очереди для прослушивания")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("ENGINE_WORKER_CONCURRENCY", "8")), help="Число параллельных запусков на процесс")
+    parser.add_argument("--processes", type=int, default=1, help="Число процессов воркера (по одному на ядро)")
+    # ID только отмечает владельца аренды запуска; незавершенные запуски упавших воркеров забираются по истечении аренды
+    parser.add_argument("--worker-id", type=str, default=f"{socket.gethostname()}-{os.getpid()}", help="Уникальный ID воркера (по умолчанию хост и PID процесса)")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker_process(args.queue, args.concurrency, f"{args.worker_id}-0")
+    else:
+        processes = [
+            multiprocessing.Process(target=run_worker_process, args=(args.queue, args.concurrency, f"{args.worker_id}-{index}"))
+            for index in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -10,6 +10,7 @@ from pgvector.asyncpg import register_vector
 # Эти модули мы создадим на следующих шагах
 from .loaders import load_data_from_source
 from .processing import process_text_to_chunks
+from scripts.services.giga_chat import init_http_session, close_http_session
 
 # --- Настройка ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -76,7 +77,16 @@ async def main_loop(queue_name: str):
     """Бесконечный цикл воркера для поиска и обработки задач в конкретной очереди."""
     logger.info(f"🛠️ Воркер запущен. Слушаю очередь: '{queue_name}'...")
     db_pool = await asyncpg.create_pool(DATABASE_URL, init=register_vector)
+    # Эмбеддинги всех чанков идут через одну HTTP-сессию с keep-alive
+    await init_http_session()
 
+    try:
+        await _poll_jobs(queue_name, db_pool)
+    finally:
+        await close_http_session()
+
+
+async def _poll_jobs(queue_name: str, db_pool: asyncpg.Pool):
     while True:
         try:
             async with db_pool.acquire() as connection:
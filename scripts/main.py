@@ -5,6 +5,12 @@ from starlette.background import BackgroundTasks
 
 from scripts.api.v1 import workflows, execution, timers, webhooks, dispatcher_callback
 from scripts.services.storage import init_db_pool, close_db_pool
+from scripts.services.run_queue import init_run_queue_schema
+from scripts.services.checkpoints import init_checkpoints_schema
+from scripts.core.node_cache import init_node_cache_schema
+from scripts.services.loop_ledger import init_loop_ledger_schema
+from scripts.services.giga_chat import init_http_session, close_http_session
+from scripts.services.event_relay import start_event_relay, stop_event_relay
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -35,11 +41,26 @@ async def on_startup():
     """Действия при старте приложения."""
     logger.info("🚀 Приложение запускается...")
     await init_db_pool()
+    await init_http_session()
+    try:
+        await init_run_queue_schema()
+        await init_checkpoints_schema()
+        await init_node_cache_schema()
+        await init_loop_ledger_schema()
+    except Exception as e:
+        logger.error(f"❌ Не удалось подготовить очередь запусков workflow: {e}")
+    try:
+        # События запусков, выполняемых engine_worker, доходят до подписчиков API
+        await start_event_relay(listen=True)
+    except Exception as e:
+        logger.error(f"❌ Не удалось включить пересылку событий запусков: {e}")
 
 @app.on_event("shutdown")
 async def on_shutdown():
     """Действия при остановке приложения."""
     logger.info("🛑 Приложение останавливается...")
+    await stop_event_relay()
+    await close_http_session()
     await close_db_pool()
 
 @app.get("/")
@@ -1,8 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from scripts.utils.lazy_text import materialize_lazy
+
 class NodeConfig(BaseModel):
+    timeoutMs: Optional[int] = None  # Таймаут выполнения любой ноды
     authToken: Optional[str] = None
     systemMessage: Optional[str] = None
     userMessage: Optional[str] = None
@@ -18,6 +21,8 @@ class NodeConfig(BaseModel):
     interval: Optional[int] = None
     timezone: Optional[str] = None
     waitForAll: Optional[bool] = True 
+    joinQuorum: Optional[int] = None  # Запускать Join, как только пришло N входов
+    joinTimeoutMs: Optional[int] = None  # Запускать Join с пришедшими входами по истечении таймаута
     mergeStrategy: Optional[str] = "combine_text"
     separator: Optional[str] = "\n\n---\n\n"
     # Для Request Iterator ноды
@@ -30,6 +35,9 @@ class NodeConfig(BaseModel):
     compareValue: Optional[str] = ""
     caseSensitive: Optional[bool] = False
     maxGotoIterations: Optional[int] = 3  # Защита от бесконечных циклов
+    # Для Switch ноды (fieldPath и caseSensitive - общие с If/Else)
+    cases: Optional[Any] = None  # Список значений или словарь значение -> метка выхода
+    defaultBranch: Optional[str] = "default"
     # НОВОЕ: Для Dispatcher ноды
     routes: Optional[Dict[str, Any]] = None
     useAI: Optional[bool] = True
@@ -63,12 +71,34 @@ class WorkflowExecuteRequest(BaseModel):
     nodes: List[Node]
     connections: List[Connection]
     startNodeId: Optional[str] = None
+    maxConcurrency: Optional[int] = None  # Лимит параллельно выполняемых нод в запуске (1 - последовательно)
+    runId: Optional[str] = None  # Идентификатор запуска (генерируется, если не задан)
+    deadlineMs: Optional[int] = None  # Дедлайн всего запуска, включая суб-воркфлоу
+    checkpoint: Optional[bool] = False  # Сохранять состояние после каждой ноды для возобновления
+    # Инкрементальный перезапуск: результаты прошлого запуска (или его runId) и измененные ноды.
+    # Выполняются только измененные ноды и все, что от них зависит; остальные результаты переиспользуются.
+    previousRunId: Optional[str] = None
+    previousResults: Optional[Dict[str, Any]] = None
+    changedNodeIds: Optional[List[str]] = None
+    # Ленивое вычисление (evaluationMode='lazy'): выполняются только ноды, от которых зависят outputNodeIds
+    evaluationMode: Optional[str] = "eager"  # 'eager' или 'lazy'
+    outputNodeIds: Optional[List[str]] = None
+    # 'full' - вернуть результаты всех нод; 'outputs' - только выходных нод (outputNodeIds или ноды без потребителей),
+    # промежуточные результаты освобождаются, как только их прочитали все потребители
+    resultMode: Optional[str] = "full"
 
 class ExecutionResult(BaseModel):
     success: bool
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
     logs: List[Dict[str, Any]] = []
+    runId: Optional[str] = None
+
+    @field_validator('result', mode='after')
+    @classmethod
+    def _materialize_lazy_fields(cls, value):
+        # Отложенные поля (text Join-ноды) вычисляются до сериализации ответа
+        return materialize_lazy(value)
 
 class WorkflowSaveRequest(BaseModel):
     name: str
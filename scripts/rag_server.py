@@ -30,7 +30,7 @@ except ImportError:
     exit()
 
 # Импортируем GigaChatAPI из вашей структуры проекта
-from scripts.services.giga_chat import GigaChatAPI
+from scripts.services.giga_chat import GigaChatAPI, init_http_session, close_http_session
 
 # --- Конфигурация ---
 logging.basicConfig(level=logging.INFO)
@@ -196,8 +196,9 @@ async def navigate_and_answer(question: str) -> str:
 # --- Обработчики HTTP и JSON-RPC ---
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     logger.info("🚀 Сервер запускается... Загружаем документы.")
+    await init_http_session()
     docs_path = os.path.join(project_root, 'docs')
     for dirpath, _, filenames in os.walk(docs_path):
         for filename in filenames:
@@ -211,6 +212,10 @@ def on_startup():
                 except Exception as e:
                     logger.error(f"❌ Не удалось загрузить документ '{filename}': {e}")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_http_session()
+
 @app.post("/")
 async def json_rpc_handler(request: Request):
     body = await request.json()
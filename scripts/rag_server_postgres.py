@@ -1,11 +1,12 @@
 import uvicorn
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
 import logging
 import os
 import re
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional
 import sys
 from contextlib import asynccontextmanager
 
@@ -31,6 +32,7 @@ sys.path.append(project_root)
 
 # Импортируем основной, а не 'copy' файл, предполагая, что мы их слили
 from scripts.services.giga_chat_copy import GigaChatAPI
+from scripts.services.giga_chat import init_http_session, close_http_session
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -75,14 +77,16 @@ async def lifespan(app: FastAPI):
         logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: Не удалось подключиться к PostgreSQL: {e}")
         db_pool = None # Убедимся, что пул не используется, если он невалиден
     
-    # 2. Проверка токена GigaChat
+    # 2. Общая HTTP-сессия и проверка токена GigaChat
+    await init_http_session()
     if not await gigachat_client.get_token(GIGACHAT_AUTH_TOKEN):
         logger.error("КРИТИЧЕСКАЯ ОШИБКА: Не удалось получить токен GigaChat при запуске.")
     
     logger.info("✨ Startup complete.")
     yield
     
-    # 3. Закрытие пула соединений при остановке
+    # 3. Закрытие HTTP-сессии и пула соединений при остановке
+    await close_http_session()
     if db_pool:
         await db_pool.close()
         logger.info("🛑 Соединение с PostgreSQL закрыто.")
@@ -106,11 +110,25 @@ TOOLS_LIST = [
 ]
 
 # --- Вспомогательные функции ---
-async def synthesize_answer(question: str, context: str) -> str:
-    """Генерирует финальный ответ на основе контекста."""
+# Получатель фрагментов ответа при потоковом синтезе
+DeltaCallback = Callable[[str], Awaitable[None]]
+
+async def synthesize_answer(question: str, context: str, on_delta: Optional[DeltaCallback] = None) -> str:
+    """Генерирует финальный ответ на основе контекста (с on_delta - потоково)."""
     logger.info(f"Синтез ответа на основе {len(context)} символов контекста.")
     system_message = "Ты — полезный ассистент-консультант. Ответь на вопрос пользователя, основываясь ИСКЛЮЧИТЕЛЬНО на предоставленном ниже контексте из документации. Не придумывай ничего от себя. Если ответ нельзя найти в контексте, так и скажи."
     user_message = f"КОНТЕКСТ:\n{context}\n\nВОПРОС: {question}"
+    if on_delta:
+        # Потоковый синтез: клиент получает фрагменты ответа по мере генерации
+        parts = []
+        try:
+            async for delta in gigachat_client.stream_chat_completion(system_message, user_message):
+                parts.append(delta)
+                await on_delta(delta)
+        except Exception as e:
+            logger.error(f"❌ Ошибка потокового синтеза ответа: {e}")
+            return "Не удалось сгенерировать ответ."
+        return "".join(parts)
     final_response = await gigachat_client.get_chat_completion(system_message, user_message)
     return final_response.get('response', "Не удалось сгенерировать ответ.")
 
@@ -188,14 +206,55 @@ async def json_rpc_handler(request: Request):
     params = body.get("params", {})
     try:
         if method == "tools/list": result = {"tools": TOOLS_LIST}
-        elif method == "tools/call": result = await handle_tools_call(params)
+        elif method == "tools/call":
+            if "text/event-stream" in request.headers.get("accept", ""):
+                # Клиент принимает SSE (MCP Streamable HTTP): частичный ответ уходит по мере генерации
+                return StreamingResponse(stream_tools_call(request_id, params), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+            result = await handle_tools_call(params)
         else: raise HTTPException(status_code=404, detail=f"Method '{body.get('method')}' not found")
         return JSONResponse(content={"jsonrpc": "2.0", "id": request_id, "result": result})
     except Exception as e:
         logger.error(f"❌ Ошибка при выполнении метода '{method}': {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "Internal Error", "data": str(e)}})
 
-async def execute_db_shortcut_rag(question: str, source_chunk_ids: List[str]) -> str:
+def _sse_message(message: Dict[str, Any]) -> str:
+    return f"event: message\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+async def stream_tools_call(request_id: Any, params: dict) -> AsyncIterator[str]:
+    """
+    tools/call по SSE: фрагменты ответа приходят уведомлениями notifications/progress (в поле message),
+    затем - обычный JSON-RPC ответ с полным результатом. progressToken берется из params._meta, иначе - id запроса.
+    """
+    progress_token = (params.get("_meta") or {}).get("progressToken", request_id)
+    deltas: asyncio.Queue = asyncio.Queue()
+
+    async def run_call():
+        try:
+            return await handle_tools_call(params, on_delta=deltas.put)
+        finally:
+            await deltas.put(None)
+
+    task = asyncio.create_task(run_call())
+    progress = 0
+    try:
+        while True:
+            delta = await deltas.get()
+            if delta is None:
+                break
+            progress += 1
+            yield _sse_message({"jsonrpc": "2.0", "method": "notifications/progress", "params": {"progressToken": progress_token, "progress": progress, "message": delta}})
+        try:
+            result = await task
+            yield _sse_message({"jsonrpc": "2.0", "id": request_id, "result": result})
+        except Exception as e:
+            logger.error(f"❌ Ошибка при потоковом выполнении tools/call: {e}", exc_info=True)
+            yield _sse_message({"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": "Internal Error", "data": str(e)}})
+    finally:
+        # Клиент отключился - незачем продолжать генерацию
+        if not task.done():
+            task.cancel()
+
+async def execute_db_shortcut_rag(question: str, source_chunk_ids: List[str], on_delta: Optional[DeltaCallback] = None) -> str:
     """Выполняет RAG с 'расширением контекста' до полных глав с защитой от переполнения."""
     logger.info(f"SHORTCUT: Запуск RAG с расширением контекста для {len(source_chunk_ids)} исходных чанков.")
     CONTEXT_MAX_SIZE = 12000  # Безопасный лимит символов для контекста
@@ -242,13 +301,13 @@ async def execute_db_shortcut_rag(question: str, source_chunk_ids: List[str]) ->
         logger.error("Не удалось восстановить контекст из кэшированных ID. Запускаем полный RAG.")
         # Для execute_full_rag нужен query_vector, получим его снова
         query_vector = await gigachat_client.get_embedding(question)
-        rag_result = await execute_full_rag(question, query_vector)
+        rag_result = await execute_full_rag(question, query_vector, on_delta)
         return rag_result['answer']
 
     context = "\n\n---\n\n".join(context_texts)
-    return await synthesize_answer(question, context)
+    return await synthesize_answer(question, context, on_delta)
 
-async def execute_full_rag(question: str, query_vector: List[float]) -> Dict[str, Any]:
+async def execute_full_rag(question: str, query_vector: List[float], on_delta: Optional[DeltaCallback] = None) -> Dict[str, Any]:
     """Выполняет полный гибридный RAG-пайплайн: Поиск -> Ранжирование -> Синтез."""
     # Шаг 1: Быстрый поиск (Retrieval)
     candidate_chunks = await find_relevant_chunks(query_vector, limit=25)
@@ -260,13 +319,13 @@ async def execute_full_rag(question: str, query_vector: List[float]) -> Dict[str
 
     # Шаг 3: Синтез ответа
     context = "\n\n---\n\n".join([c['chunk_text'] for c in final_chunks])
-    final_answer = await synthesize_answer(question, context)
+    final_answer = await synthesize_answer(question, context, on_delta)
     final_chunk_ids = [c['id'] for c in final_chunks]
     
     return {"answer": final_answer, "source_chunk_ids": final_chunk_ids}
 
 
-async def handle_tools_call(params: dict):
+async def handle_tools_call(params: dict, on_delta: Optional[DeltaCallback] = None):
     tool_name = params.get("name")
     arguments = params.get("arguments", {})
     if tool_name == "answer_question":
@@ -293,12 +352,14 @@ async def handle_tools_call(params: dict):
             if cached_record['similarity'] >= CACHE_HIT_THRESHOLD:
                 logger.info(f"CACHE HIT: Сходство ({cached_record['similarity']:.2f}) очень высокое. Отдаем готовый ответ.")
                 final_answer = cached_record['final_answer']
+                if on_delta:
+                    await on_delta(final_answer)
             else:
                 logger.info(f"SHORTCUT: Сходство ({cached_record['similarity']:.2f}) среднее. Используем готовые чанки из БД.")
-                final_answer = await execute_db_shortcut_rag(query, cached_record['source_chunk_ids'])
+                final_answer = await execute_db_shortcut_rag(query, cached_record['source_chunk_ids'], on_delta)
         else:
             logger.info("CACHE MISS: Похожих вопросов в кэше не найдено, запускаем полный RAG-цикл.")
-            rag_result = await execute_full_rag(query, query_vector)
+            rag_result = await execute_full_rag(query, query_vector, on_delta)
             final_answer = rag_result['answer']
 
             # Сохраняем новый результат в кэш, если он не является "отказом"
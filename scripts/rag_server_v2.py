@@ -31,6 +31,7 @@ sys.path.append(project_root)
 
 # Импортируем основной, а не 'copy' файл, предполагая, что мы их слили
 from scripts.services.giga_chat_copy import GigaChatAPI
+from scripts.services.giga_chat import init_http_session, close_http_session
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -81,7 +82,8 @@ async def lifespan(app: FastAPI):
             logger.warning(f"⚠️ Ошибка декодирования JSON в '{KNOWLEDGE_BASE_FILE}'. Файл может быть поврежден. Начинаем с чистого кэша.")
             KNOWLEDGE_BASE = []
     
-    # 3. Проверка токена GigaChat
+    # 3. Общая HTTP-сессия и проверка токена GigaChat
+    await init_http_session()
     if not await gigachat_client.get_token(GIGACHAT_AUTH_TOKEN):
         logger.error("КРИТИЧЕСКАЯ ОШИБКА: Не удалось получить токен GigaChat при запуске.")
     
@@ -89,6 +91,7 @@ async def lifespan(app: FastAPI):
     yield
     # Код для выполнения при остановке сервера (если нужно)
     logger.info("🛑 Сервер останавливается...")
+    await close_http_session()
 
 
 app = FastAPI(title="Pre-indexed RAG MCP Server", version="2.0.0", lifespan=lifespan)
@@ -0,0 +1,112 @@
+import json
+import logging
+from typing import Dict, Any, Optional
+
+from scripts.services import storage
+
+logger = logging.getLogger(__name__)
+
+# Состояние запуска хранится компактной строкой, а результаты нод - отдельными строками,
+# чтобы после каждой ноды дописывать только ее результат, а не весь all_results.
+CHECKPOINTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflow_service.workflow_checkpoints (
+    run_id TEXT PRIMARY KEY,
+    definition JSONB NOT NULL,
+    state JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS workflow_service.workflow_checkpoint_results (
+    run_id TEXT NOT NULL REFERENCES workflow_service.workflow_checkpoints (run_id) ON DELETE CASCADE,
+    node_id TEXT NOT NULL,
+    result JSONB,
+    PRIMARY KEY (run_id, node_id)
+);
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _get_pool():
+    if not storage.db_pool:
+        raise Exception("Пул соединений с БД не инициализирован.")
+    return storage.db_pool
+
+
+async def init_checkpoints_schema():
+    """Создает таблицы чекпоинтов, если их еще нет."""
+    async with _get_pool().acquire() as conn:
+        await conn.execute(CHECKPOINTS_SCHEMA)
+    logger.info("✅ Таблицы чекпоинтов workflow готовы.")
+
+
+async def create_checkpoint(run_id: str, definition: Dict[str, Any], state: Dict[str, Any]):
+    """Создает (или перезаписывает) чекпоинт запуска вместе с определением workflow."""
+    async with _get_pool().acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM workflow_service.workflow_checkpoint_results WHERE run_id = $1", run_id)
+            await conn.execute(
+                """
+                INSERT INTO workflow_service.workflow_checkpoints (run_id, definition, state, status, updated_at)
+                VALUES ($1, $2, $3, 'running', NOW())
+                ON CONFLICT (run_id) DO UPDATE SET
+                    definition = EXCLUDED.definition,
+                    state = EXCLUDED.state,
+                    status = 'running',
+                    updated_at = NOW();
+                """,
+                run_id, _dumps(definition), _dumps(state)
+            )
+
+
+async def save_checkpoint(run_id: str, state: Dict[str, Any], new_results: Dict[str, Any]):
+    """Сохраняет состояние запуска и результаты нод, завершившихся с прошлого чекпоинта."""
+    async with _get_pool().acquire() as conn:
+        async with conn.transaction():
+            if new_results:
+                await conn.executemany(
+                    """
+                    INSERT INTO workflow_service.workflow_checkpoint_results (run_id, node_id, result)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (run_id, node_id) DO UPDATE SET result = EXCLUDED.result;
+                    """,
+                    [(run_id, node_id, _dumps(result)) for node_id, result in new_results.items()]
+                )
+            await conn.execute(
+                "UPDATE workflow_service.workflow_checkpoints SET state = $2, updated_at = NOW() WHERE run_id = $1",
+                run_id, _dumps(state)
+            )
+
+
+async def finish_checkpoint(run_id: str, status: str):
+    """Отмечает чекпоинт завершенным: 'completed', 'failed' или 'cancelled'."""
+    async with _get_pool().acquire() as conn:
+        await conn.execute(
+            "UPDATE workflow_service.workflow_checkpoints SET status = $2, updated_at = NOW() WHERE run_id = $1",
+            run_id, status
+        )
+
+
+async def load_checkpoint(run_id: str) -> Optional[Dict[str, Any]]:
+    """Загружает чекпоинт: определение workflow, состояние, статус и результаты нод."""
+    async with _get_pool().acquire() as conn:
+        record = await conn.fetchrow(
+            "SELECT definition, state, status FROM workflow_service.workflow_checkpoints WHERE run_id = $1",
+            run_id
+        )
+        if not record:
+            return None
+        result_records = await conn.fetch(
+            "SELECT node_id, result FROM workflow_service.workflow_checkpoint_results WHERE run_id = $1",
+            run_id
+        )
+    return {
+        "run_id": run_id,
+        "definition": json.loads(record['definition']),
+        "state": json.loads(record['state']),
+        "status": record['status'],
+        "results": {r['node_id']: json.loads(r['result']) if r['result'] else None for r in result_records}
+    }
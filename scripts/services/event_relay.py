@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Dict, Any, List, Optional
+
+from scripts.services import storage
+from scripts.core.execution_events import RUN_FINISHED, set_event_relay, deliver_remote_event
+
+logger = logging.getLogger(__name__)
+
+# Пересылка событий запусков между процессами через Postgres LISTEN/NOTIFY: запуски вебхуков и таймеров
+# выполняет engine_worker, а подписчики (SSE /executions/{id}/events) подключаются к API.
+# Каждый процесс отправляет свои события в канал; API-процессы слушают его и доставляют события подписчикам.
+EXECUTION_EVENTS_RELAY = os.getenv("EXECUTION_EVENTS_RELAY", "1") == "1"
+EXECUTION_EVENTS_RELAY_CHANNEL = os.getenv("EXECUTION_EVENTS_RELAY_CHANNEL", "workflow_run_events")
+EXECUTION_EVENTS_RELAY_QUEUE_SIZE = int(os.getenv("EXECUTION_EVENTS_RELAY_QUEUE_SIZE", "10000"))
+# Сколько событий отправлять одним запросом
+RELAY_BATCH_SIZE = 100
+# NOTIFY принимает payload до 8000 байт; большие события (кроме run_finished) не пересылаются
+RELAY_PAYLOAD_LIMIT = 7900
+
+_origin: Optional[str] = None
+_outbox: Optional[asyncio.Queue] = None
+_sender_task: Optional[asyncio.Task] = None
+_listen_conn = None
+_dropped = 0
+
+
+async def start_event_relay(listen: bool = True):
+    """
+    Включает пересылку событий этого процесса в Postgres.
+    listen=True - еще и доставлять местным подписчикам события других процессов (нужно API, не воркеру).
+    """
+    global _origin, _outbox, _sender_task, _listen_conn
+    if not EXECUTION_EVENTS_RELAY or not storage.db_pool or _sender_task:
+        return
+    # ID задается при старте, а не при импорте: процессы воркера, порожденные fork, получают разные ID
+    _origin = uuid.uuid4().hex
+    _outbox = asyncio.Queue(maxsize=EXECUTION_EVENTS_RELAY_QUEUE_SIZE)
+    if listen:
+        _listen_conn = await storage.db_pool.acquire()
+        await _listen_conn.add_listener(EXECUTION_EVENTS_RELAY_CHANNEL, _on_notification)
+    _sender_task = asyncio.create_task(_send_loop())
+    set_event_relay(_enqueue)
+    logger.info(f"✅ Пересылка событий запусков через канал '{EXECUTION_EVENTS_RELAY_CHANNEL}' включена (прием: {'да' if listen else 'нет'}).")
+
+
+async def stop_event_relay():
+    """Отключает пересылку и освобождает соединение слушателя."""
+    global _sender_task, _listen_conn
+    set_event_relay(None)
+    if _sender_task:
+        _sender_task.cancel()
+        try:
+            await _sender_task
+        except asyncio.CancelledError:
+            pass
+        _sender_task = None
+    if _listen_conn is not None:
+        try:
+            await _listen_conn.remove_listener(EXECUTION_EVENTS_RELAY_CHANNEL, _on_notification)
+        finally:
+            await storage.db_pool.release(_listen_conn)
+            _listen_conn = None
+    if _dropped:
+        logger.warning(f"⚠️ Не переслано событий запусков: {_dropped}")
+
+
+def _encode(event: Dict[str, Any]) -> Optional[str]:
+    payload = json.dumps({"origin": _origin, "event": event}, ensure_ascii=False, default=str)
+    if len(payload.encode('utf-8')) <= RELAY_PAYLOAD_LIMIT:
+        return payload
+    if event["type"] != RUN_FINISHED:
+        return None
+    # Итог запуска пересылается всегда: без лишних полей и с укороченной ошибкой
+    compact = {key: event.get(key) for key in ("type", "runId", "timestamp", "success")}
+    compact["error"] = str(event.get("error"))[:1000] if event.get("error") else None
+    return json.dumps({"origin": _origin, "event": compact}, ensure_ascii=False, default=str)
+
+
+def _enqueue(event: Dict[str, Any]):
+    global _dropped
+    payload = _encode(event)
+    if payload is None:
+        _dropped += 1
+        return
+    if _outbox.full():
+        # Как и у подписчиков, теряется самое старое событие
+        _outbox.get_nowait()
+        _dropped += 1
+    _outbox.put_nowait(payload)
+
+
+async def _send_loop():
+    global _dropped
+    while True:
+        batch: List[str] = [await _outbox.get()]
+        while len(batch) < RELAY_BATCH_SIZE and not _outbox.empty():
+            batch.append(_outbox.get_nowait())
+        try:
+            async with storage.db_pool.acquire() as conn:
+                # Один запрос на пачку; NOTIFY внутри одного запроса доставляются в порядке отправки
+                await conn.execute(
+                    "SELECT pg_notify($1, payload) FROM unnest($2::TEXT[]) WITH ORDINALITY AS t(payload, n) ORDER BY n",
+                    EXECUTION_EVENTS_RELAY_CHANNEL, batch
+                )
+        except Exception as e:
+            _dropped += len(batch)
+            logger.warning(f"⚠️ Не удалось переслать события запусков ({len(batch)}): {e}")
+
+
+def _on_notification(connection, pid: int, channel: str, payload: str):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    # Свои события уже доставлены локально
+    if message.get("origin") == _origin or not isinstance(message.get("event"), dict):
+        return
+    deliver_remote_event(message["event"])
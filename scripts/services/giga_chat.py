@@ -1,63 +1,218 @@
 import aiohttp
+import asyncio
+import os
 import uuid
 import json
 import logging
-from typing import Dict, Any
+import time
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-class GigaChatAPI:
+# Без таймаута зависший запрос к GigaChat навсегда держит выполнение workflow
+GIGACHAT_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=float(os.getenv("GIGACHAT_REQUEST_TIMEOUT", "120")))
+
+# Общая HTTP-сессия с пулом keep-alive соединений: без нее каждый вызов платит за TCP и TLS рукопожатие
+GIGACHAT_CONNECTION_LIMIT = int(os.getenv("GIGACHAT_CONNECTION_LIMIT", "100"))
+GIGACHAT_DNS_CACHE_TTL = int(os.getenv("GIGACHAT_DNS_CACHE_TTL", "300"))
+GIGACHAT_KEEPALIVE_TIMEOUT = float(os.getenv("GIGACHAT_KEEPALIVE_TIMEOUT", "60"))
+
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Общая сессия процесса для GigaChat. Создается при старте приложения (init_http_session),
+    а если старт ее не создал или сессия принадлежит другому event loop - при первом вызове.
+    """
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=GIGACHAT_CONNECTION_LIMIT,
+            ttl_dns_cache=GIGACHAT_DNS_CACHE_TTL,
+            keepalive_timeout=GIGACHAT_KEEPALIVE_TIMEOUT,
+            ssl=False,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=GIGACHAT_REQUEST_TIMEOUT)
+        _http_session_loop = loop
+    return _http_session
+
+
+async def init_http_session():
+    get_http_session()
+    logger.info(f"✅ HTTP-сессия GigaChat создана (лимит соединений {GIGACHAT_CONNECTION_LIMIT}).")
+
+
+async def close_http_session():
+    global _http_session, _http_session_loop
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+        logger.info("🛑 HTTP-сессия GigaChat закрыта.")
+    _http_session = None
+    _http_session_loop = None
+
+
+GIGACHAT_OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+# За сколько секунд до истечения токен обновляется в фоне (текущий при этом еще используется)
+GIGACHAT_TOKEN_REFRESH_MARGIN = float(os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", "120"))
+# Время жизни токена, если OAuth-ответ не содержит expires_at (у GigaChat токен живет 30 минут)
+GIGACHAT_TOKEN_DEFAULT_TTL = 30 * 60
+
+
+def normalize_auth_key(auth_token: str) -> str:
+    if auth_token and auth_token.lower().startswith('basic '):
+        logger.warning("⚠️ Обнаружен префикс 'Basic ' в токене. Удаляю его автоматически.")
+        return auth_token[6:]
+    return auth_token
+
+
+class GigaChatTokenManager:
+    """
+    Токены доступа GigaChat на весь процесс: кэш по (ключ авторизации, scope) с учетом expires_at.
+    Токен обновляется заранее, параллельные обновления одного ключа объединяются в один запрос.
+    """
+
     def __init__(self):
-        self.access_token = None
-        self.conversation_history = []
-        
-    async def get_token(self, auth_token: str, scope: str = 'GIGACHAT_API_PERS') -> bool:
-        """Получение токена доступа"""
-        rq_uid = str(uuid.uuid4())
-        url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+        self._tokens: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
 
-        if auth_token and auth_token.lower().startswith('basic '):
-            logger.warning("⚠️ Обнаружен префикс 'Basic ' в токене. Удаляю его автоматически.")
-            auth_token = auth_token[6:]
+    async def get_access_token(self, auth_key: str, scope: str = 'GIGACHAT_API_PERS', force_refresh: bool = False) -> Optional[str]:
+        key = (auth_key, scope)
+        cached = self._tokens.get(key)
+        if cached and not force_refresh:
+            access_token, expires_at = cached
+            remaining = expires_at - time.time()
+            if remaining > GIGACHAT_TOKEN_REFRESH_MARGIN:
+                return access_token
+            if remaining > 0:
+                # Токен еще действует: обновляем в фоне, не задерживая запрос
+                self._refresh(key)
+                return access_token
+        return await asyncio.shield(self._refresh(key))
 
+    def cached_token(self, auth_key: str, scope: str = 'GIGACHAT_API_PERS') -> Optional[str]:
+        """Действующий токен из кэша без запроса к OAuth (None, если его нет или он истек)."""
+        cached = self._tokens.get((auth_key, scope))
+        if cached and cached[1] > time.time():
+            return cached[0]
+        return None
+
+    def invalidate(self, auth_key: str, scope: str = 'GIGACHAT_API_PERS', access_token: Optional[str] = None):
+        """Сбрасывает токен (после 401). Если передан access_token, сбрасывается только он, а не уже обновленный."""
+        key = (auth_key, scope)
+        cached = self._tokens.get(key)
+        if cached and (access_token is None or cached[0] == access_token):
+            del self._tokens[key]
+
+    def _refresh(self, key: Tuple[str, str]) -> asyncio.Task:
+        task = self._refreshing.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch(key))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _, key=key: self._refreshing.pop(key, None))
+        return task
+
+    async def _fetch(self, key: Tuple[str, str]) -> Optional[str]:
+        auth_key, scope = key
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
             'Accept': 'application/json',
-            'RqUID': rq_uid,
-            'Authorization': f'Basic {auth_token}'
+            'RqUID': str(uuid.uuid4()),
+            'Authorization': f'Basic {auth_key}'
         }
         payload = {'scope': scope}
 
         try:
-            logger.info(f"🔑 Попытка получить токен. URL: {url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, data=payload, ssl=False) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        self.access_token = data['access_token']
-                        logger.info("✅ GigaChat токен получен успешно")
-                        return True
-                    else:
-                        logger.error(f"❌ Ошибка получения токена: {response.status}")
-                        try:
-                            error_details = await response.json()
-                            logger.error(f"🔍 Детали ошибки от GigaChat: {error_details}")
-                        except (aiohttp.ContentTypeError, json.JSONDecodeError):
-                            error_text = await response.text()
-                            logger.error(f"🔍 Ответ от GigaChat (не JSON): {error_text}")
-                        return False
+            logger.info(f"🔑 Попытка получить токен. URL: {GIGACHAT_OAUTH_URL}")
+            session = get_http_session()
+            async with session.post(GIGACHAT_OAUTH_URL, headers=headers, data=payload, ssl=False) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    access_token = data['access_token']
+                    # expires_at приходит в миллисекундах от начала эпохи
+                    expires_at = data.get('expires_at')
+                    expires_at = expires_at / 1000 if expires_at else time.time() + GIGACHAT_TOKEN_DEFAULT_TTL
+                    self._tokens[key] = (access_token, expires_at)
+                    logger.info("✅ GigaChat токен получен успешно")
+                    return access_token
+                else:
+                    logger.error(f"❌ Ошибка получения токена: {response.status}")
+                    try:
+                        error_details = await response.json()
+                        logger.error(f"🔍 Детали ошибки от GigaChat: {error_details}")
+                    except (aiohttp.ContentTypeError, json.JSONDecodeError):
+                        error_text = await response.text()
+                        logger.error(f"🔍 Ответ от GigaChat (не JSON): {error_text}")
+                    return None
         except aiohttp.ClientError as e:
             logger.error(f"❌ Ошибка сети при получении токена: {str(e)}")
-            return False
+            return None
         except Exception as e:
             logger.error(f"❌ Непредвиденная ошибка при получении токена: {str(e)}")
-            return False
+            return None
 
-    async def get_chat_completion(self, system_message: str, user_message: str) -> Dict[str, Any]:
-        """Получение ответа от GigaChat"""
-        if not self.access_token:
+
+async def iter_completion_deltas(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+    """
+    Разбирает потоковый ответ chat/completions (SSE): строки "data: {...}" с фрагментами
+    choices[].delta.content, поток завершается строкой "data: [DONE]".
+    """
+    async for raw_line in response.content:
+        line = raw_line.decode('utf-8').strip()
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            break
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"⚠️ Некорректный фрагмент потока GigaChat: {data[:200]}")
+            continue
+        for choice in chunk.get('choices', []):
+            content = (choice.get('delta') or {}).get('content')
+            if content:
+                yield content
+
+
+token_manager = GigaChatTokenManager()
+
+class GigaChatAPI:
+    def __init__(self):
+        self.auth_token = None
+        self.scope = 'GIGACHAT_API_PERS'
+        self.conversation_history = []
+
+    @property
+    def access_token(self) -> Optional[str]:
+        """Текущий токен ключа этого клиента; сам токен хранится только в кэше процесса."""
+        return token_manager.cached_token(self.auth_token, self.scope) if self.auth_token else None
+        
+    async def get_token(self, auth_token: str, scope: str = 'GIGACHAT_API_PERS') -> bool:
+        """Получение токена доступа (из кэша процесса; OAuth-запрос - только при отсутствии или истечении)"""
+        self.auth_token = normalize_auth_key(auth_token)
+        self.scope = scope
+        return await token_manager.get_access_token(self.auth_token, scope) is not None
+
+    async def _current_token(self) -> str:
+        """Токен для запроса берется из кэша процесса по ключу клиента в момент запроса (истекающий обновляется заранее)."""
+        access_token = await token_manager.get_access_token(self.auth_token, self.scope) if self.auth_token else None
+        if not access_token:
             raise Exception("Токен доступа не получен")
+        return access_token
 
+    async def _refresh_after_unauthorized(self, rejected_token: str) -> bool:
+        """После 401 сбрасывает отвергнутый токен и получает новый."""
+        if not self.auth_token:
+            return False
+        logger.warning("⚠️ Токен GigaChat отклонен (401). Обновляю и пробую снова...")
+        token_manager.invalidate(self.auth_token, self.scope, rejected_token)
+        return await token_manager.get_access_token(self.auth_token, self.scope) is not None
+
+    async def get_chat_completion(self, system_message: str, user_message: str) -> Dict[str, Any]:
+        """Получение ответа от GigaChat (при 401 токен обновляется и запрос повторяется один раз)"""
         messages = [{"role": "system", "content": system_message}]
         messages.extend(self.conversation_history)
         messages.append({"role": "user", "content": user_message})
@@ -74,21 +229,23 @@ class GigaChatAPI:
             "repetition_penalty": 1,
             "update_interval": 0
         }
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'Authorization': f'Bearer {self.access_token}'
-        }
 
-        try:
-            async with aiohttp.ClientSession() as session:
+        for attempt in range(2):
+            access_token = await self._current_token()
+            headers = {
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+                'Authorization': f'Bearer {access_token}'
+            }
+            try:
+                session = get_http_session()
                 async with session.post(url, headers=headers, json=payload, ssl=False) as response:
                     if response.status == 200:
                         self.conversation_history.append({"role": "user", "content": user_message})
                         data = await response.json()
                         assistant_response = data['choices'][0]['message']['content']
                         self.conversation_history.append({"role": "assistant", "content": assistant_response})
-                        
+                            
                         logger.info(f"✅ Получен ответ от GigaChat")
                         return {
                             "success": True,
@@ -97,6 +254,8 @@ class GigaChatAPI:
                             "system_message": system_message,
                             "conversation_length": len(self.conversation_history)
                         }
+                    elif response.status == 401 and attempt == 0 and await self._refresh_after_unauthorized(access_token):
+                        continue
                     else:
                         error_text = await response.text()
                         logger.error(f"❌ Ошибка API GigaChat: {response.status} - {error_text}")
@@ -105,12 +264,66 @@ class GigaChatAPI:
                             "error": f"API Error: {response.status} - {error_text}",
                             "response": None
                         }
-        except aiohttp.ClientError as e:
-            logger.error(f"❌ Ошибка сети при запросе к GigaChat: {str(e)}")
-            return { "success": False, "error": str(e), "response": None }
-        except Exception as e:
-            logger.error(f"❌ Непредвиденная ошибка при запросе к GigaChat: {str(e)}")
-            return { "success": False, "error": str(e), "response": None }
+            except asyncio.TimeoutError:
+                logger.error(f"⏰ Таймаут запроса к GigaChat ({GIGACHAT_REQUEST_TIMEOUT.total} с)")
+                return { "success": False, "error": f"GigaChat request timed out after {GIGACHAT_REQUEST_TIMEOUT.total} s", "response": None }
+            except aiohttp.ClientError as e:
+                logger.error(f"❌ Ошибка сети при запросе к GigaChat: {str(e)}")
+                return { "success": False, "error": str(e), "response": None }
+            except Exception as e:
+                logger.error(f"❌ Непредвиденная ошибка при запросе к GigaChat: {str(e)}")
+                return { "success": False, "error": str(e), "response": None }
+
+    async def stream_chat_completion(self, system_message: str, user_message: str) -> AsyncIterator[str]:
+        """
+        Потоковый ответ GigaChat: фрагменты текста по мере генерации.
+        При 401 до первого фрагмента токен обновляется и запрос повторяется один раз; ошибки - исключения.
+        """
+        messages = [{"role": "system", "content": system_message}]
+        messages.extend(self.conversation_history)
+        messages.append({"role": "user", "content": user_message})
+
+        url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+        payload = {
+            "model": "GigaChat",
+            "messages": messages,
+            "temperature": 1,
+            "top_p": 0.1,
+            "n": 1,
+            "stream": True,
+            "max_tokens": 512,
+            "repetition_penalty": 1,
+            "update_interval": 0
+        }
+
+        for attempt in range(2):
+            access_token = await self._current_token()
+            headers = {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'Authorization': f'Bearer {access_token}'
+            }
+            try:
+                session = get_http_session()
+                async with session.post(url, headers=headers, json=payload, ssl=False) as response:
+                    if response.status == 200:
+                        parts = []
+                        async for delta in iter_completion_deltas(response):
+                            parts.append(delta)
+                            yield delta
+                        self.conversation_history.append({"role": "user", "content": user_message})
+                        self.conversation_history.append({"role": "assistant", "content": "".join(parts)})
+                        logger.info(f"✅ Получен потоковый ответ от GigaChat ({len(parts)} фрагментов)")
+                        return
+                    elif response.status == 401 and attempt == 0 and await self._refresh_after_unauthorized(access_token):
+                        continue
+                    else:
+                        error_text = await response.text()
+                        logger.error(f"❌ Ошибка API GigaChat: {response.status} - {error_text}")
+                        raise Exception(f"API Error: {response.status} - {error_text}")
+            except asyncio.TimeoutError:
+                logger.error(f"⏰ Таймаут запроса к GigaChat ({GIGACHAT_REQUEST_TIMEOUT.total} с)")
+                raise Exception(f"GigaChat request timed out after {GIGACHAT_REQUEST_TIMEOUT.total} s")
 
     def clear_history(self):
         """Очистка истории диалога"""
@@ -1,92 +1,74 @@
 import aiohttp
-import uuid
-import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Optional
+
+from scripts.services.giga_chat import get_http_session, token_manager, normalize_auth_key, iter_completion_deltas
 
 logger = logging.getLogger(__name__)
 
 class GigaChatAPI:
     def __init__(self):
-        self.access_token = None
         self.auth_token = None # Сохраняем основной токен для переполучения
+        self.scope = 'GIGACHAT_API_PERS'
         self.conversation_history = []
+
+    @property
+    def access_token(self) -> Optional[str]:
+        """Текущий токен ключа этого клиента; сам токен хранится только в кэше процесса."""
+        return token_manager.cached_token(self.auth_token, self.scope) if self.auth_token else None
         
     async def get_token(self, auth_token: str, scope: str = 'GIGACHAT_API_PERS') -> bool:
-        """Получение токена доступа и сохранение данных для обновления."""
-        self.auth_token = auth_token # Сохраняем для будущих обновлений
-        rq_uid = str(uuid.uuid4())
-        url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-
-        if auth_token and auth_token.lower().startswith('basic '):
-            auth_token = auth_token[6:]
-
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Accept': 'application/json',
-            'RqUID': rq_uid,
-            'Authorization': f'Basic {auth_token}'
-        }
-        payload = {'scope': scope}
-
-        try:
-            logger.info(f"🔑 Попытка получить токен. URL: {url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, data=payload, ssl=False) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        self.access_token = data['access_token']
-                        logger.info("✅ GigaChat токен получен успешно")
-                        return True
-                    else:
-                        logger.error(f"❌ Ошибка получения токена: {response.status}")
-                        return False
-        except Exception as e:
-            logger.error(f"❌ Непредвиденная ошибка при получении токена: {str(e)}")
-            return False
+        """Получение токена доступа из общего кэша процесса и сохранение данных для обновления."""
+        self.auth_token = normalize_auth_key(auth_token) # Сохраняем для будущих обновлений
+        self.scope = scope
+        return await token_manager.get_access_token(self.auth_token, scope) is not None
+
+    async def _ensure_token(self) -> str:
+        """Берет актуальный токен из кэша по ключу клиента в момент запроса (истекающий обновляется заранее)."""
+        access_token = await token_manager.get_access_token(self.auth_token, self.scope) if self.auth_token else None
+        if not access_token:
+            raise Exception("Не удалось обновить токен, основной токен авторизации отсутствует.")
+        return access_token
 
     async def get_chat_completion(self, system_message: str, user_message: str) -> Dict[str, Any]:
         """Получение ответа от GigaChat с авто-обновлением токена."""
         for attempt in range(2):
-            if not self.access_token:
-                logger.warning("Токен доступа отсутствует, попытка обновления...")
-                if not self.auth_token or not await self.get_token(self.auth_token):
-                    raise Exception("Не удалось обновить токен, основной токен авторизации отсутствует.")
+            access_token = await self._ensure_token()
             
             messages = [{"role": "system", "content": system_message}]
             messages.extend(self.conversation_history)
             messages.append({"role": "user", "content": user_message})
             url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
             payload = {"model": "GigaChat", "messages": messages, "temperature": 1, "top_p": 0.1, "n": 1, "stream": False, "max_tokens": 512, "repetition_penalty": 1, "update_interval": 0}
-            headers = {'Content-Type': 'application/json', 'Accept': 'application/json', 'Authorization': f'Bearer {self.access_token}'}
+            headers = {'Content-Type': 'application/json', 'Accept': 'application/json', 'Authorization': f'Bearer {access_token}'}
 
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(url, headers=headers, json=payload, ssl=False) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            assistant_response = data.get('choices', [{}])[0].get('message', {}).get('content', '')
-                            if not assistant_response:
-                                 logger.error(f"❌ GigaChat вернул успешный ответ, но он пустой или в неожиданном формате. Ответ: {data}")
-                                 return {"success": False, "response": "", "error": "Empty or invalid response structure."}
-
-                            self.conversation_history.append({"role": "user", "content": user_message})
-                            self.conversation_history.append({"role": "assistant", "content": assistant_response})
+                session = get_http_session()
+                async with session.post(url, headers=headers, json=payload, ssl=False) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        assistant_response = data.get('choices', [{}])[0].get('message', {}).get('content', '')
+                        if not assistant_response:
+                             logger.error(f"❌ GigaChat вернул успешный ответ, но он пустой или в неожиданном формате. Ответ: {data}")
+                             return {"success": False, "response": "", "error": "Empty or invalid response structure."}
+
+                        self.conversation_history.append({"role": "user", "content": user_message})
+                        self.conversation_history.append({"role": "assistant", "content": assistant_response})
                             
-                            logger.info(f"✅ Получен ответ от GigaChat")
-                            return {
-                                "success": True,
-                                "response": assistant_response
-                            }
-
-                        elif response.status == 401 and attempt == 0:
-                            logger.warning("⚠️ Токен для chat/completions истек. Обновляю и пробую снова...")
-                            self.access_token = None # Сбрасываем токен, чтобы инициировать обновление
-                            continue # Переходим ко второй попытке
-                        else:
-                            error_text = await response.text()
-                            logger.error(f"❌ Ошибка API GigaChat: {response.status} - {error_text}")
-                            return {"success": False, "error": f"API Error: {response.status} - {error_text}", "response": ""}
+                        logger.info(f"✅ Получен ответ от GigaChat")
+                        return {
+                            "success": True,
+                            "response": assistant_response
+                        }
+
+                    elif response.status == 401 and attempt == 0:
+                        logger.warning("⚠️ Токен для chat/completions истек. Обновляю и пробую снова...")
+                        token_manager.invalidate(self.auth_token, self.scope, access_token)
+                        continue # Переходим ко второй попытке
+                    else:
+                        error_text = await response.text()
+                        logger.error(f"❌ Ошибка API GigaChat: {response.status} - {error_text}")
+                        return {"success": False, "error": f"API Error: {response.status} - {error_text}", "response": ""}
             except aiohttp.ClientError as e:
                 logger.error(f"❌ Ошибка сети при запросе к GigaChat: {str(e)}")
                 return { "success": False, "error": str(e), "response": "" }
@@ -96,6 +78,42 @@ class GigaChatAPI:
             
         return { "success": False, "error": "Не удалось выполнить запрос после обновления токена.", "response": "" }
 
+    async def stream_chat_completion(self, system_message: str, user_message: str) -> AsyncIterator[str]:
+        """Потоковый ответ GigaChat: фрагменты текста по мере генерации (ошибки - исключения)."""
+        for attempt in range(2):
+            access_token = await self._ensure_token()
+
+            messages = [{"role": "system", "content": system_message}]
+            messages.extend(self.conversation_history)
+            messages.append({"role": "user", "content": user_message})
+            url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+            payload = {"model": "GigaChat", "messages": messages, "temperature": 1, "top_p": 0.1, "n": 1, "stream": True, "max_tokens": 512, "repetition_penalty": 1, "update_interval": 0}
+            headers = {'Content-Type': 'application/json', 'Accept': 'text/event-stream', 'Authorization': f'Bearer {access_token}'}
+
+            session = get_http_session()
+            async with session.post(url, headers=headers, json=payload, ssl=False) as response:
+                if response.status == 200:
+                    parts = []
+                    async for delta in iter_completion_deltas(response):
+                        parts.append(delta)
+                        yield delta
+                    if not parts:
+                        raise Exception("Empty or invalid response structure.")
+                    self.conversation_history.append({"role": "user", "content": user_message})
+                    self.conversation_history.append({"role": "assistant", "content": "".join(parts)})
+                    logger.info(f"✅ Получен потоковый ответ от GigaChat ({len(parts)} фрагментов)")
+                    return
+                elif response.status == 401 and attempt == 0:
+                    logger.warning("⚠️ Токен для chat/completions истек. Обновляю и пробую снова...")
+                    token_manager.invalidate(self.auth_token, self.scope, access_token)
+                    continue
+                else:
+                    error_text = await response.text()
+                    logger.error(f"❌ Ошибка API GigaChat: {response.status} - {error_text}")
+                    raise Exception(f"API Error: {response.status} - {error_text}")
+
+        raise Exception("Не удалось выполнить запрос после обновления токена.")
+
     def clear_history(self):
         self.conversation_history = []
         logger.info("🗑️ История диалога очищена")
@@ -103,32 +121,29 @@ class GigaChatAPI:
     async def get_embedding(self, text: str, model: str = 'Embeddings') -> list[float] | None:
         """Получение эмбеддинга с авто-обновлением токена."""
         for attempt in range(2):
-            if not self.access_token:
-                logger.error("Токен доступа для эмбеддингов отсутствует, попытка обновления...")
-                if not self.auth_token or not await self.get_token(self.auth_token):
-                    raise Exception("Не удалось обновить токен, основной токен авторизации отсутствует.")
+            access_token = await self._ensure_token()
 
             url = "https://gigachat.devices.sberbank.ru/api/v1/embeddings"
             payload = {"model": model, "input": [text]}
-            headers = {'Content-Type': 'application/json', 'Accept': 'application/json', 'Authorization': f'Bearer {self.access_token}'}
+            headers = {'Content-Type': 'application/json', 'Accept': 'application/json', 'Authorization': f'Bearer {access_token}'}
 
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(url, headers=headers, json=payload, ssl=False) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            embedding = data.get('data', [{}])[0].get('embedding')
-                            if embedding:
-                                if attempt > 0: logger.info("✅ Повторный запрос на эмбеддинг успешен с новым токеном.")
-                                return embedding
-                            return None
-                        elif response.status == 401 and attempt == 0:
-                            logger.warning("⚠️ Токен для эмбеддингов истек. Обновляю и пробую снова...")
-                            self.access_token = None
-                            continue
-                        else:
-                            logger.error(f"❌ Ошибка API GigaChat (Embeddings): {response.status} - {await response.text()}")
-                            return None
+                session = get_http_session()
+                async with session.post(url, headers=headers, json=payload, ssl=False) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        embedding = data.get('data', [{}])[0].get('embedding')
+                        if embedding:
+                            if attempt > 0: logger.info("✅ Повторный запрос на эмбеддинг успешен с новым токеном.")
+                            return embedding
+                        return None
+                    elif response.status == 401 and attempt == 0:
+                        logger.warning("⚠️ Токен для эмбеддингов истек. Обновляю и пробую снова...")
+                        token_manager.invalidate(self.auth_token, self.scope, access_token)
+                        continue
+                    else:
+                        logger.error(f"❌ Ошибка API GigaChat (Embeddings): {response.status} - {await response.text()}")
+                        return None
             except Exception as e:
                 logger.error(f"❌ Непредвиденная ошибка при получении эмбеддинга: {str(e)}")
                 return None
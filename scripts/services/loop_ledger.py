@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from scripts.services import storage
+
+logger = logging.getLogger(__name__)
+
+# Журнал выполненных элементов цикла: возобновленный запуск того же цикла пропускает их.
+# Записи копятся в памяти и пишутся в Postgres пачками по LOOP_LEDGER_FLUSH_SIZE.
+# Журнал успешно завершенного цикла удаляется; журналы так и не возобновленных запусков
+# удаляются при старте сервиса, если не обновлялись дольше LOOP_LEDGER_TTL_HOURS.
+LOOP_LEDGER_FLUSH_SIZE = int(os.getenv("LOOP_LEDGER_FLUSH_SIZE", "200"))
+LOOP_LEDGER_TTL_HOURS = float(os.getenv("LOOP_LEDGER_TTL_HOURS", "168"))
+
+LOOP_LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflow_service.loop_item_ledger (
+    ledger_key TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    item_index INTEGER NOT NULL,
+    result JSONB,
+    completed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (ledger_key, item_key)
+);
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def content_key(value: Any) -> str:
+    """Ключ элемента по содержимому: не зависит от позиции элемента во входном массиве."""
+    return hashlib.sha256(_dumps(value).encode('utf-8')).hexdigest()
+
+
+async def init_loop_ledger_schema():
+    """Создает таблицу журнала элементов цикла, если ее еще нет."""
+    if not storage.db_pool:
+        return
+    async with storage.db_pool.acquire() as conn:
+        await conn.execute(LOOP_LEDGER_SCHEMA)
+    logger.info("✅ Таблица журнала элементов цикла готова.")
+    purged = await purge_expired_ledgers()
+    if purged:
+        logger.info(f"🧹 Удалено устаревших записей журнала цикла: {purged}")
+
+
+async def purge_expired_ledgers(ttl_hours: float = LOOP_LEDGER_TTL_HOURS) -> int:
+    """Удаляет журналы, которые не обновлялись дольше ttl_hours (запуск так и не был возобновлен)."""
+    async with storage.db_pool.acquire() as conn:
+        status = await conn.execute(
+            """
+            DELETE FROM workflow_service.loop_item_ledger
+            WHERE ledger_key IN (
+                SELECT ledger_key FROM workflow_service.loop_item_ledger
+                GROUP BY ledger_key
+                HAVING MAX(completed_at) < NOW() - make_interval(secs => $1)
+            )
+            """,
+            ttl_hours * 3600
+        )
+    return int(status.split()[-1])
+
+
+async def load_completed_items(ledger_key: str) -> Dict[str, Any]:
+    """Возвращает выполненные элементы журнала: item_key -> сохраненный результат."""
+    async with storage.db_pool.acquire() as conn:
+        records = await conn.fetch(
+            "SELECT item_key, result FROM workflow_service.loop_item_ledger WHERE ledger_key = $1",
+            ledger_key
+        )
+    return {r['item_key']: json.loads(r['result']) if r['result'] else None for r in records}
+
+
+async def record_completed_items(ledger_key: str, entries: List[Tuple[str, int, Any]]):
+    """Пакетно записывает выполненные элементы: (item_key, индекс, компактный результат)."""
+    if not entries:
+        return
+    async with storage.db_pool.acquire() as conn:
+        await conn.executemany(
+            """
+            INSERT INTO workflow_service.loop_item_ledger (ledger_key, item_key, item_index, result)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (ledger_key, item_key) DO UPDATE SET
+                item_index = EXCLUDED.item_index,
+                result = EXCLUDED.result,
+                completed_at = NOW();
+            """,
+            [(ledger_key, item_key, index, _dumps(result)) for item_key, index, result in entries]
+        )
+
+
+async def clear_loop_ledger(ledger_key: str) -> int:
+    """Удаляет журнал цикла (цикл завершился и возобновлять его больше не нужно)."""
+    async with storage.db_pool.acquire() as conn:
+        status = await conn.execute("DELETE FROM workflow_service.loop_item_ledger WHERE ledger_key = $1", ledger_key)
+    return int(status.split()[-1])
+
+
+class LoopLedger:
+    """
+    Журнал одного цикла: загружает выполненные элементы при старте и буферизует новые.
+    Ошибки БД не роняют цикл - журнал просто перестает писаться.
+    """
+
+    def __init__(self, ledger_key: str, key_by: str = 'hash', flush_size: int = LOOP_LEDGER_FLUSH_SIZE):
+        if key_by not in ('hash', 'index'):
+            raise Exception(f"Loop node: unknown ledgerKeyBy '{key_by}'. Available: hash, index")
+        self.ledger_key = ledger_key
+        self.key_by = key_by
+        self.flush_size = flush_size
+        self.completed: Dict[str, Any] = {}
+        self.pending: List[Tuple[str, int, Any]] = []
+        self.skipped = 0
+        self.recorded = 0
+        self.enabled = True
+
+    def item_key(self, item: Any, index: int) -> str:
+        return str(index) if self.key_by == 'index' else content_key(item)
+
+    async def load(self):
+        try:
+            self.completed = await load_completed_items(self.ledger_key)
+        except Exception as e:
+            logger.warning(f"⚠️ Журнал цикла {self.ledger_key} недоступен, элементы будут выполнены заново: {e}")
+            self.enabled = False
+            return
+        if self.completed:
+            logger.info(f"📒 Журнал цикла {self.ledger_key}: уже выполнено элементов {len(self.completed)}")
+
+    def lookup(self, item_key: str) -> Tuple[bool, Optional[Any]]:
+        """Возвращает (найден ли элемент в журнале, сохраненный результат)."""
+        if item_key in self.completed:
+            self.skipped += 1
+            return True, self.completed[item_key]
+        return False, None
+
+    async def record(self, item_key: str, index: int, result: Any):
+        if not self.enabled:
+            return
+        self.pending.append((item_key, index, result))
+        self.recorded += 1
+        if len(self.pending) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self.enabled or not self.pending:
+            return
+        entries, self.pending = self.pending, []
+        try:
+            await record_completed_items(self.ledger_key, entries)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось записать журнал цикла {self.ledger_key}: {e}")
+            self.enabled = False
+
+    async def clear(self):
+        """Удаляет журнал после успешного завершения цикла; несохраненный буфер отбрасывается."""
+        self.pending = []
+        if not self.completed and not self.recorded:
+            return
+        try:
+            await clear_loop_ledger(self.ledger_key)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось удалить журнал цикла {self.ledger_key}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "key": self.ledger_key,
+            "key_by": self.key_by,
+            "skipped": self.skipped,
+            "recorded": self.recorded,
+            "enabled": self.enabled,
+        }
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import uuid
+from typing import Dict, Any, Optional
+
+from scripts.services import storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RUN_QUEUE = "default"
+
+# Аренда запуска: воркер продлевает ее, пока выполняет запуск. Запуск с истекшей арендой
+# (воркер упал или завис) снова забирается из очереди любым воркером.
+RUN_LEASE_SECONDS = int(os.getenv("RUN_LEASE_SECONDS", "60"))
+# После стольких истекших аренд запуск считается "ядовитым" и помечается failed, а не выполняется снова
+RUN_MAX_ATTEMPTS = int(os.getenv("RUN_MAX_ATTEMPTS", "3"))
+
+RUN_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workflow_service.workflow_runs (
+    id TEXT PRIMARY KEY,
+    workflow_id TEXT NOT NULL,
+    start_node_id TEXT,
+    input_data JSONB,
+    queue_name TEXT NOT NULL DEFAULT 'default',
+    status TEXT NOT NULL DEFAULT 'pending',
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS workflow_runs_pending_idx
+    ON workflow_service.workflow_runs (queue_name, created_at)
+    WHERE status = 'pending';
+ALTER TABLE workflow_service.workflow_runs ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS workflow_runs_lease_idx
+    ON workflow_service.workflow_runs (queue_name, lease_until)
+    WHERE status = 'processing';
+"""
+
+
+def _get_pool():
+    if not storage.db_pool:
+        raise Exception("Пул соединений с БД не инициализирован.")
+    return storage.db_pool
+
+
+async def init_run_queue_schema():
+    """Создает таблицу очереди запусков, если ее еще нет."""
+    async with _get_pool().acquire() as conn:
+        await conn.execute(RUN_QUEUE_SCHEMA)
+    logger.info("✅ Таблица очереди запусков workflow готова.")
+
+
+async def enqueue_workflow_run(
+    workflow_id: str,
+    input_data: Optional[Dict[str, Any]] = None,
+    start_node_id: Optional[str] = None,
+    queue_name: str = DEFAULT_RUN_QUEUE
+) -> str:
+    """Ставит запуск workflow в очередь и возвращает его run_id."""
+    run_id = str(uuid.uuid4())
+    async with _get_pool().acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO workflow_service.workflow_runs (id, workflow_id, start_node_id, input_data, queue_name, status)
+            VALUES ($1, $2, $3, $4, $5, 'pending')
+            """,
+            run_id, workflow_id, start_node_id, json.dumps(input_data or {}, ensure_ascii=False, default=str), queue_name
+        )
+    logger.info(f"📥 Запуск {run_id} workflow '{workflow_id}' поставлен в очередь '{queue_name}'")
+    return run_id
+
+
+async def claim_next_run(queue_name: str, worker_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Забирает самый старый ожидающий запуск или запуск с истекшей арендой (FOR UPDATE SKIP LOCKED)
+    и берет его в аренду на RUN_LEASE_SECONDS.
+    """
+    async with _get_pool().acquire() as conn:
+        async with conn.transaction():
+            while True:
+                record = await conn.fetchrow(
+                    """
+                    SELECT id, workflow_id, start_node_id, input_data, status, attempts, worker_id
+                    FROM workflow_service.workflow_runs
+                    WHERE queue_name = $1
+                      AND (status = 'pending' OR (status = 'processing' AND lease_until < NOW()))
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                    """,
+                    queue_name
+                )
+                if not record:
+                    return None
+                if record['status'] == 'pending':
+                    break
+                if record['attempts'] < RUN_MAX_ATTEMPTS:
+                    logger.warning(f"♻️ Аренда запуска {record['id']} воркера {record['worker_id']} истекла, запуск забирает {worker_id}")
+                    break
+                await conn.execute(
+                    """
+                    UPDATE workflow_service.workflow_runs
+                    SET status = 'failed', error = $2, finished_at = NOW(), lease_until = NULL
+                    WHERE id = $1
+                    """,
+                    record['id'], f"Run lease expired {record['attempts']} times, giving up"
+                )
+                logger.error(f"❌ Запуск {record['id']} помечен failed: аренда истекла {record['attempts']} раз")
+            await conn.execute(
+                """
+                UPDATE workflow_service.workflow_runs
+                SET status = 'processing', started_at = NOW(), attempts = attempts + 1, worker_id = $2,
+                    lease_until = NOW() + make_interval(secs => $3)
+                WHERE id = $1
+                """,
+                record['id'], worker_id, float(RUN_LEASE_SECONDS)
+            )
+    run = {key: record[key] for key in ('id', 'workflow_id', 'start_node_id', 'input_data')}
+    run['input_data'] = json.loads(run['input_data']) if run.get('input_data') else {}
+    return run
+
+
+async def extend_run_lease(run_id: str, worker_id: str) -> bool:
+    """Продлевает аренду запуска. False - запуск больше не принадлежит этому воркеру."""
+    async with _get_pool().acquire() as conn:
+        status = await conn.execute(
+            """
+            UPDATE workflow_service.workflow_runs
+            SET lease_until = NOW() + make_interval(secs => $3)
+            WHERE id = $1 AND worker_id = $2 AND status = 'processing'
+            """,
+            run_id, worker_id, float(RUN_LEASE_SECONDS)
+        )
+    return int(status.split()[-1]) > 0
+
+
+async def finish_workflow_run(run_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None, worker_id: Optional[str] = None):
+    """
+    Сохраняет итог запуска: status = 'completed' или 'failed'.
+    С worker_id итог пишется, только если запуск все еще принадлежит этому воркеру.
+    """
+    async with _get_pool().acquire() as conn:
+        await conn.execute(
+            """
+            UPDATE workflow_service.workflow_runs
+            SET status = $2, result = $3, error = $4, finished_at = NOW(), lease_until = NULL
+            WHERE id = $1 AND ($5::TEXT IS NULL OR worker_id = $5)
+            """,
+            run_id, status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None, error, worker_id
+        )
+
+
+async def get_workflow_run(run_id: str) -> Optional[Dict[str, Any]]:
+    """Возвращает запись запуска по ID."""
+    async with _get_pool().acquire() as conn:
+        record = await conn.fetchrow("SELECT * FROM workflow_service.workflow_runs WHERE id = $1", run_id)
+    if not record:
+        return None
+    run = dict(record)
+    for field in ('input_data', 'result'):
+        if run.get(field):
+            run[field] = json.loads(run[field])
+    return run
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит параллельных вызовов (AIMD).
+    Пока задержка близка к базовой и ошибок нет, лимит растет: в медленном старте +1 за каждый
+    успешный вызов (за окно из limit вызовов лимит удваивается), после первого снижения +1/limit
+    за вызов, то есть +1 за окно. При ошибке или росте задержки выше latency_tolerance * базовая
+    лимит уменьшается в backoff раз, но не чаще раза за окно.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        initial_limit: Optional[int] = None,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.5,
+    ):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit or self.min_limit)))
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self.slow_start = True
+        self.baseline_latency: Optional[float] = None
+        self.smoothed_latency: Optional[float] = None
+        self.last_decrease = 0.0
+
+        self.peak_limit = self.limit
+        self.decreases = 0
+        self.calls = 0
+        self.errors = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def concurrency(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, success: bool):
+        self._update(latency, success)
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _update(self, latency: float, success: bool):
+        self.calls += 1
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        else:
+            # Базовая задержка медленно подтягивается, если сервис стабильно стал медленнее
+            self.baseline_latency += (latency - self.baseline_latency) * 0.01
+        self.smoothed_latency = latency if self.smoothed_latency is None else self.smoothed_latency * 0.8 + latency * 0.2
+
+        overloaded = latency > self.baseline_latency * self.latency_tolerance
+        if not success:
+            self.errors += 1
+
+        if not success or overloaded:
+            now = time.monotonic()
+            if now - self.last_decrease >= (self.smoothed_latency or 0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self.last_decrease = now
+                self.slow_start = False
+                self.decreases += 1
+                logger.info(f"📉 Лимит параллелизма снижен до {self.concurrency} ({'ошибка' if not success else f'задержка {latency:.2f} с'})")
+            return
+
+        if self.slow_start:
+            self.limit = min(float(self.max_limit), self.limit + 1)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self.peak_limit = max(self.peak_limit, self.limit)
+
+    async def run(self, awaitable: Awaitable[Any], is_success: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Выполняет awaitable в слоте лимитера; успех определяется is_success(result) или отсутствием исключения."""
+        await self.acquire()
+        started_at = time.monotonic()
+        success = False
+        try:
+            result = await awaitable
+            success = bool(is_success(result)) if is_success else True
+            return result
+        finally:
+            await self.release(time.monotonic() - started_at, success)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние для meta ноды."""
+        return {
+            "concurrency": self.concurrency,
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "peak": int(self.peak_limit),
+            "decreases": self.decreases,
+            "calls": self.calls,
+            "errors": self.errors,
+            "baseline_latency_ms": int(self.baseline_latency * 1000) if self.baseline_latency is not None else None,
+        }
+
+
+def limiter_from_config(config: Dict[str, Any], default_max: int, adaptive_default: bool = False) -> AdaptiveLimiter:
+    """
+    Создает лимитер из конфига ноды: maxConcurrent, minConcurrent, adaptiveConcurrency.
+    Без адаптивности лимит фиксирован на maxConcurrent.
+    """
+    max_limit = int(config.get('maxConcurrent') or default_max)
+    adaptive = config.get('adaptiveConcurrency')
+    if adaptive is None:
+        adaptive = adaptive_default
+    if not adaptive:
+        return AdaptiveLimiter(min_limit=max_limit, max_limit=max_limit)
+    return AdaptiveLimiter(
+        min_limit=int(config.get('minConcurrent') or 1),
+        max_limit=max_limit,
+        latency_tolerance=float(config.get('latencyTolerance') or 2.0),
+    )
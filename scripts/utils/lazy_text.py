@@ -0,0 +1,96 @@
+from typing import Dict, Any, Callable
+
+# Поля, которые дорого вычислять заранее (например, отформатированный JSON в text), строятся по обращению.
+# Сериализаторы, читающие словарь в обход его методов (pydantic v2), должны сначала вызвать materialize_lazy.
+
+
+class LazyTextDict(dict):
+    """
+    Словарь output, в котором поле 'text' вычисляется при первом обращении
+    (по ключу, при обходе или сериализации), а не при выполнении ноды.
+    """
+
+    def __init__(self, data: Dict[str, Any], text_factory: Callable[[], str]):
+        super().__init__(data)
+        self._text_factory = text_factory
+
+    def materialize(self):
+        if self._text_factory is not None:
+            factory, self._text_factory = self._text_factory, None
+            dict.__setitem__(self, 'text', factory())
+
+    def __getitem__(self, key):
+        if key == 'text':
+            self.materialize()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key == 'text':
+            self.materialize()
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        return (key == 'text' and self._text_factory is not None) or super().__contains__(key)
+
+    def __setitem__(self, key, value):
+        if key == 'text':
+            self._text_factory = None
+        super().__setitem__(key, value)
+
+    def __iter__(self):
+        self.materialize()
+        return super().__iter__()
+
+    def __len__(self):
+        self.materialize()
+        return super().__len__()
+
+    def keys(self):
+        self.materialize()
+        return super().keys()
+
+    def items(self):
+        self.materialize()
+        return super().items()
+
+    def values(self):
+        self.materialize()
+        return super().values()
+
+    def copy(self):
+        self.materialize()
+        return dict(super().items())
+
+    def __eq__(self, other):
+        self.materialize()
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        self.materialize()
+        return super().__repr__()
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+
+def materialize_lazy(value: Any, seen: set = None) -> Any:
+    """Вычисляет все отложенные поля в дереве результатов (перед сериализацией в ответ API)."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return value
+    if isinstance(value, dict):
+        seen.add(id(value))
+        if isinstance(value, LazyTextDict):
+            value.materialize()
+        for item in dict.values(value):
+            if isinstance(item, (dict, list)):
+                materialize_lazy(item, seen)
+    elif isinstance(value, list):
+        seen.add(id(value))
+        for item in value:
+            if isinstance(item, (dict, list)):
+                materialize_lazy(item, seen)
+    return value
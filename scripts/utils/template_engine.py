@@ -1,75 +1,312 @@
 import re
 import json
 import logging
-from typing import Dict, Any
+import os
+from functools import lru_cache
+from typing import Dict, Any, Iterable, List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
-def replace_templates(template_str: str, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> str:
-    """Универсальная замена шаблонов вида {{Node Label.path.to.value}} или {{node-id.path.to.value}}"""
-    
-    def get_nested_value(obj: Dict[str, Any], path: str) -> Any:
-        """Получает значение по пути типа 'output.text' или 'json.result[0].text'"""
-        if not path:
-            return obj
-            
-        keys = [key for key in re.split(r'[.\[\]]', path) if key]
-        
-        current = obj
-        for key in keys:
-            if isinstance(current, dict) and key in current:
-                current = current[key]
-            elif isinstance(current, list) and key.isdigit():
-                index = int(key)
-                if 0 <= index < len(current):
-                    current = current[index]
-                else:
-                    return None
+TEMPLATE_PATTERN = re.compile(r"\{\{\s*(.+?)\s*\}\}")
+PATH_SPLIT_PATTERN = re.compile(r'[.\[\]]')
+
+# Сколько разобранных шаблонов держать в памяти (ключ - текст шаблона)
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", "2048"))
+
+
+def get_nested_value(obj: Any, keys: Tuple[str, ...]) -> Any:
+    """Получает значение по заранее разобранному пути, например ('json', 'result', '0', 'text')"""
+    current = obj
+    for key in keys:
+        if isinstance(current, dict) and key in current:
+            current = current[key]
+        elif isinstance(current, list) and key.isdigit():
+            index = int(key)
+            if 0 <= index < len(current):
+                current = current[index]
             else:
                 return None
-        return current
+        else:
+            return None
+    return current
 
-    pattern = r"\{\{\s*(.+?)\s*\}\}"
 
-    def replacer(match):
-        path = match.group(1).strip()
+class Placeholder:
+    """Разобранная подстановка {{Node Label.path.to.value}}: источник и путь внутри него."""
+    __slots__ = ('expression', 'path', 'node_identifier', 'keys')
 
-        # 1. Определяем источник данных
-        parts = path.split('.', 1)
-        node_identifier = parts[0]
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.path = expression.strip()
+        parts = self.path.split('.', 1)
+        self.node_identifier = parts[0]
         remaining_path = parts[1] if len(parts) > 1 else ''
+        self.keys: Tuple[str, ...] = tuple(key for key in PATH_SPLIT_PATTERN.split(remaining_path) if key)
 
-        data_source = None
-        
-        # Особый случай для {{input.field}}
-        if node_identifier == 'input':
+    def resolve(self, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Возвращает (нода найдена, значение по пути) без преобразования в строку."""
+        # 1. Определяем источник данных
+        if self.node_identifier == 'input':
             data_source = input_data
-            path_in_source = remaining_path
         else:
             # Ищем по лейблу или ID
-            node_id = label_to_id_map.get(node_identifier, node_identifier)
-            
-            if node_id in all_results:
-                data_source = all_results[node_id]
-                path_in_source = remaining_path
-            else:
-                logger.warning(f"⚠️ Шаблон: нода с лейблом или ID '{node_identifier}' (resolved to '{node_id}') не найдена в результатах.")
-                return f"{{{{ERROR: Node '{node_identifier}' not found}}}}"
+            node_id = label_to_id_map.get(self.node_identifier, self.node_identifier)
+            if node_id not in all_results:
+                logger.warning(f"⚠️ Шаблон: нода с лейблом или ID '{self.node_identifier}' (resolved to '{node_id}') не найдена в результатах.")
+                return False, None
+            data_source = all_results[node_id]
 
         # 2. Извлекаем значение
-        value = get_nested_value(data_source, path_in_source)
+        return True, get_nested_value(data_source, self.keys)
+
+    def render(self, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> str:
+        found, value = self.resolve(input_data, label_to_id_map, all_results)
+        if not found:
+            return f"{{{{ERROR: Node '{self.node_identifier}' not found}}}}"
 
         # 3. Преобразуем в строку и возвращаем
         if value is None:
-            logger.warning(f"⚠️ Шаблон: путь '{path}' не найден. Замена на пустую строку.")
+            logger.warning(f"⚠️ Шаблон: путь '{self.path}' не найден. Замена на пустую строку.")
             return ""
-        
+
         if isinstance(value, (dict, list)):
             final_str = json.dumps(value, ensure_ascii=False)
         else:
             final_str = str(value)
 
-        logger.info(f"🔄 Замена шаблона: {{{{{match.group(1)}}}}} -> {final_str[:200]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"🔄 Замена шаблона: {{{{{self.expression}}}}} -> {final_str[:200]}...")
         return final_str
 
-    return re.sub(pattern, replacer, template_str)
+
+class CompiledTemplate:
+    """Шаблон, разобранный один раз на литеральные сегменты и подстановки."""
+    __slots__ = ('source', 'segments', 'placeholders')
+
+    def __init__(self, source: str):
+        self.source = source
+        self.segments: List[Union[str, Placeholder]] = []
+        position = 0
+        for match in TEMPLATE_PATTERN.finditer(source):
+            if match.start() > position:
+                self.segments.append(source[position:match.start()])
+            self.segments.append(Placeholder(match.group(1)))
+            position = match.end()
+        if position < len(source):
+            self.segments.append(source[position:])
+        self.placeholders: List[Placeholder] = [s for s in self.segments if isinstance(s, Placeholder)]
+
+    def render(self, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> str:
+        if not self.placeholders:
+            return self.source
+        return ''.join(
+            segment if segment.__class__ is str else segment.render(input_data, label_to_id_map, all_results)
+            for segment in self.segments
+        )
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template_str: str) -> CompiledTemplate:
+    """Разбирает шаблон; результат кэшируется по тексту шаблона (LRU)."""
+    return CompiledTemplate(template_str)
+
+
+def find_template_references(template_str: str) -> List[str]:
+    """Возвращает лейблы/ID нод, на которые ссылаются шаблоны строки ({{input...}} не учитывается)."""
+    if not isinstance(template_str, str) or '{{' not in template_str:
+        return []
+    references = []
+    for placeholder in compile_template(template_str).placeholders:
+        if placeholder.node_identifier != 'input' and placeholder.node_identifier not in references:
+            references.append(placeholder.node_identifier)
+    return references
+
+
+def replace_templates(template_str: str, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> str:
+    """Универсальная замена шаблонов вида {{Node Label.path.to.value}} или {{node-id.path.to.value}}"""
+    # Быстрый путь: в строке нет подстановок
+    if '{{' not in template_str:
+        return template_str
+    return compile_template(template_str).render(input_data, label_to_id_map, all_results)
+
+
+# --- Структурный рендер JSON-шаблонов ---
+#
+# Шаблон тела запроса ('{"items": {{Node.json.result}}, "name": "{{input.name}}"}') разбирается один раз:
+# подстановки заменяются маркерами, скелет парсится json.loads и кэшируется. Подстановка, занимающая
+# значение целиком (без кавычек), получает Python-объект напрямую, без json.dumps/json.loads.
+# Подстановки внутри строк, как и раньше, подставляются текстом. Неразрешенная подстановка без кавычек -
+# ошибка (UnresolvedPlaceholderError), а не null.
+
+_SENTINEL_START = '\ue000'
+_SENTINEL_END = '\ue001'
+_SENTINEL_PATTERN = re.compile(f"{_SENTINEL_START}(\\d+){_SENTINEL_END}")
+
+
+class UnresolvedPlaceholderError(ValueError):
+    """Подстановка без кавычек не разрешилась: нода не найдена или путь пуст.
+
+    Наследует ValueError, поэтому вызывающий код переходит на строковый рендер, который,
+    как и раньше, дает невалидный JSON и ошибку ноды вместо молчаливого null.
+    """
+
+
+class StructuredTemplate:
+    """JSON-шаблон, разобранный в дерево: константы, контейнеры, текстовые и нативные подстановки."""
+    __slots__ = ('source', 'tree')
+
+    def __init__(self, source: str):
+        self.source = source
+        placeholders: List[Placeholder] = []
+        native: set = set()
+        skeleton_parts: List[str] = []
+        position = 0
+        in_string = False
+        escaped = False
+        for match in TEMPLATE_PATTERN.finditer(source):
+            # Определяем, находится ли подстановка внутри JSON-строки
+            for char in source[position:match.start()]:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = in_string
+                elif char == '"':
+                    in_string = not in_string
+            skeleton_parts.append(source[position:match.start()])
+            marker = f"{_SENTINEL_START}{len(placeholders)}{_SENTINEL_END}"
+            if in_string:
+                skeleton_parts.append(marker)
+            else:
+                native.add(len(placeholders))
+                skeleton_parts.append(f'"{marker}"')
+            placeholders.append(Placeholder(match.group(1)))
+            position = match.end()
+        skeleton_parts.append(source[position:])
+
+        # Не JSON (например, подстановка посреди числа) - вызывающий код использует строковый рендер
+        skeleton = json.loads(''.join(skeleton_parts))
+        self.tree = self._build(skeleton, placeholders, native)
+
+    def _build(self, value: Any, placeholders: List[Placeholder], native: set) -> Tuple:
+        if isinstance(value, dict):
+            return ('dict', [(self._build(k, placeholders, native), self._build(v, placeholders, native)) for k, v in value.items()])
+        if isinstance(value, list):
+            return ('list', [self._build(item, placeholders, native) for item in value])
+        if isinstance(value, str) and _SENTINEL_START in value:
+            segments: List[Union[str, Placeholder]] = []
+            position = 0
+            for match in _SENTINEL_PATTERN.finditer(value):
+                if match.start() > position:
+                    segments.append(value[position:match.start()])
+                segments.append(int(match.group(1)))
+                position = match.end()
+            if position < len(value):
+                segments.append(value[position:])
+            if len(segments) == 1 and segments[0] in native:
+                return ('native', placeholders[segments[0]])
+            if any(isinstance(segment, int) and segment in native for segment in segments):
+                raise ValueError("Подстановка без кавычек должна занимать значение целиком")
+            return ('text', [placeholders[segment] if isinstance(segment, int) else segment for segment in segments])
+        return ('const', value)
+
+    def render(self, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Any:
+        return _render_tree(self.tree, input_data, label_to_id_map, all_results)
+
+    def render_batch(self, contexts: Iterable[Dict[str, Any]], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> List[Any]:
+        """
+        Рендерит шаблон для каждого контекста ({{input...}}). Подстановки из результатов нод
+        одинаковы для всех контекстов, поэтому вычисляются один раз.
+        """
+        bound_tree = _bind_static(self.tree, label_to_id_map, all_results)
+        return [_render_tree(bound_tree, context, label_to_id_map, all_results) for context in contexts]
+
+
+def _render_tree(tree: Tuple, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Any:
+    kind, payload = tree
+    if kind == 'const':
+        return payload
+    if kind == 'dict':
+        return {
+            _render_tree(k, input_data, label_to_id_map, all_results): _render_tree(v, input_data, label_to_id_map, all_results)
+            for k, v in payload
+        }
+    if kind == 'list':
+        return [_render_tree(item, input_data, label_to_id_map, all_results) for item in payload]
+    if kind == 'text':
+        return ''.join(
+            segment if segment.__class__ is str else segment.render(input_data, label_to_id_map, all_results)
+            for segment in payload
+        )
+    # 'native': значение подставляется как есть
+    return _resolve_native(payload, input_data, label_to_id_map, all_results)
+
+
+def _resolve_native(placeholder: Placeholder, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Any:
+    found, value = placeholder.resolve(input_data, label_to_id_map, all_results)
+    if not found:
+        raise UnresolvedPlaceholderError(f"Node '{placeholder.node_identifier}' not found for placeholder '{{{{{placeholder.expression}}}}}'")
+    if value is None:
+        raise UnresolvedPlaceholderError(f"Path '{placeholder.path}' not found for placeholder '{{{{{placeholder.expression}}}}}'")
+    if isinstance(value, str):
+        # Строка без кавычек раньше вставлялась в JSON как есть: "5" становилось числом 5
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _bind_static(tree: Tuple, label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Tuple:
+    """Заменяет подстановки, не зависящие от {{input...}}, их значениями."""
+    kind, payload = tree
+    if kind == 'dict':
+        return ('dict', [(_bind_static(k, label_to_id_map, all_results), _bind_static(v, label_to_id_map, all_results)) for k, v in payload])
+    if kind == 'list':
+        return ('list', [_bind_static(item, label_to_id_map, all_results) for item in payload])
+    if kind == 'text':
+        segments: List[Union[str, Placeholder]] = []
+        for segment in payload:
+            if segment.__class__ is not str and segment.node_identifier != 'input':
+                segment = segment.render({}, label_to_id_map, all_results)
+            if segment.__class__ is str and segments and segments[-1].__class__ is str:
+                segments[-1] += segment
+            else:
+                segments.append(segment)
+        if all(segment.__class__ is str for segment in segments):
+            return ('const', ''.join(segments))
+        return ('text', segments)
+    if kind == 'native' and payload.node_identifier != 'input':
+        return ('const', _resolve_native(payload, {}, label_to_id_map, all_results))
+    return tree
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_structured_template(template_str: str) -> Optional[StructuredTemplate]:
+    """Разбирает JSON-шаблон; None, если это не JSON. Результат (и неудача) кэшируется по тексту шаблона."""
+    try:
+        return StructuredTemplate(template_str)
+    except ValueError:
+        return None
+
+
+def render_structured(template_str: str, input_data: Dict[str, Any], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> Any:
+    """
+    Рендерит JSON-шаблон сразу в Python-объект.
+    Выбрасывает ValueError, если шаблон не является JSON или подстановка без кавычек
+    не разрешилась (UnresolvedPlaceholderError) - тогда используйте replace_templates.
+    """
+    template = compile_structured_template(template_str)
+    if template is None:
+        raise ValueError("Template is not a JSON document")
+    return template.render(input_data, label_to_id_map, all_results)
+
+
+def render_structured_batch(template_str: str, contexts: Iterable[Dict[str, Any]], label_to_id_map: Dict[str, str], all_results: Dict[str, Any]) -> List[Any]:
+    """
+    Рендерит один JSON-шаблон для последовательности контекстов (например, элементов цикла).
+    Выбрасывает ValueError, если шаблон не является JSON или подстановка без кавычек не разрешилась.
+    """
+    template = compile_structured_template(template_str)
+    if template is None:
+        raise ValueError("Template is not a JSON document")
+    return template.render_batch(contexts, label_to_id_map, all_results)